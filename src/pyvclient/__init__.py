@@ -1,18 +1,30 @@
 # -*- coding: utf-8 -*-
-try:
-    from importlib.metadata import version, PackageNotFoundError
+
+
+def __getattr__(name):
+    # resolved on first access, importlib.metadata is slow to import
+    if name != '__version__':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global __version__
+    __version__ = _get_version()
+    return __version__
+
+
+def _get_version():
     try:
-        # Change here if project is renamed and does not equal the package name
-        __version__ = version(__name__)
-    except PackageNotFoundError:
-        __version__ = 'unknown'
-except ImportError:
-    # Python < 3.8 fallback
-    try:
-        from pkg_resources import get_distribution, DistributionNotFound
+        from importlib.metadata import version, PackageNotFoundError
         try:
-            __version__ = get_distribution(__name__).version
-        except DistributionNotFound:
-            __version__ = 'unknown'
+            # Change here if project is renamed and does not equal the package name
+            return version(__name__)
+        except PackageNotFoundError:
+            return 'unknown'
     except ImportError:
-        __version__ = 'unknown'
+        # Python < 3.8 fallback
+        try:
+            from pkg_resources import get_distribution, DistributionNotFound
+            try:
+                return get_distribution(__name__).version
+            except DistributionNotFound:
+                return 'unknown'
+        except ImportError:
+            return 'unknown'
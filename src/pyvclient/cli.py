@@ -1,43 +1,234 @@
+import atexit
+import logging
 import os
+import signal
+import sys
+from functools import partial
 from signal import pause
 
 import click
-import yaml
-from pyvclient.pyvclient import PyVClient
 from pyvclient.logging import setup_logging
+from pyvclient.utils.scheduler import Scheduler
+from pyvclient.vcomm.transport import create_transport
 from pyvclient.vcomm.vcomm import VComm
 
+logger = logging.getLogger(__name__)
+
 
 def get_config_form_file(filename='config.yaml'):
+    import yaml
+
     if not os.path.isfile(filename):
         raise ValueError('Config file %r does not exist!' % filename)
     with open(filename, 'r') as f:
         return yaml.safe_load(f.read())
 
 
+def get_endpoints(config, host=None, port=None):
+    """
+    Get the list of vcontrold endpoints from the VControld section.
+
+    VControld is either a single endpoint or a list of named endpoints.
+    Host and port given on the command line override the first endpoint.
+    """
+    endpoints = config['VControld']
+    if isinstance(endpoints, dict):
+        endpoints = [endpoints]
+    endpoints = [dict(endpoint) for endpoint in endpoints]
+    if len(endpoints) > 1:
+        for endpoint in endpoints:
+            if not endpoint.get('name'):
+                raise ValueError('Every VControld endpoint needs a name!')
+    endpoints[0]['host'] = host or endpoints[0]['host']
+    endpoints[0]['port'] = port or endpoints[0]['port']
+    return endpoints
+
+
+def create_vcomm(endpoint):
+    """
+    Create VComm for an endpoint, including its optional failover endpoints.
+    The endpoint's sessions are recorded to record, or answered from the
+    recording replay instead of vcontrold.
+    """
+    failover = endpoint.get('failover') or []
+    transport_factory = partial(
+        create_transport,
+        timeout=endpoint.get('timeout', 10),
+        connect_timeout=endpoint.get('connect_timeout'),
+        nodelay=endpoint.get('tcp_nodelay', True),
+        keepalive=endpoint.get('tcp_keepalive', True)
+    )
+    if endpoint.get('replay'):
+        from pyvclient.vcomm.recording import Replay
+        transport_factory = Replay(endpoint['replay'], endpoint.get('replay_speed', 1.0))
+    recorder = None
+    if endpoint.get('record'):
+        from pyvclient.vcomm.recording import SessionRecorder
+        recorder = SessionRecorder(endpoint['record'])
+        atexit.register(recorder.close)
+    return VComm(
+        host=endpoint['host'],
+        port=endpoint['port'],
+        endpoints=[(endpoint['host'], endpoint['port'])] +
+                  [(fallback['host'], fallback.get('port', 3002)) for fallback in failover],
+        probe_interval=endpoint.get('probe_interval', 30),
+        probe_command=endpoint.get('probe_command', 'version'),
+        max_error_rate=endpoint.get('max_error_rate', 0.3),
+        max_latency=endpoint.get('max_latency', 5.0),
+        transport_factory=transport_factory,
+        recorder=recorder
+    )
+
+
+def reload_config(filename, clients, host=None, port=None):
+    """
+    Apply the Properties of the config file to the running clients by name.
+    Other settings need a restart.
+    """
+    from yaml import YAMLError
+
+    logger.info(f"Reloading {filename}")
+    try:
+        config = get_config_form_file(filename)
+        endpoints = get_endpoints(config, host, port)
+    except (ValueError, KeyError, YAMLError) as e:
+        logger.error(f"Not reloading invalid config: {e}")
+        return
+
+    endpoints = {endpoint.get('name') if len(endpoints) > 1 else None: endpoint
+                 for endpoint in endpoints}
+    if set(endpoints) != set(clients):
+        logger.warning("Changed VControld endpoints take effect after a restart")
+    for name, pyvclient in clients.items():
+        endpoint = endpoints.get(name)
+        if endpoint is not None:
+            properties = endpoint.get('Properties') or config['Properties']
+            pyvclient.worker.submit(partial(pyvclient.reload, properties))
+
+
+class ConfigWatcher:
+    """Calls on_change when the modification time of a file changed."""
+
+    def __init__(self, filename, on_change):
+        self.filename = filename
+        self.on_change = on_change
+        self.mtime = self._mtime()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.filename).st_mtime
+        except OSError:
+            return None
+
+    def __call__(self):
+        mtime = self._mtime()
+        if mtime is not None and mtime != self.mtime:
+            self.mtime = mtime
+            self.on_change()
+
+
+def setup_profiling(settings, mqtt_client):
+    """
+    Profile on demand: SIGUSR1 dumps the thread stacks, SIGUSR2 starts and
+    stops profiling. With a topic, the commands of Profiler are accepted
+    over MQTT and the files written are published to <topic>/result.
+    """
+    from pyvclient.utils.profiling import Profiler
+
+    profiler = Profiler(settings['directory'], interval=settings.get('interval', 0.01))
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.threads())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: profiler.toggle())
+
+    topic = settings.get('topic')
+    if topic:
+        def handle_command(payload):
+            try:
+                path = profiler.handle_command(payload)
+            except OSError as e:
+                logger.error(f"Profiling command {payload!r} failed: {e}")
+                return
+            mqtt_client.publish_state(f"{topic}/result", path or '')
+
+        mqtt_client.subscribe_command(topic, handle_command)
+    return profiler
+
+
 @click.command()
 @click.option('--host', '-h', default=None,
               type=str, help=u'vcontrold host')
 @click.option('--port', '-p', default=None, type=int, help=u'vcontrold port')
 @click.option('--log', '-l', type=str, help=u'log config')
+@click.option('--log-queue/--no-log-queue', default=True, show_default=True,
+              help=u'write log records from a background thread')
+@click.option('--log-repeat-interval', default=60, type=int, show_default=True,
+              help=u'seconds a repeated warning or error is suppressed, 0 to log all')
+@click.option('--watch', '-w', default=0, type=int,
+              help=u'seconds between checks of the config file for changes, 0 to reload on SIGHUP only')
 @click.argument('config', type=click.Path(exists=True))
-def main(host, port, config, log):
-    setup_logging(log)
+def main(host, port, config, log, log_queue, log_repeat_interval, watch):
+    # the MQTT client and the device are only needed once the config is valid
+    from pyvclient.ha.ha_mqtt_discovery import create_mqtt_client
+    from pyvclient.pyvclient import PyVClient
+
+    setup_logging(log, use_queue=log_queue, repeat_interval=log_repeat_interval)
 
-    config = get_config_form_file(config)
+    filename = config
+    config = get_config_form_file(filename)
+    endpoints = get_endpoints(config, host, port)
 
-    vcomm_host = host or config['VControld']['host']
-    vcomm_port = port or config['VControld']['port']
-    
     print(f"Starting pyvclient:")
-    print(f"  vcontrold: {vcomm_host}:{vcomm_port}")
+    for endpoint in endpoints:
+        print(f"  vcontrold: {endpoint['host']}:{endpoint['port']}")
+        for fallback in endpoint.get('failover') or []:
+            print(f"    failover: {fallback['host']}:{fallback.get('port', 3002)}")
     print(f"  MQTT broker: {config['MQTT_SETTINGS']['MQTT_BROKER']}:{config['MQTT_SETTINGS']['MQTT_PORT']}")
-    
-    vcomm = VComm(host=vcomm_host, port=vcomm_port)
-    pyvclient = PyVClient(vcomm, config)
-    pyvclient.setup_timers()
 
-    pause()
+    mqtt_client = create_mqtt_client(config['MQTT_SETTINGS'])
+    scheduler = Scheduler()
+
+    sink = None
+    if config.get('Storage'):
+        from pyvclient.utils.sqlite_sink import SqliteSink
+        sink = SqliteSink(**config['Storage'])
+        atexit.register(sink.stop)
+
+    clients = {}
+    for endpoint in endpoints:
+        name = endpoint.get('name') if len(endpoints) > 1 else None
+        vcomm = create_vcomm(endpoint)
+        pyvclient = PyVClient(
+            vcomm, config,
+            name=name,
+            base_topic=endpoint.get('base_topic') or (f"viessmann/{name}" if name else 'viessmann'),
+            properties=endpoint.get('Properties'),
+            mqtt_client=mqtt_client
+        )
+        if sink:
+            pyvclient.device.add_value_listener(sink.listener(name or 'viessmann'))
+        if pyvclient.snapshot:
+            atexit.register(pyvclient.save_snapshot)
+        pyvclient.setup_timers(scheduler,
+                               bus_budget=endpoint.get('bus_budget'),
+                               slot=endpoint.get('slot', 5))
+        clients[name] = pyvclient
+
+    reload = partial(reload_config, filename, clients, host, port)
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload())
+    if watch:
+        scheduler.add_job(watch, ConfigWatcher(filename, reload))
+
+    if config.get('Tracing'):
+        from pyvclient.utils.tracing import create_tracer, set_tracer
+        set_tracer(create_tracer(config['Tracing'], mqtt_client))
+
+    if config.get('Profiling'):
+        setup_profiling(config['Profiling'], mqtt_client)
+
+    # run the atexit handlers on SIGTERM too, e.g. when stopped by systemd
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    while True:
+        pause()
 
     # except (KeyboardInterrupt, SystemExit):
     #    print("Quitting.")
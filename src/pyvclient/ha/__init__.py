@@ -1,22 +1,35 @@
 """
 Home Assistant integration package for Viessmann heating via vcontrold.
+
+Names are imported from their modules on first access, so importing a
+single module does not load the MQTT client.
 """
-from .ha_mqtt_discovery import HAMqttClient, create_device_config
-from .ha_entities import (
-    HAEntity, HASensor, HABinarySensor, HANumber, HASelect, HAClimate,
-    EntityFactory
-)
-from .ha_viessmann_device import ViessmannDevice
+import importlib
+
+_EXPORTS = {
+    'HAMqttClient': 'ha_mqtt_discovery',
+    'create_device_config': 'ha_mqtt_discovery',
+    'create_mqtt_client': 'ha_mqtt_discovery',
+    'HAEntity': 'ha_entities',
+    'HASensor': 'ha_entities',
+    'HABinarySensor': 'ha_entities',
+    'HANumber': 'ha_entities',
+    'HASelect': 'ha_entities',
+    'HAClimate': 'ha_entities',
+    'EntityFactory': 'ha_entities',
+    'ViessmannDevice': 'ha_viessmann_device',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = [
-    'HAMqttClient',
-    'create_device_config',
-    'HAEntity',
-    'HASensor',
-    'HABinarySensor',
-    'HANumber',
-    'HASelect',
-    'HAClimate',
-    'EntityFactory',
-    'ViessmannDevice',
-]
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -23,10 +23,12 @@ class HAEntity:
     unique_id: Optional[str] = None
     icon: Optional[str] = None
     entity_category: Optional[str] = None  # "config", "diagnostic", None
+    message_expiry: Optional[int] = None  # MQTT v5 expiry for state messages
     
     def __post_init__(self):
         if not self.unique_id:
-            self.unique_id = f"viessmann_{self.object_id}"
+            # Derived from the state topic to stay unique across several heaters
+            self.unique_id = self.state_topic.replace("/", "_")
     
     def get_discovery_config(self) -> Dict[str, Any]:
         """Get base discovery configuration common to all entities."""
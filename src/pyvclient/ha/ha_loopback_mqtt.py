@@ -0,0 +1,55 @@
+"""
+HAMqttClient talking to an in-process stand-in of paho instead of a broker.
+"""
+import time
+from types import SimpleNamespace
+
+from pyvclient.ha.ha_mqtt_discovery import HAMqttClient
+
+
+class _PublishResult:
+    rc = 0
+    mid = 0
+
+
+class _PahoStandIn:
+    """Accepts what HAMqttClient hands to paho, counting publishes."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, *args, **kwargs):
+        self.published += 1
+        return _PublishResult()
+
+    def subscribe(self, *args, **kwargs):
+        return 0, 0
+
+    def unsubscribe(self, *args, **kwargs):
+        return 0, 0
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+    def loop_stop(self, *args, **kwargs):
+        pass
+
+
+class LoopbackMqttClient(HAMqttClient):
+    """HAMqttClient whose broker connection is replaced by a stand-in."""
+
+    def __init__(self):
+        super().__init__('localhost', 1883, None, None, 'pyvclient-soak')
+        self.client = _PahoStandIn()
+
+    def connect(self):
+        self._on_connect(self.client, None, {}, 0)
+
+    def flap(self):
+        """Drop and restore the broker connection like paho reports it."""
+        self._on_disconnect(self.client, None, 1)
+        self._on_connect(self.client, None, {}, 0)
+
+    def inject_command(self, topic: str, payload: str):
+        self._on_message(self.client, None, SimpleNamespace(
+            topic=topic, payload=payload.encode('utf-8'), timestamp=time.monotonic()))
@@ -4,9 +4,14 @@ Handles MQTT connection and discovery message publishing.
 """
 import json
 import logging
+import threading
 from typing import Dict, Any, Optional, Callable
 
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from pyvclient.utils.tracing import span, trace
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +29,9 @@ class HAMqttClient:
         username: Optional[str] = None,
         password: Optional[str] = None,
         client_id: Optional[str] = None,
+        protocol_version: int = 4,
+        session_expiry: Optional[int] = None,
+        topic_aliases: bool = True,
     ):
         """
         Initialize MQTT client for Home Assistant.
@@ -34,12 +42,21 @@ class HAMqttClient:
             username: Optional MQTT username
             password: Optional MQTT password
             client_id: Optional MQTT client ID
+            protocol_version: MQTT protocol version (4 = 3.1.1, 5 = 5.0)
+            session_expiry: MQTT v5 session expiry interval in seconds
+            topic_aliases: Use MQTT v5 topic aliases for state topics
         """
         self.broker = broker
         self.port = port
         self.client_id = client_id or "viessmann_vcontrold"
+        self.mqtt_v5 = protocol_version == 5
+        self.session_expiry = session_expiry
+        self.topic_aliases = topic_aliases and self.mqtt_v5
         
-        self.client = mqtt.Client(client_id=self.client_id)
+        self.client = mqtt.Client(
+            client_id=self.client_id,
+            protocol=mqtt.MQTTv5 if self.mqtt_v5 else mqtt.MQTTv311
+        )
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
@@ -48,9 +65,15 @@ class HAMqttClient:
             self.client.username_pw_set(username, password)
         
         self.connected = False
+        self._started = False
         self._command_callbacks: Dict[str, Callable] = {}
         self._lwt_topic = "viessmann/status"
         
+        # Topic aliases are only valid for the lifetime of one connection
+        self._alias_lock = threading.Lock()
+        self._topic_alias_maximum = 0
+        self._topic_alias_map: Dict[str, int] = {}
+        
         # Set Last Will and Testament
         self.client.will_set(
             self._lwt_topic,
@@ -61,9 +84,10 @@ class HAMqttClient:
         
         logger.info(f"MQTT client initialized for broker {broker}:{port}")
 
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback when connected to MQTT broker."""
         if rc == 0:
+            self._reset_topic_aliases(properties)
             self.connected = True
             logger.info("Connected to MQTT broker")
             
@@ -78,7 +102,7 @@ class HAMqttClient:
             self.connected = False
             logger.error(f"Failed to connect to MQTT broker, return code: {rc}")
 
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, userdata, rc, properties=None):
         """Callback when disconnected from MQTT broker."""
         self.connected = False
         if rc != 0:
@@ -91,19 +115,44 @@ class HAMqttClient:
         topic = msg.topic
         payload = msg.payload.decode('utf-8')
         
-        logger.debug(f"Received message on {topic}: {payload}")
+        logger.debug("Received message on %s: %s", topic, payload)
         
         if topic in self._command_callbacks:
-            try:
-                self._command_callbacks[topic](payload)
-            except Exception as e:
-                logger.error(f"Error executing callback for {topic}: {e}", exc_info=True)
+            # the trace starts when paho received the message
+            with trace('mqtt_command', msg.timestamp or None, topic=topic, payload=payload):
+                try:
+                    self._command_callbacks[topic](payload)
+                except Exception as e:
+                    logger.error("Error executing callback for %s: %s", topic, e, exc_info=True)
+
+    def _reset_topic_aliases(self, properties=None):
+        """Drop all topic aliases and take over the broker's alias limit."""
+        with self._alias_lock:
+            self._topic_alias_map.clear()
+            self._topic_alias_maximum = 0
+            if self.topic_aliases and properties is not None:
+                self._topic_alias_maximum = getattr(properties, "TopicAliasMaximum", 0)
+        if self.topic_aliases:
+            logger.debug(f"Broker allows {self._topic_alias_maximum} topic aliases")
 
     def connect(self):
-        """Connect to MQTT broker."""
+        """Connect to MQTT broker. Does nothing if the connection is already initiated."""
+        if self._started:
+            return
         try:
-            self.client.connect(self.broker, self.port, keepalive=60)
+            if self.mqtt_v5:
+                properties = Properties(PacketTypes.CONNECT)
+                if self.session_expiry:
+                    properties.SessionExpiryInterval = self.session_expiry
+                self.client.connect(
+                    self.broker, self.port, keepalive=60,
+                    clean_start=not self.session_expiry,
+                    properties=properties
+                )
+            else:
+                self.client.connect(self.broker, self.port, keepalive=60)
             self.client.loop_start()
+            self._started = True
             logger.info("MQTT connection initiated")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
@@ -115,9 +164,18 @@ class HAMqttClient:
             self.publish(self._lwt_topic, "offline", retain=True)
         self.client.loop_stop()
         self.client.disconnect()
+        self._started = False
         logger.info("Disconnected from MQTT broker")
 
-    def publish(self, topic: str, payload: str, retain: bool = False, qos: int = 1):
+    def publish(
+        self,
+        topic: str,
+        payload: str,
+        retain: bool = False,
+        qos: int = 1,
+        expiry: Optional[int] = None,
+        alias: bool = False
+    ):
         """
         Publish message to MQTT topic.
 
@@ -126,21 +184,67 @@ class HAMqttClient:
             payload: Message payload (string)
             retain: Whether to retain message
             qos: Quality of Service level (0, 1, or 2)
+            expiry: MQTT v5 message expiry interval in seconds
+            alias: Whether to publish via an MQTT v5 topic alias
         """
         if not self.connected:
-            logger.warning(f"Not connected to MQTT broker, cannot publish to {topic}")
+            logger.warning("Not connected to MQTT broker, cannot publish to %s", topic)
             return
         
         try:
-            result = self.client.publish(topic, payload, qos=qos, retain=retain)
+            with span('publish'):
+                if self.mqtt_v5:
+                    result = self._publish_v5(topic, payload, retain, qos, expiry, alias)
+                else:
+                    result = self.client.publish(topic, payload, qos=qos, retain=retain)
             if result.rc != mqtt.MQTT_ERR_SUCCESS:
-                logger.error(f"Failed to publish to {topic}, rc: {result.rc}")
+                logger.error("Failed to publish to %s, rc: %s", topic, result.rc)
             else:
-                logger.debug(f"Published to {topic}: {payload[:100]}")
+                logger.debug("Published to %s: %.100s", topic, payload)
         except Exception as e:
-            logger.error(f"Error publishing to {topic}: {e}")
+            logger.error("Error publishing to %s: %s", topic, e)
+
+    def _publish_v5(self, topic, payload, retain, qos, expiry, alias):
+        """
+        Publish with MQTT v5 properties, replacing known topics by their alias.
 
-    def publish_discovery(self, domain: str, object_id: str, config: Dict[str, Any]):
+        Only QoS 0 publishes use aliases: paho resends unacknowledged QoS 1
+        and 2 publishes after a reconnect, when their alias is no longer
+        known to the broker.
+        """
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = int(expiry)
+        if not (alias and self.topic_aliases and qos == 0):
+            return self.client.publish(topic, payload, qos=qos, retain=retain,
+                                       properties=properties)
+        
+        # Hold the lock across publish so the packet announcing an alias is
+        # queued before any packet that only refers to it.
+        with self._alias_lock:
+            topic_alias = self._topic_alias_map.get(topic)
+            if topic_alias:
+                properties.TopicAlias = topic_alias
+                return self.client.publish("", payload, qos=qos, retain=retain,
+                                           properties=properties)
+            if len(self._topic_alias_map) >= self._topic_alias_maximum:
+                return self.client.publish(topic, payload, qos=qos, retain=retain,
+                                           properties=properties)
+            topic_alias = len(self._topic_alias_map) + 1
+            properties.TopicAlias = topic_alias
+            result = self.client.publish(topic, payload, qos=qos, retain=retain,
+                                         properties=properties)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._topic_alias_map[topic] = topic_alias
+            return result
+
+    def publish_discovery(
+        self,
+        domain: str,
+        object_id: str,
+        config: Dict[str, Any],
+        node_id: Optional[str] = None
+    ):
         """
         Publish Home Assistant discovery configuration.
 
@@ -148,12 +252,23 @@ class HAMqttClient:
             domain: HA domain (sensor, binary_sensor, number, select, climate, etc.)
             object_id: Unique object identifier
             config: Discovery configuration dictionary
+            node_id: Optional node ID to keep object IDs of several devices apart
         """
-        topic = f"homeassistant/{domain}/{object_id}/config"
         payload = json.dumps(config)
         
         logger.info(f"Publishing discovery config for {domain}.{object_id}")
-        self.publish(topic, payload, retain=True)
+        self.publish(self._discovery_topic(domain, object_id, node_id), payload, retain=True)
+
+    def clear_discovery(self, domain: str, object_id: str, node_id: Optional[str] = None):
+        """Remove a Home Assistant discovery configuration."""
+        logger.info(f"Clearing discovery config for {domain}.{object_id}")
+        self.publish(self._discovery_topic(domain, object_id, node_id), "", retain=True)
+
+    @staticmethod
+    def _discovery_topic(domain: str, object_id: str, node_id: Optional[str] = None) -> str:
+        if node_id:
+            return f"homeassistant/{domain}/{node_id}/{object_id}/config"
+        return f"homeassistant/{domain}/{object_id}/config"
 
     def subscribe_command(self, topic: str, callback: Callable[[str], None]):
         """
@@ -169,29 +284,75 @@ class HAMqttClient:
             self.client.subscribe(topic)
             logger.info(f"Subscribed to command topic: {topic}")
 
-    def publish_state(self, topic: str, state: Any, retain: bool = False):
+    def unsubscribe_command(self, topic: str):
+        """Unsubscribe from command topic."""
+        if self._command_callbacks.pop(topic, None) and self.connected:
+            self.client.unsubscribe(topic)
+            logger.info(f"Unsubscribed from command topic: {topic}")
+
+    def publish_state(
+        self,
+        topic: str,
+        state: Any,
+        retain: bool = False,
+        expiry: Optional[int] = None
+    ):
         """
-        Publish state value to topic.
+        Publish state value to topic, with QoS 0 if topic aliases are used.
 
         Args:
             topic: State topic
             state: State value (will be converted to string)
             retain: Whether to retain the message
+            expiry: MQTT v5 message expiry interval in seconds
         """
         payload = str(state)
-        self.publish(topic, payload, retain=retain)
+        self.publish(topic, payload, retain=retain, qos=0 if self.topic_aliases else 1,
+                     expiry=expiry, alias=True)
 
 
-def create_device_config() -> Dict[str, Any]:
+def create_device_config(name: Optional[str] = None) -> Dict[str, Any]:
     """
     Create the shared device configuration for all entities.
     
+    Args:
+        name: Optional name of the vcontrold endpoint when running several heaters
+    
     Returns:
         Device configuration dictionary
     """
+    if not name:
+        return {
+            "identifiers": ["viessmann_vcontrold"],
+            "manufacturer": "Viessmann",
+            "model": "via vcontrold",
+            "name": "Viessmann Heating"
+        }
     return {
-        "identifiers": ["viessmann_vcontrold"],
+        "identifiers": [f"viessmann_vcontrold_{name}"],
         "manufacturer": "Viessmann",
         "model": "via vcontrold",
-        "name": "Viessmann Heating"
+        "name": f"Viessmann Heating {name}"
     }
+
+
+def create_mqtt_client(mqtt_settings: Dict[str, Any]) -> HAMqttClient:
+    """
+    Create MQTT client from the MQTT_SETTINGS configuration section.
+    
+    Args:
+        mqtt_settings: MQTT configuration dictionary
+    
+    Returns:
+        HAMqttClient instance
+    """
+    return HAMqttClient(
+        broker=mqtt_settings.get("MQTT_BROKER", "localhost"),
+        port=mqtt_settings.get("MQTT_PORT", 1883),
+        username=mqtt_settings.get("MQTT_USERNAME"),
+        password=mqtt_settings.get("MQTT_PASSWORD"),
+        client_id=mqtt_settings.get("MQTT_CLIENT_ID"),
+        protocol_version=mqtt_settings.get("MQTT_PROTOCOL", 4),
+        session_expiry=mqtt_settings.get("MQTT_SESSION_EXPIRY"),
+        topic_aliases=mqtt_settings.get("MQTT_TOPIC_ALIASES", True)
+    )
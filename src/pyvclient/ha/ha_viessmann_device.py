@@ -2,12 +2,19 @@
 Home Assistant Viessmann device implementation.
 Main class that manages MQTT discovery, state updates, and command handling.
 """
+import json
 import logging
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Any, Optional
 
-from pyvclient.ha.ha_mqtt_discovery import HAMqttClient, create_device_config
+from pyvclient.ha.ha_mqtt_discovery import (
+    HAMqttClient, create_device_config, create_mqtt_client
+)
 from pyvclient.ha.ha_entities import EntityFactory, HAEntity
+from pyvclient.utils.derived import DerivedSensor
+from pyvclient.utils.tracing import current_trace_id, span
 from pyvclient.vcomm.vcomm import VComm, VCommError
 
 logger = logging.getLogger(__name__)
@@ -24,7 +31,10 @@ class ViessmannDevice:
         items: List[Any],
         vcomm: VComm,
         mqtt_settings: Dict[str, Any],
-        base_topic: str = "viessmann"
+        base_topic: str = "viessmann",
+        mqtt_client: Optional[HAMqttClient] = None,
+        name: Optional[str] = None,
+        derived: Optional[Dict[str, Dict[str, Any]]] = None
     ):
         """
         Initialize Viessmann HA device.
@@ -34,52 +44,208 @@ class ViessmannDevice:
             vcomm: VComm instance for vcontrold communication
             mqtt_settings: MQTT configuration dictionary
             base_topic: Base MQTT topic prefix
+            mqtt_client: Optional MQTT client shared with other devices
+            name: Optional device name when running several heaters
+            derived: Optional derived sensor definitions by name
         """
         self.vcomm = vcomm
         self.base_topic = base_topic
-        self.device_config = create_device_config()
+        self.node_id = name
+        self.device_config = create_device_config(name)
         
         # Initialize MQTT client
-        self.mqtt = HAMqttClient(
-            broker=mqtt_settings.get("MQTT_BROKER", "localhost"),
-            port=mqtt_settings.get("MQTT_PORT", 1883),
-            username=mqtt_settings.get("MQTT_USERNAME"),
-            password=mqtt_settings.get("MQTT_PASSWORD"),
-            client_id=mqtt_settings.get("MQTT_CLIENT_ID")
-        )
+        self.mqtt = mqtt_client or create_mqtt_client(mqtt_settings)
+        self._expiry_factor = mqtt_settings.get("MQTT_MESSAGE_EXPIRY_FACTOR", 2)
+        
+        if len(vcomm.endpoints) > 1:
+            vcomm.on_endpoint_change = self._publish_endpoint
+        
+        # Last published value by entity name
+        self.last_values: Dict[str, Any] = {}
+        
+        # Called with entity name and parsed value of every polled value
+        self.value_listeners: List[Callable[[str, Any], None]] = []
+        
+        # Payloads of set commands awaiting their read-back by entity name
+        self._unverified: Dict[str, str] = {}
+        self._verify_submit: Optional[Callable[[Callable], None]] = None
+        self._verify_delay = 5.0
+        self._next_poll: Optional[Callable[[], Optional[float]]] = None
+        self._verify_timer: Optional[threading.Timer] = None
+        self._verify_lock = threading.Lock()
+        
+        # Rate limits of set commands and the latest command over the limit by entity name
+        self._limiter = None
+        self._coalesced: Dict[str, str] = {}
+        self._coalesce_timers: Dict[str, threading.Timer] = {}
+        self._limit_lock = threading.Lock()
         
         # Create entities from items
         self.entities: Dict[str, HAEntity] = {}
         self._create_entities(items)
+        self.derived: Dict[str, List[DerivedSensor]] = {}
+        self._create_derived_entities(derived or {})
         
         logger.info(f"Initialized Viessmann device with {len(self.entities)} entities")
 
     def _create_entities(self, items: List[Any]):
         """Create HA entities from vcontrold items."""
         for item in items:
-            entity = EntityFactory.create_entity(
-                item,
-                self.device_config,
-                self.base_topic
-            )
-            
+            entity = self._create_entity(item)
             if entity:
                 self.entities[item.name] = entity
-                # Store initial value from item
-                entity._initial_value = getattr(item, 'value', None)
-                logger.debug(f"Created entity: {entity.name} ({entity.__class__.__name__})")
-            else:
-                logger.warning(f"Failed to create entity for item: {item.name}")
+
+    def _create_entity(self, item) -> Optional[HAEntity]:
+        entity = EntityFactory.create_entity(
+            item,
+            self.device_config,
+            self.base_topic
+        )
+        
+        if entity:
+            # Store initial value from item
+            entity._initial_value = getattr(item, 'value', None)
+            entity.message_expiry = self._get_message_expiry(item)
+            logger.debug(f"Created entity: {entity.name} ({entity.__class__.__name__})")
+        else:
+            logger.warning(f"Failed to create entity for item: {item.name}")
+        return entity
+
+    def replace_entities(self, items: List[Any]):
+        """
+        Recreate the entities of items whose metadata changed, e.g. stub
+        items resolved once vcontrold is reachable.
+
+        Only the discovery of these entities is republished. A discovery
+        config left under another domain is cleared, and so are command
+        subscriptions the new entity does not take over.
+        """
+        names = []
+        for item in items:
+            entity = self._create_entity(item)
+            if not entity:
+                continue
+            old = self.entities.get(item.name)
+            if old and self._get_domain_for_entity(old) != self._get_domain_for_entity(entity):
+                self.mqtt.clear_discovery(self._get_domain_for_entity(old), old.object_id,
+                                          self.node_id)
+            if old:
+                kept = self._command_topics(entity)
+                for topic in self._command_topics(old):
+                    if topic not in kept:
+                        self.mqtt.unsubscribe_command(topic)
+            self.entities[item.name] = entity
+            names.append(item.name)
+        
+        if names:
+            self._publish_discovery(names)
+            self._publish_initial_states(names)
+            self._subscribe_commands(names)
+            logger.info(f"Replaced entities: {', '.join(names)}")
+
+    def remove_entities(self, names: List[str]):
+        """
+        Remove entities, clearing their discovery and command subscriptions.
+        Sensors derived from a removed entity are removed with it.
+        """
+        dependent = []
+        for name in names:
+            dependent.extend(sensor.name for sensor in self.derived.pop(name, ()))
+            entity = self.entities.pop(name, None)
+            if not entity:
+                continue
+            self.mqtt.clear_discovery(self._get_domain_for_entity(entity), entity.object_id,
+                                      self.node_id)
+            for topic in self._command_topics(entity):
+                self.mqtt.unsubscribe_command(topic)
+            self.last_values.pop(name, None)
+            if self._limiter:
+                self._limiter.forget(name)
+            logger.info(f"Removed entity: {name}")
+        
+        if dependent:
+            self.remove_entities(dependent)
+
+    @staticmethod
+    def _is_settable(entity: HAEntity) -> bool:
+        from pyvclient.ha.ha_entities import HANumber, HASelect, HAClimate
+        
+        return isinstance(entity, (HANumber, HASelect, HAClimate))
+
+    @staticmethod
+    def _command_topics(entity: HAEntity) -> List[str]:
+        """Command topics the entity is subscribed to."""
+        from pyvclient.ha.ha_entities import HANumber, HASelect, HAClimate
+        
+        if isinstance(entity, (HANumber, HASelect)):
+            return [entity.command_topic]
+        if isinstance(entity, HAClimate):
+            return [topic for topic in (entity.temperature_command_topic,
+                                        entity.mode_command_topic) if topic]
+        return []
+
+    def _select_entities(self, names: Optional[List[str]] = None):
+        if names is None:
+            return self.entities.items()
+        return [(name, self.entities[name]) for name in names if name in self.entities]
+
+    def _create_derived_entities(self, derived: Dict[str, Dict[str, Any]]):
+        """Create sensors computed from the values of other entities."""
+        for name, config in derived.items():
+            try:
+                sensor = DerivedSensor(name, config)
+            except (KeyError, ValueError) as e:
+                logger.error(f"Invalid derived sensor {name}: {e}")
+                continue
+            
+            source = self.entities.get(sensor.source)
+            if not source:
+                logger.warning(f"Source {sensor.source} of derived sensor {name} not found")
+                continue
+            
+            unit = sensor.unit or getattr(source, 'unit_of_measurement', None)
+            if sensor.function == 'rate' and not sensor.unit:
+                unit = f"{unit or ''}/h"
+            item = SimpleNamespace(
+                name=name,
+                get_command='',
+                settable=False,
+                type='int' if sensor.function == 'daily_delta' else 'short',
+                unit=unit
+            )
+            entity = EntityFactory.create_entity(item, self.device_config, self.base_topic)
+            if entity:
+                self.entities[name] = entity
+                self.derived.setdefault(sensor.source, []).append(sensor)
+                logger.debug(f"Created derived entity: {name} ({sensor.function} of {sensor.source})")
+        
+        if self.derived:
+            self.add_value_listener(self._update_derived)
+
+    def _update_derived(self, entity_name: str, value: Any):
+        """Value listener: update the sensors derived from entity_name."""
+        for sensor in self.derived.get(entity_name, ()):
+            result = sensor.add(value)
+            if result is not None:
+                self.update_value(sensor.name, result)
+
+    def _get_message_expiry(self, item) -> Optional[int]:
+        """Derive the MQTT v5 message expiry of an item from its longest poll interval."""
+        interval = getattr(item, 'interval', None)
+        if not (self.mqtt.mqtt_v5 and interval and self._expiry_factor):
+            return None
+        return int(interval * self._expiry_factor)
 
     def start(self):
         """Start the device: connect MQTT and publish discovery."""
         logger.info("Starting Viessmann device")
         
         # Connect to MQTT
-        self.mqtt.connect()
-        
-        # Wait a bit for connection to establish
-        time.sleep(1)
+        if not self.mqtt.connected:
+            self.mqtt.connect()
+            
+            # Wait a bit for connection to establish
+            time.sleep(1)
         
         if not self.mqtt.connected:
             logger.error("Failed to connect to MQTT broker")
@@ -93,6 +259,10 @@ class ViessmannDevice:
         
         # Subscribe to command topics for settable entities
         self._subscribe_commands()
+        self.mqtt.subscribe_command(f"{self.base_topic}/batch/set", self._handle_batch_request)
+        
+        if len(self.vcomm.endpoints) > 1:
+            self._publish_endpoint(self.vcomm.active_endpoint)
         
         logger.info("Viessmann device started successfully")
 
@@ -101,11 +271,11 @@ class ViessmannDevice:
         logger.info("Stopping Viessmann device")
         self.mqtt.disconnect()
 
-    def _publish_discovery(self):
-        """Publish Home Assistant discovery configurations for all entities."""
+    def _publish_discovery(self, names: Optional[List[str]] = None):
+        """Publish Home Assistant discovery configurations for all or the named entities."""
         logger.info("Publishing discovery configurations")
         
-        for name, entity in self.entities.items():
+        for name, entity in self._select_entities(names):
             try:
                 # Determine domain based on entity type
                 domain = self._get_domain_for_entity(entity)
@@ -114,7 +284,7 @@ class ViessmannDevice:
                 config = entity.get_discovery_config()
                 
                 # Publish discovery
-                self.mqtt.publish_discovery(domain, entity.object_id, config)
+                self.mqtt.publish_discovery(domain, entity.object_id, config, self.node_id)
                 
                 logger.debug(f"Published discovery for {domain}.{entity.object_id}")
                 
@@ -123,11 +293,11 @@ class ViessmannDevice:
         
         logger.info("Discovery configurations published")
 
-    def _publish_initial_states(self):
-        """Publish initial state values for all entities."""
+    def _publish_initial_states(self, names: Optional[List[str]] = None):
+        """Publish initial state values for all or the named entities."""
         logger.info("Publishing initial state values")
         
-        for name, entity in self.entities.items():
+        for name, entity in self._select_entities(names):
             try:
                 # Get initial value stored during creation
                 initial_value = getattr(entity, '_initial_value', None)
@@ -135,7 +305,9 @@ class ViessmannDevice:
                 if initial_value is not None:
                     # Parse and publish the value
                     parsed_value = str(initial_value).strip()
-                    self.mqtt.publish_state(entity.state_topic, parsed_value)
+                    self.mqtt.publish_state(entity.state_topic, parsed_value,
+                                            expiry=entity.message_expiry)
+                    self.last_values[name] = parsed_value
                     logger.debug(f"Published initial state for {name}: {parsed_value}")
                 else:
                     logger.debug(f"No initial value for {name}, skipping")
@@ -145,6 +317,23 @@ class ViessmannDevice:
         
         logger.info("Initial state values published")
 
+    def _publish_endpoint(self, endpoint: str):
+        """Publish the vcontrold endpoint currently in use."""
+        logger.info(f"Active vcontrold endpoint: {endpoint}")
+        self.mqtt.publish_state(f"{self.base_topic}/vcontrold_endpoint", endpoint, retain=True)
+
+    def publish_snapshot_time(self, timestamp: float):
+        """Publish when the snapshot the initial values were loaded from was taken."""
+        self.mqtt.publish_state(
+            f"{self.base_topic}/snapshot_time",
+            time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(timestamp)),
+            retain=True
+        )
+
+    def publish_bus_load(self, report: Dict[str, Any]):
+        """Publish the bus load report of the poll planner."""
+        self.mqtt.publish_state(f"{self.base_topic}/bus_load", json.dumps(report))
+
     def _get_domain_for_entity(self, entity: HAEntity) -> str:
         """Get Home Assistant domain for entity type."""
         from pyvclient.ha.ha_entities import (
@@ -164,11 +353,11 @@ class ViessmannDevice:
         else:
             return "sensor"  # Default fallback
 
-    def _subscribe_commands(self):
-        """Subscribe to command topics for settable entities."""
+    def _subscribe_commands(self, names: Optional[List[str]] = None):
+        """Subscribe to command topics for all or the named settable entities."""
         from pyvclient.ha.ha_entities import HANumber, HASelect, HAClimate
         
-        for name, entity in self.entities.items():
+        for name, entity in self._select_entities(names):
             try:
                 if isinstance(entity, (HANumber, HASelect)):
                     command_topic = entity.command_topic
@@ -205,24 +394,35 @@ class ViessmannDevice:
             entity_name: Name of the entity
             payload: Command payload (new value)
         """
-        logger.info(f"Received command for {entity_name}: {payload}")
+        logger.info(f"Received command for {entity_name}: {payload} (trace {current_trace_id()})")
         
         entity = self.entities.get(entity_name)
         if not entity:
             logger.error(f"Entity {entity_name} not found")
             return
+        if not self._is_settable(entity):
+            logger.error(f"Entity {entity_name} is read-only, ignoring command {payload}")
+            return
+        if self._limiter and not self._admit(entity_name, payload):
+            return
         
         try:
             # Execute vcontrold set command
             # Convert get command to set command (e.g., getTempA -> setTempA)
             set_command = entity.vcontrol_command.replace('get', 'set', 1)
             
-            success = self.vcomm.set_command(set_command[3:], payload)  # Remove 'set' prefix
+            with span('set_command'):
+                success = self.vcomm.set_command(set_command[3:], payload)  # Remove 'set' prefix
             
-            if success:
+            if success and self._verify_submit:
+                logger.info(f"Successfully set {entity_name} to {payload}, awaiting read-back")
+                self._schedule_verification(entity_name, payload)
+            elif success:
                 logger.info(f"Successfully set {entity_name} to {payload}")
                 # Publish new state
-                self.mqtt.publish_state(entity.state_topic, payload)
+                self.mqtt.publish_state(entity.state_topic, payload,
+                                        expiry=entity.message_expiry)
+                self.last_values[entity_name] = payload
             else:
                 logger.error(f"Failed to set {entity_name} to {payload}")
                 
@@ -231,6 +431,218 @@ class ViessmannDevice:
         except Exception as e:
             logger.error(f"Error handling command for {entity_name}: {e}", exc_info=True)
 
+    def set_values(self, values: Dict[str, str], stop_on_failure: bool = False) -> Dict[str, str]:
+        """
+        Set several entities in one vcontrold session.
+        
+        The states of all confirmed sets are published together once the
+        session is closed, or read back if verification is enabled.
+        
+        Args:
+            values: New value by entity name, set in order
+            stop_on_failure: Skip the remaining entities after a failed set
+            
+        Returns:
+            Result by entity name: ok, failed, skipped, rejected, unknown or readonly
+        """
+        results = {}
+        registers = {}
+        for name, payload in values.items():
+            entity = self.entities.get(name)
+            if not entity:
+                results[name] = 'unknown'
+            elif not self._is_settable(entity):
+                results[name] = 'readonly'
+            else:
+                # getTempA -> TempA
+                registers[entity.vcontrol_command[3:]] = (name, str(payload).strip())
+        if stop_on_failure and results:
+            logger.error(f"Batch not set, invalid entities: {results}")
+            return {name: results.get(name, 'skipped') for name in values}
+        
+        if self._limiter:
+            # commands over the limit are rejected, batches are not coalesced
+            admitted = {}
+            for reg, (name, payload) in registers.items():
+                wait, reason = self._limiter.admit(name)
+                if wait:
+                    results[name] = 'rejected'
+                    self._publish_rejected(name, payload, reason)
+                    if stop_on_failure:
+                        break
+                else:
+                    self._drop_coalesced(name)
+                    admitted[reg] = (name, payload)
+            registers = admitted
+        
+        confirmed = {}
+        if registers:
+            logger.info(f"Setting {len(registers)} entities in one session "
+                        f"(trace {current_trace_id()})")
+            try:
+                with span('set_commands'):
+                    confirmed = self.vcomm.set_commands(
+                        {reg: payload for reg, (name, payload) in registers.items()},
+                        stop_on_failure)
+            except VCommError as e:
+                logger.error(f"VComm error setting {', '.join(values)}: {e}")
+        
+        for reg, (name, payload) in registers.items():
+            if reg not in confirmed:
+                results[name] = 'skipped'
+                continue
+            results[name] = 'ok' if confirmed[reg] else 'failed'
+            if not confirmed[reg]:
+                logger.error(f"Failed to set {name} to {payload}")
+            elif self._verify_submit:
+                self._schedule_verification(name, payload)
+            else:
+                entity = self.entities[name]
+                self.mqtt.publish_state(entity.state_topic, payload,
+                                        expiry=entity.message_expiry)
+                self.last_values[name] = payload
+        return {name: results.get(name, 'skipped') for name in values}
+
+    def enable_command_limits(self, limiter):
+        """
+        Limit the rate of set commands and keep a share of bus time for polls.
+        
+        Commands over a limit are published to <base_topic>/commands/rejected.
+        If the limiter coalesces, the latest command over the limit of an
+        entity is applied once allowed and the commands it replaced are
+        published as superseded.
+        
+        Args:
+            limiter: CommandLimiter charged with the bus time of set sessions
+        """
+        self._limiter = limiter
+        self.vcomm.on_set_session = limiter.charge
+
+    def _admit(self, entity_name: str, payload: str) -> bool:
+        """Whether a command may be set now, coalesces or rejects it otherwise."""
+        wait, reason = self._limiter.admit(entity_name)
+        if not wait:
+            self._drop_coalesced(entity_name)
+            return True
+        if not self._limiter.coalesce:
+            self._publish_rejected(entity_name, payload, reason)
+            return False
+        
+        with self._limit_lock:
+            superseded = self._coalesced.get(entity_name)
+            self._coalesced[entity_name] = payload
+            if entity_name not in self._coalesce_timers:
+                timer = threading.Timer(wait, self._apply_coalesced, (entity_name,))
+                timer.daemon = True
+                self._coalesce_timers[entity_name] = timer
+                timer.start()
+        logger.info("Command for %s over %s limit, setting %s in %.1fs",
+                    entity_name, reason, payload, wait)
+        if superseded is not None:
+            self._publish_rejected(entity_name, superseded, 'superseded')
+        return False
+
+    def _drop_coalesced(self, entity_name: str):
+        """Drop a coalesced command of an entity, a newer one was admitted."""
+        with self._limit_lock:
+            superseded = self._coalesced.pop(entity_name, None)
+            timer = self._coalesce_timers.pop(entity_name, None)
+        if timer:
+            timer.cancel()
+        if superseded is not None:
+            self._publish_rejected(entity_name, superseded, 'superseded')
+
+    def _apply_coalesced(self, entity_name: str):
+        with self._limit_lock:
+            self._coalesce_timers.pop(entity_name, None)
+            payload = self._coalesced.pop(entity_name, None)
+        if payload is not None:
+            self._handle_command(entity_name, payload)
+
+    def _publish_rejected(self, entity_name: str, payload: str, reason: str):
+        logger.warning("Rejected command for %s: %s (%s)", entity_name, payload, reason)
+        self.mqtt.publish(
+            f"{self.base_topic}/commands/rejected",
+            json.dumps({'entity': entity_name, 'payload': payload, 'reason': reason,
+                        'timestamp': time.time()}),
+            qos=0
+        )
+
+    def _handle_batch_request(self, payload: str):
+        """
+        Set the entities of a batch request received via MQTT.
+        
+        Requests are JSON objects with the new value by entity name under
+        values and optionally stop_on_failure and response_topic. The
+        results are published to the response_topic or to
+        <base_topic>/batch/result.
+        """
+        response_topic = f"{self.base_topic}/batch/result"
+        try:
+            request = json.loads(payload)
+            response_topic = request.get('response_topic') or response_topic
+            values = request['values']
+            if not isinstance(values, dict):
+                raise ValueError("values must map entity names to values")
+            response = {'results': self.set_values(
+                values, bool(request.get('stop_on_failure', False)))}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Invalid batch request {payload!r}: {e}")
+            response = {'error': str(e)}
+        self.mqtt.publish(response_topic, json.dumps(response), qos=0)
+
+    def enable_verification(
+        self,
+        submit: Callable[[Callable], None],
+        max_delay: float = 5.0,
+        next_poll: Optional[Callable[[], Optional[float]]] = None
+    ):
+        """
+        Publish the value the heater reports after a set command instead of
+        the command payload.
+        
+        The changed value is read back with the next poll batch. If no batch
+        is due within max_delay seconds, the read-back is queued on the
+        worker right away, together with others still waiting there. If a
+        due batch does not run after all, the values awaiting their
+        read-back are read together after max_delay.
+        
+        Args:
+            submit: Queues a job on the I/O worker of the endpoint
+            max_delay: Seconds a read-back waits for a poll batch
+            next_poll: Returns the monotonic time of the next poll batch,
+                None if unknown
+        """
+        self._verify_submit = submit
+        self._verify_delay = max_delay
+        self._next_poll = next_poll
+
+    def _schedule_verification(self, entity_name: str, payload: str):
+        with self._verify_lock:
+            self._unverified[entity_name] = payload
+            if self._verify_timer is None:
+                self._verify_timer = threading.Timer(
+                    self._verify_delay, self._verify_submit, (self._verify_pending,))
+                self._verify_timer.daemon = True
+                self._verify_timer.start()
+        next_poll = self._next_poll() if self._next_poll else None
+        if next_poll is None or next_poll - time.monotonic() > self._verify_delay:
+            # IOWorker queues the job only once
+            self._verify_submit(self._verify_pending)
+
+    def _take_unverified(self) -> Dict[str, str]:
+        with self._verify_lock:
+            unverified, self._unverified = self._unverified, {}
+            if self._verify_timer:
+                self._verify_timer.cancel()
+                self._verify_timer = None
+        return unverified
+
+    def _verify_pending(self):
+        """Read back the values awaiting verification, runs on the worker."""
+        if self._unverified:
+            self.update_properties([])
+
     def _handle_temperature_command(self, entity_name: str, payload: str):
         """Handle temperature command for climate entity."""
         self._handle_command(entity_name, payload)
@@ -246,12 +658,13 @@ class ViessmannDevice:
         Args:
             properties: List of property names to update
         """
-        logger.debug(f"Updating properties: {properties}")
+        logger.debug("Updating properties: %s", properties)
+        unverified = self._take_unverified()
         
         try:
-            # Build command dictionary
+            # Build command dictionary, read-backs of set commands join the batch
             commands = {}
-            for prop in properties:
+            for prop in list(properties) + list(unverified):
                 entity = self.entities.get(prop)
                 if entity:
                     commands[entity.vcontrol_command] = prop
@@ -270,13 +683,31 @@ class ViessmannDevice:
                     if raw_value and len(raw_value) > 0:
                         value = raw_value[0]
                         self.update_value(prop_name, value)
+                        if prop_name in unverified:
+                            self._check_verified(prop_name, unverified[prop_name])
                     else:
-                        logger.warning(f"Empty result for {prop_name}")
+                        logger.warning("Empty result for %s", prop_name)
                 else:
-                    logger.warning(f"No result for {prop_name}")
+                    logger.warning("No result for %s", prop_name)
                     
         except Exception as e:
-            logger.error(f"Error updating properties: {e}", exc_info=True)
+            logger.error("Error updating properties: %s", e, exc_info=True)
+            if unverified:
+                # the next poll publishes the actual value
+                logger.warning("Read-back of %s failed", ', '.join(unverified))
+
+    def _check_verified(self, entity_name: str, payload: str):
+        """Warn if the heater did not take over the value that was set."""
+        confirmed = self.last_values.get(entity_name)
+        try:
+            accepted = abs(float(confirmed) - float(payload)) < 1e-6
+        except (TypeError, ValueError):
+            accepted = confirmed == payload.strip()
+        if accepted:
+            logger.debug("Read-back of %s confirmed %s", entity_name, confirmed)
+        else:
+            logger.warning("Set %s to %s but the heater reports %s",
+                           entity_name, payload, confirmed)
 
     def update_value(self, entity_name: str, value: Any):
         """
@@ -288,7 +719,7 @@ class ViessmannDevice:
         """
         entity = self.entities.get(entity_name)
         if not entity:
-            logger.warning(f"Entity {entity_name} not found")
+            logger.warning("Entity %s not found", entity_name)
             return
         
         try:
@@ -296,12 +727,60 @@ class ViessmannDevice:
             parsed_value = self._parse_value(value, entity)
             
             # Publish to state topic
-            self.mqtt.publish_state(entity.state_topic, parsed_value)
+            self.mqtt.publish_state(entity.state_topic, parsed_value,
+                                    expiry=entity.message_expiry)
+            self.last_values[entity_name] = parsed_value
             
-            logger.debug(f"Updated {entity_name} to {parsed_value}")
+            logger.debug("Updated %s to %s", entity_name, parsed_value)
+            
+            for listener in self.value_listeners:
+                listener(entity_name, parsed_value)
             
         except Exception as e:
-            logger.error(f"Error updating value for {entity_name}: {e}", exc_info=True)
+            logger.error("Error updating value for %s: %s", entity_name, e, exc_info=True)
+
+    def enable_history(self, history):
+        """
+        Record polled values in a history store and answer history requests.
+        
+        Requests are JSON objects published to <base_topic>/history/get, see
+        HistoryStore.handle_request. The response is published to the
+        request's response_topic or to <base_topic>/history/response.
+        
+        Args:
+            history: HistoryStore instance
+        """
+        self.add_value_listener(history.add)
+        self.mqtt.subscribe_command(
+            f"{self.base_topic}/history/get",
+            lambda payload: self._handle_history_request(history, payload)
+        )
+
+    def _handle_history_request(self, history, payload: str):
+        """Answer a history request received via MQTT."""
+        response_topic = f"{self.base_topic}/history/response"
+        try:
+            request = json.loads(payload)
+            response_topic = request.get('response_topic') or response_topic
+            response = history.handle_request(request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Invalid history request {payload!r}: {e}")
+            response = {'error': str(e)}
+        self.mqtt.publish(response_topic, json.dumps(response), qos=0)
+
+    def add_value_listener(self, listener: Callable[[str, Any], None]):
+        """
+        Register listener for polled values.
+        
+        Args:
+            listener: Called with entity name and parsed value on every update
+        """
+        self.value_listeners.append(listener)
+
+    def remove_value_listener(self, listener: Callable[[str, Any], None]):
+        """Unregister a listener added with add_value_listener."""
+        if listener in self.value_listeners:
+            self.value_listeners.remove(listener)
 
     def _parse_value(self, value: Any, entity: HAEntity) -> Any:
         """
@@ -314,13 +793,13 @@ class ViessmannDevice:
         Returns:
             Parsed value suitable for MQTT publishing
         """
-        from pyvclient.ha.ha_entities import HASensor
+        from pyvclient.ha.ha_entities import HANumber, HASensor
         
         # Convert to string and clean
         value_str = str(value).strip()
         
         # Remove unit from value if present
-        if isinstance(entity, HASensor) and entity.unit_of_measurement:
+        if isinstance(entity, (HASensor, HANumber)) and entity.unit_of_measurement:
             value_str = value_str.replace(entity.unit_of_measurement, '').strip()
         
         return value_str
@@ -1,26 +1,143 @@
+import atexit
 import logging
 import logging.config
+import logging.handlers
 import os
+import queue
+import sys
+import threading
+import time
 
-import coloredlogs
-import yaml
 
+class RepeatFilter(logging.Filter):
+    """
+    Lets a repeated warning or error through once per interval, e.g. while
+    vcontrold is unreachable. Records repeat when logger, level and message
+    template match, so messages logged with changing arguments still count.
+    The next record let through tells how many were suppressed.
+    """
 
-def setup_logging(default_path='logging.yaml', default_level=logging.INFO):
+    def __init__(self, interval: float = 60, level: int = logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._last = (None, True)
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        # a handler shared by several loggers sees a propagated record again
+        last_record, last_result = self._last
+        if record is last_record:
+            return last_result
+        result = self._filter(record)
+        self._last = (record, result)
+        return result
+
+    def _filter(self, record):
+        # another filter may have added the suppressed count to the message
+        template = getattr(record, 'repeat_template', record.msg)
+        key = (record.name, record.levelno, str(template))
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen and now - seen[0] < self.interval:
+                seen[1] += 1
+                return False
+            if len(self._seen) > 1000:
+                self._seen = {k: v for k, v in self._seen.items()
+                              if now - v[0] < self.interval}
+            self._seen[key] = [now, 0]
+        if seen and seen[1]:
+            record.repeat_template = template
+            record.msg = f"{template} ({seen[1]} repeats suppressed)"
+        return True
+
+
+def install_coloredlogs(level=None):
+    """ Colors log output on a terminal, coloredlogs is only imported then """
+    if not sys.stderr.isatty():
+        return
+    import coloredlogs
+    if level is None:
+        coloredlogs.install()
+    else:
+        coloredlogs.install(level=level)
+
+
+def _configured_loggers():
+    loggers = [logging.getLogger()]
+    loggers.extend(logger for logger in logging.Logger.manager.loggerDict.values()
+                   if isinstance(logger, logging.Logger) and logger.handlers)
+    return loggers
+
+
+def use_log_queue(repeat_interval=0):
+    """
+    Hand records of every configured logger to a queue. Background
+    listeners write them to the logger's original handlers, so callers
+    never wait for log I/O. The queues are flushed at exit.
+
+    Returns:
+        The started listeners
+    """
+    listeners = []
+    for logger in _configured_loggers():
+        if not logger.handlers:
+            continue
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *logger.handlers, respect_handler_level=True)
+        handler = logging.handlers.QueueHandler(log_queue)
+        if repeat_interval:
+            handler.addFilter(RepeatFilter(repeat_interval))
+        logger.handlers = [handler]
+        listener.start()
+        atexit.register(listener.stop)
+        listeners.append(listener)
+    return listeners
+
+
+def setup_logging(default_path='logging.yaml', default_level=logging.INFO,
+                  use_queue=False, repeat_interval=60):
+    """
+    Configure logging from a yaml file, or at default_level without one.
+
+    Args:
+        use_queue: Write log records from background threads
+        repeat_interval: Seconds a repeated warning or error is suppressed,
+            0 logs every repeat
+
+    Returns:
+        The started queue listeners, if any
+    """
     path = default_path
 
     if os.path.exists(path):
+        import yaml
+
         with open(path, 'r') as f:
             try:
                 config = yaml.safe_load(f.read())
                 logging.config.dictConfig(config)
-                coloredlogs.install()
+                install_coloredlogs()
             except Exception as e:
                 print(e)
                 print('Error in Logging Configuration. Using default configs')
                 logging.basicConfig(level=default_level)
-                coloredlogs.install(level=default_level)
+                install_coloredlogs(default_level)
     else:
         logging.basicConfig(level=default_level)
-        coloredlogs.install(level=default_level)
+        install_coloredlogs(default_level)
         print('Failed to load configuration file. Using default configs')
+
+    if use_queue:
+        return use_log_queue(repeat_interval)
+    if repeat_interval:
+        # a record propagates to several handlers, each needs its own filter
+        handlers = {handler for logger in _configured_loggers() for handler in logger.handlers}
+        for handler in handlers:
+            handler.addFilter(RepeatFilter(repeat_interval))
+    return []
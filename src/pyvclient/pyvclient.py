@@ -1,7 +1,13 @@
 import logging
+import os
 import re
+import threading
 
-from pyvclient.utils.repeating_timer import RepeatingTimer
+from pyvclient.utils.bus_planner import AdaptiveInterval, BusPlanner
+from pyvclient.utils.history import HistoryStore
+from pyvclient.utils.rate_limit import CommandLimiter
+from pyvclient.utils.scheduler import IOWorker, Scheduler
+from pyvclient.utils.snapshot import Snapshot
 from pyvclient.ha.ha_viessmann_device import ViessmannDevice
 
 logger = logging.getLogger(__name__)
@@ -34,6 +40,21 @@ class UpdateCallback:
         self.properties.append(command)
 
 
+def poll_interval(name, props):
+    """Poll interval of a property, adaptive ones start at max_interval by default."""
+    interval = props.get('interval', props.get('max_interval'))
+    if interval is None:
+        raise ValueError(f"Property {name} needs an interval or a max_interval")
+    return interval
+
+
+def longest_interval(name, props):
+    """Longest time between two polls of a property, e.g. for message expiry."""
+    if 'min_interval' in props and 'max_interval' in props:
+        return props['max_interval']
+    return poll_interval(name, props)
+
+
 def _parse_line(line):
     for key, rx in rx_dict.items():
         match = rx.search(line)
@@ -45,52 +66,202 @@ def _parse_line(line):
 
 class PyVClient:
 
-    def __init__(self, vcomm, config):
+    def __init__(self, vcomm, config, name=None, base_topic='viessmann',
+                 properties=None, mqtt_client=None):
         self.vcomm = vcomm
         self.config = ObjectView(config)
-        self.properties = self.config.Properties
+        self.name = name
+        self.properties = properties or self.config.Properties
         self.precision = self.config.Precision
+        self.worker = IOWorker(f"vcomm-{name or 'vcontrold'}")
+        self.scheduler = None
+        self.planner = None
+        self.snapshot = self._create_snapshot(getattr(self.config, 'Snapshot', None))
+        saved = self.snapshot.load() if self.snapshot else None
         
-        # Try to get items, but don't fail if vcontrold is not available
-        try:
-            self.items = self._get_items()
-        except Exception as e:
-            logger.error(f"Failed to initialize items from vcontrold: {e}")
-            logger.info("Creating stub items from config - will update when vcontrold is available")
-            self.items = self._create_stub_items()
+        # Start from the snapshot without bus traffic if it covers all properties,
+        # otherwise get the items, but don't fail if vcontrold is not available
+        self.items = self._load_snapshot_items(saved)
+        if self.items is None:
+            try:
+                self.items = self._get_items()
+            except Exception as e:
+                logger.error(f"Failed to initialize items from vcontrold: {e}")
+                logger.info("Creating stub items from config - will update when vcontrold is available")
+                self.items = self._create_stub_items(saved)
         
         self.device = ViessmannDevice(
             list(self.items.values()),
             vcomm=vcomm,
-            mqtt_settings=self.config.MQTT_SETTINGS
+            mqtt_settings=self.config.MQTT_SETTINGS,
+            base_topic=base_topic,
+            mqtt_client=mqtt_client,
+            name=name,
+            derived=getattr(self.config, 'Derived', None)
         )
         self.device.start()
 
-    def _create_stub_items(self):
-        """Create stub items when vcontrold is not available."""
+        # only tell when values came from the snapshot, not live from vcontrold
+        if self.snapshot_time or any(getattr(item, 'stub', False) and item.value is not None
+                                     for item in self.items.values()):
+            self.device.publish_snapshot_time(saved['timestamp'])
+        if self.snapshot_time:
+            # replace the snapshot values by live ones as soon as possible
+            self.worker.submit(self._refresh_all)
+
+        self._recovery_timer = None
+        recovery = getattr(self.config, 'StubRecovery', None) or {}
+        self._recovery_initial_delay = recovery.get('initial_delay', 30)
+        self._recovery_delay = self._recovery_initial_delay
+        self._recovery_max_delay = recovery.get('max_delay', 1800)
+        if self._stub_names():
+            self._schedule_stub_recovery()
+
+        verification = getattr(self.config, 'SetVerification', None)
+        if verification is not None:
+            self.device.enable_verification(self.worker.submit,
+                                            (verification or {}).get('max_delay', 5.0),
+                                            self.next_poll)
+
+        limits = getattr(self.config, 'CommandLimits', None)
+        if limits is not None:
+            self.device.enable_command_limits(CommandLimiter(**(limits or {})))
+
+        self.history = None
+        history = getattr(self.config, 'History', None)
+        if history is not None:
+            self.history = HistoryStore(**(history or {}))
+            self.device.enable_history(self.history)
+
+    def _create_snapshot(self, settings):
+        if not settings:
+            return None
+        path = settings['path']
+        if self.name:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{self.name}{ext}"
+        return Snapshot(path, settings.get('max_age', 86400))
+
+    def _load_snapshot_items(self, saved):
+        """Items from the snapshot, None unless it holds real items of all properties."""
+        self.snapshot_time = None
+        if not saved:
+            return None
+        saved_items = saved['items']
+        if any(cmd not in saved_items or saved_items[cmd].get('stub')
+               for cmd in self.properties):
+            logger.info("Snapshot does not cover all properties, reading them from vcontrold")
+            return None
+
         items = {}
         for cmd in self.properties:
+            data = dict(saved_items[cmd])
+            data['settable'] = not self.properties[cmd]['readonly']
+            data['interval'] = longest_interval(cmd, self.properties[cmd])
+            items[cmd] = ObjectView(data)
+        self.snapshot_time = saved['timestamp']
+        logger.info(f"Loaded {len(items)} items from snapshot {self.snapshot.path}")
+        return items
+
+    def save_snapshot(self):
+        """
+        Save the items with their last published values. Runs on the worker
+        like reload, the copy of the items guards the save on shutdown.
+        """
+        items = {}
+        for name, item in list(self.items.items()):
+            data = dict(vars(item))
+            data['value'] = self.device.last_values.get(name, item.value)
+            items[name] = data
+        self.snapshot.save(items)
+
+    def _refresh_all(self):
+        self.device.update_properties(list(self.properties))
+
+    def _create_stub_items(self, saved=None, commands=None):
+        """
+        Create stub items when vcontrold is not available.
+        Values come from the snapshot if there is one, others stay unpublished.
+        """
+        saved_items = saved['items'] if saved else {}
+        items = {}
+        for cmd in commands or self.properties:
+            value = saved_items.get(cmd, {}).get('value')
             data = ObjectView({
                 'name': cmd,
                 'get_command': 'get' + cmd,
                 'settable': not self.properties[cmd]['readonly'],
+                'interval': longest_interval(cmd, self.properties[cmd]),
                 'type': 'short',  # Default type
                 'unit': '',
-                'value': 0,
-                'raw_value': '0'
+                'value': value,
+                'raw_value': None if value is None else str(value),
+                'stub': True
             })
             items[cmd] = data
         return items
 
-    def _get_items(self):
+    def _stub_names(self):
+        return [name for name, item in self.items.items() if getattr(item, 'stub', False)]
+
+    def _schedule_stub_recovery(self):
+        logger.info(f"Retrying metadata of stub items in {self._recovery_delay}s")
+        self._recovery_timer = threading.Timer(
+            self._recovery_delay, self.worker.submit, (self._recover_stub_items,))
+        self._recovery_timer.daemon = True
+        self._recovery_timer.start()
+
+    def _recover_stub_items(self):
+        """
+        Read the metadata of stub items and replace their entities.
+
+        Runs on the worker. Items vcontrold does not answer stay stubs and
+        are retried with a doubled delay, up to max_delay.
+        """
+        stubs = self._stub_names()
+        detail_commands = {cmd: 'detail get' + cmd for cmd in stubs}
+        commands = {cmd: 'get' + cmd for cmd in stubs}
+        try:
+            details = self.vcomm.process_commands(detail_commands.values())
+            values = self.vcomm.process_commands(commands.values())
+        except Exception as e:
+            logger.warning(f"Stub items not recovered: {e}")
+            details, values = {}, {}
+
+        recovered = []
+        for cmd in stubs:
+            detail = details.get(detail_commands[cmd])
+            value = values.get(commands[cmd])
+            if not (detail and value and any(_parse_line(line)[0] == 'type' for line in detail)):
+                continue
+            try:
+                item = self.parse_item(cmd, self.properties[cmd], detail, value[0])
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Failed to parse recovered item {cmd}: {e}")
+                continue
+            self.items[cmd] = item
+            recovered.append(item)
+
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} of {len(stubs)} stub items")
+            self.device.replace_entities(recovered)
+            self._recovery_delay = self._recovery_initial_delay
+        else:
+            self._recovery_delay = min(self._recovery_delay * 2, self._recovery_max_delay)
+
+        if self._stub_names():
+            self._schedule_stub_recovery()
+
+    def _get_items(self, properties=None):
+        properties = properties or list(self.properties)
         items = []
-        detail_commands = {cmd: 'detail get' + cmd for cmd in self.properties}
+        detail_commands = {cmd: 'detail get' + cmd for cmd in properties}
         details = self.vcomm.process_commands(detail_commands.values())
 
-        commands = {cmd: 'get' + cmd for cmd in self.properties}
+        commands = {cmd: 'get' + cmd for cmd in properties}
         values = self.vcomm.process_commands(commands.values())
 
-        for cmd in self.properties:
+        for cmd in properties:
             items.append(self.parse_item(cmd,
                                          self.properties.get(cmd),
                                          details.get(detail_commands[cmd]),
@@ -98,32 +269,138 @@ class PyVClient:
 
         return {item.name: item for item in items}
 
-    def update_properties(self, properties):
-        logger.debug(properties)
-        commands = {cmd: 'get' + cmd for cmd in properties}
-        values = self.vcomm.process_commands(commands.values())
-        for prop in properties:
-            value_raw = values.get(commands[prop])
-            self.heater.update_value(
-                prop,
-                self.parse_value(value_raw[0], self.items.get(prop)))
-
-    def setup_timers(self):
-        """Setup periodic update timers for properties."""
+    def setup_timers(self, scheduler=None, bus_budget=None, slot=5):
+        """
+        Setup periodic update timers for properties.
+
+        Without a bus budget or adaptive properties, properties with equal
+        intervals are polled together. Otherwise a BusPlanner spreads the
+        polls over slots and adapts the intervals of properties having a
+        min_interval and max_interval.
+        """
         logger.info("Setting up periodic update timers")
+        self.scheduler = scheduler or Scheduler()
+        self.bus_budget = bus_budget
+        self.slot = slot
+        if self.snapshot:
+            self.scheduler.add_job(self.config.Snapshot.get('interval', 300), self.save_snapshot,
+                                   self.worker)
+        self._setup_polls()
+
+    def _setup_polls(self, previous=None):
+        """
+        Add the poll jobs of all properties. Poll tasks of a previous
+        planner whose properties did not change keep their state.
+        """
+        bus_budget, slot = self.bus_budget, self.slot
+        self._poll_jobs = []
+        adaptive = {
+            prop: AdaptiveInterval(props['min_interval'], props['max_interval'],
+                                   props.get('change_threshold', 0.5))
+            for prop, props in self.properties.items()
+            if 'min_interval' in props and 'max_interval' in props
+        }
+        if bus_budget or adaptive:
+            bus_budget = bus_budget or 1.0
+            self.planner = BusPlanner(
+                self.device, self.vcomm,
+                {prop: poll_interval(prop, props) for prop, props in self.properties.items()},
+                budget=bus_budget,
+                slot=slot,
+                on_report=self.device.publish_bus_load,
+                adaptive=adaptive
+            )
+            for name in previous or ():
+                if name in self.planner.tasks:
+                    self.planner.tasks[name] = previous[name]
+            self.device.add_value_listener(self.planner.on_value)
+            self._poll_jobs.append(self.scheduler.add_job(slot, self.planner, self.worker))
+            logger.info(f"Polling within {bus_budget:.0%} of bus time, "
+                        f"planned utilization {self.planner.utilization:.0%}")
+            return
+
         callbacks = {}
         for prop in self.properties:
-            interval = self.properties[prop]['interval']
+            interval = poll_interval(prop, self.properties[prop])
             if interval not in callbacks:
                 callbacks[interval] = UpdateCallback(self.device)
             callbacks[interval].add_property(prop)
 
         for interval, callback in callbacks.items():
-            repeating_timer = RepeatingTimer(interval)
-            repeating_timer.add_callback(callback)
+            self._poll_jobs.append(self.scheduler.add_job(interval, callback, self.worker))
         
         logger.info(f"Setup {len(callbacks)} timers")
 
+    def next_poll(self):
+        """Monotonic time of the next poll batch, None if none is scheduled."""
+        if not self.scheduler:
+            return None
+        runs = [self.scheduler.next_run(job) for job in self._poll_jobs]
+        runs = [run for run in runs if run is not None]
+        if not runs:
+            return None
+        if self.planner:
+            return self.planner.next_batch(min(runs))
+        return min(runs)
+
+    def reload(self, properties):
+        """
+        Apply changed Properties without a restart.
+
+        Only added properties are read from vcontrold and only entities of
+        added, removed or changed properties are republished. The poll jobs
+        are regrouped in place. Runs on the worker.
+        """
+        added = [prop for prop in properties if prop not in self.properties]
+        removed = [prop for prop in self.properties if prop not in properties]
+        changed = [prop for prop in properties
+                   if prop in self.properties and properties[prop] != self.properties[prop]]
+        if not (added or removed or changed):
+            logger.info("Properties unchanged")
+            return
+        logger.info(f"Reloading properties: added {added}, removed {removed}, changed {changed}")
+
+        self.properties = properties
+        for prop in removed:
+            del self.items[prop]
+        self.device.remove_entities(removed)
+
+        replaced = []
+        for prop in changed:
+            item = self.items[prop]
+            item.interval = longest_interval(prop, properties[prop])
+            settable = not properties[prop]['readonly']
+            entity = self.device.entities.get(prop)
+            if item.settable != settable:
+                item.settable = settable
+                replaced.append(item)
+            elif entity:
+                entity.message_expiry = self.device._get_message_expiry(item)
+
+        if added:
+            try:
+                items = self._get_items(added)
+            except Exception as e:
+                logger.error(f"Failed to read added properties from vcontrold: {e}")
+                items = self._create_stub_items(commands=added)
+                if not self._recovery_timer or not self._recovery_timer.is_alive():
+                    self._schedule_stub_recovery()
+            self.items.update(items)
+            replaced.extend(items.values())
+        self.device.replace_entities(replaced)
+
+        if self.scheduler:
+            previous = None
+            if self.planner:
+                self.device.remove_value_listener(self.planner.on_value)
+                unchanged = set(properties) - set(added) - set(changed)
+                previous = {name: task for name, task in self.planner.tasks.items()
+                            if name in unchanged}
+                self.planner = None
+            for job in self._poll_jobs:
+                self.scheduler.remove_job(job)
+            self._setup_polls(previous)
+
     def parse_value(self, value, item):
         value = str(value).replace(item.unit, '').strip()
         if item.type == 'short':
@@ -143,7 +420,8 @@ class PyVClient:
         data = {
             'name': command,
             'get_command': get_command,
-            'settable': not props['readonly'] or False
+            'settable': not props['readonly'] or False,
+            'interval': longest_interval(command, props)
         }
 
         for line in detail:
@@ -0,0 +1,198 @@
+"""
+Poll planning within a bus time budget.
+"""
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveInterval:
+    """
+    Poll interval following how fast a value changes.
+
+    The interval is halved whenever the value changed by more than the
+    threshold since the last poll and grows by half while it stays flat,
+    always within min_interval and max_interval.
+    """
+
+    __slots__ = ('min_interval', 'max_interval', 'threshold', 'last_value')
+
+    def __init__(self, min_interval: float, max_interval: float, threshold: float = 0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold
+        self.last_value = None
+
+    def clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def changed(self, value: Any) -> bool:
+        last, self.last_value = self.last_value, value
+        if last is None:
+            return False
+        try:
+            return abs(float(value) - float(last)) > self.threshold
+        except (TypeError, ValueError):
+            return value != last
+
+    def next_interval(self, interval: float, value: Any) -> float:
+        if self.changed(value):
+            return self.clamp(interval / 2)
+        return self.clamp(interval * 1.5)
+
+
+class PollTask:
+    """Periodic poll of one property."""
+
+    __slots__ = ('name', 'interval', 'release', 'polled', 'adaptive')
+
+    def __init__(self, name: str, interval: float, release: float,
+                 adaptive: Optional[AdaptiveInterval] = None):
+        self.name = name
+        self.adaptive = adaptive
+        self.interval = adaptive.clamp(interval) if adaptive else interval
+        self.release = release
+        self.polled = None
+
+    @property
+    def deadline(self) -> float:
+        return self.release + self.interval
+
+
+class BusPlanner:
+    """
+    Polls properties earliest deadline first while keeping the share of
+    bus time used by polls within budget.
+
+    The planner is called once per slot. It takes the due polls in order of
+    their deadline until their measured cost fills the slot's share of the
+    budget, the rest of the slot is left to set commands. A poll taken after
+    its deadline, i.e. later than its interval, is reported as missed.
+    """
+
+    def __init__(
+        self,
+        device,
+        vcomm,
+        intervals: Dict[str, float],
+        budget: float = 0.5,
+        slot: float = 5,
+        default_cost: float = 0.5,
+        report_interval: float = 60,
+        on_report: Optional[Callable[[Dict[str, float]], None]] = None,
+        adaptive: Optional[Dict[str, AdaptiveInterval]] = None
+    ):
+        """
+        Initialize bus planner.
+
+        Args:
+            device: Device whose update_properties polls a list of properties
+            vcomm: VComm instance measuring command costs
+            intervals: Poll interval in seconds by property name
+            budget: Share of bus time polls may use (0..1)
+            slot: Seconds between two calls of the planner
+            default_cost: Assumed cost in seconds of a not yet measured command
+            report_interval: Seconds between two load reports
+            on_report: Called with the load report
+            adaptive: Adaptive intervals by property name, polled values
+                must be passed to on_value
+        """
+        self.device = device
+        self.vcomm = vcomm
+        self.budget = budget
+        self.slot = slot
+        self.default_cost = default_cost
+        self.report_interval = report_interval
+        self.on_report = on_report
+        self.missed = 0
+        self._overloaded = False
+        now = time.monotonic()
+        self._last_report = now
+        adaptive = adaptive or {}
+        self.tasks = {
+            name: PollTask(name, interval, now + interval, adaptive.get(name))
+            for name, interval in intervals.items()
+        }
+
+    def cost(self, name: str) -> float:
+        return self.vcomm.command_cost('get' + name, self.default_cost)
+
+    @property
+    def utilization(self) -> float:
+        """Share of bus time all polls need at their intervals."""
+        return sum(self.cost(name) / task.interval for name, task in self.tasks.items())
+
+    def __call__(self):
+        now = time.monotonic()
+        due = sorted((task for task in self.tasks.values() if task.release <= now),
+                     key=lambda task: task.deadline)
+
+        capacity = self.slot * self.budget
+        batch = []
+        for task in due:
+            cost = self.cost(task.name)
+            # a single command costing more than a slot must not starve
+            if batch and cost > capacity:
+                break
+            capacity -= cost
+            batch.append(task)
+
+        for task in batch:
+            if now > task.deadline:
+                self.missed += 1
+                logger.warning("Poll of %s missed its deadline by %.1fs",
+                               task.name, now - task.deadline)
+            task.polled = now
+            task.release += task.interval
+            if task.deadline < now:
+                # more than one interval behind, restart the period
+                task.release = now
+
+        if batch:
+            self.device.update_properties([task.name for task in batch])
+
+        self._report(now)
+
+    def next_batch(self, next_run: float) -> Optional[float]:
+        """
+        Monotonic time of the first call from next_run on that polls anything,
+        the planner being called every slot seconds.
+        """
+        if not self.tasks:
+            return None
+        release = min(task.release for task in self.tasks.values())
+        if release <= next_run:
+            return next_run
+        return next_run + math.ceil((release - next_run) / self.slot) * self.slot
+
+    def on_value(self, name: str, value: Any):
+        """Adapt the interval of an adaptive property to its polled value."""
+        task = self.tasks.get(name)
+        if not (task and task.adaptive and task.polled is not None):
+            return
+        interval = task.adaptive.next_interval(task.interval, value)
+        if interval != task.interval:
+            logger.debug("Poll interval of %s changed to %.0fs", name, interval)
+            task.interval = interval
+            task.release = task.polled + interval
+
+    def _report(self, now: float):
+        utilization = self.utilization
+        overloaded = utilization > self.budget
+        if overloaded and not self._overloaded:
+            logger.warning(f"Polls need {utilization:.0%} of bus time, budget is "
+                           f"{self.budget:.0%}; polls will miss their intervals")
+        self._overloaded = overloaded
+
+        if now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        if self.on_report:
+            self.on_report({
+                'utilization': round(utilization, 3),
+                'budget': self.budget,
+                'missed_deadlines': self.missed,
+            })
@@ -0,0 +1,126 @@
+"""
+Incremental statistics over polled values for derived sensors.
+"""
+import datetime
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RollingMean:
+    """Mean over a time window, kept as a running sum."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples = deque()
+        self.total = 0.0
+
+    def add(self, timestamp: float, value: float) -> Optional[float]:
+        self.samples.append((timestamp, value))
+        self.total += value
+        while self.samples[0][0] <= timestamp - self.window:
+            self.total -= self.samples.popleft()[1]
+        return self.total / len(self.samples)
+
+
+class RollingExtreme:
+    """
+    Minimum or maximum over a time window.
+
+    Keeps a monotonic deque: samples that can never become the extreme
+    again are dropped on arrival, so each sample is added and removed once.
+    """
+
+    def __init__(self, window: float, maximum: bool):
+        self.window = window
+        self.maximum = maximum
+        self.samples = deque()
+
+    def add(self, timestamp: float, value: float) -> Optional[float]:
+        while self.samples and (self.samples[-1][1] <= value if self.maximum
+                                else self.samples[-1][1] >= value):
+            self.samples.pop()
+        self.samples.append((timestamp, value))
+        while self.samples[0][0] <= timestamp - self.window:
+            self.samples.popleft()
+        return self.samples[0][1]
+
+
+class DailyDelta:
+    """Increase of a counter since local midnight, e.g. burner starts per day."""
+
+    def __init__(self):
+        self.day = None
+        self.start = None
+
+    def add(self, timestamp: float, value: float) -> Optional[float]:
+        day = datetime.date.fromtimestamp(timestamp)
+        if day != self.day or self.start is None or value < self.start:
+            self.day = day
+            self.start = value
+        return value - self.start
+
+
+class Rate:
+    """Change per period (default per hour) between consecutive samples."""
+
+    def __init__(self, period: float = 3600):
+        self.period = period
+        self.last = None
+
+    def add(self, timestamp: float, value: float) -> Optional[float]:
+        last, self.last = self.last, (timestamp, value)
+        if last is None or timestamp <= last[0]:
+            return None
+        return (value - last[1]) / (timestamp - last[0]) * self.period
+
+
+FUNCTIONS = ('min', 'max', 'mean', 'daily_delta', 'rate')
+
+
+def create_statistic(function: str, window: float = 3600, period: float = 3600):
+    if function in ('mean', 'min', 'max') and not window > 0:
+        raise ValueError(f"Window of derived function {function!r} must be positive, got {window!r}")
+    if function == 'mean':
+        return RollingMean(window)
+    if function in ('min', 'max'):
+        return RollingExtreme(window, function == 'max')
+    if function == 'daily_delta':
+        return DailyDelta()
+    if function == 'rate':
+        return Rate(period)
+    raise ValueError(f"Unknown derived function {function!r}, expected one of {FUNCTIONS}")
+
+
+class DerivedSensor:
+    """Value computed from the samples of a source entity."""
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        """
+        Args:
+            name: Name of the derived entity
+            config: Derived sensor definition with source, function and
+                optional window, period, unit and precision
+        """
+        self.name = name
+        self.source = config['source']
+        self.function = config['function']
+        self.unit = config.get('unit')
+        self.precision = config.get('precision', 0 if self.function == 'daily_delta' else 2)
+        self.statistic = create_statistic(self.function,
+                                          config.get('window', 3600),
+                                          config.get('period', 3600))
+
+    def add(self, value: Any, timestamp: Optional[float] = None) -> Optional[float]:
+        """Add a sample of the source, returns the new derived value if any."""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        result = self.statistic.add(time.time() if timestamp is None else timestamp, value)
+        if result is None:
+            return None
+        return round(result, self.precision) if self.precision else round(result)
@@ -0,0 +1,149 @@
+"""
+In-process history of polled values in fixed-size ring buffers.
+"""
+import logging
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('raw', 'minute', 'hour')
+RESOLUTIONS = {'minute': 60, 'hour': 3600}
+
+
+class RingBuffer:
+    """Fixed number of rows of float columns, overwriting the oldest row."""
+
+    def __init__(self, capacity: int, columns: int):
+        self.capacity = capacity
+        self.columns = [array('d', bytes(8 * capacity)) for _ in range(columns)]
+        self.head = 0
+        self.count = 0
+
+    def append(self, *row: float):
+        for column, value in zip(self.columns, row):
+            column[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def rows(self, since: float = 0) -> List[tuple]:
+        """Rows oldest first whose first column is at least since."""
+        start = (self.head - self.count) % self.capacity
+        rows = []
+        for i in range(self.count):
+            index = (start + i) % self.capacity
+            if self.columns[0][index] >= since:
+                rows.append(tuple(column[index] for column in self.columns))
+        return rows
+
+
+class Aggregate:
+    """Min, max and mean of the samples of one time bucket."""
+
+    __slots__ = ('bucket', 'minimum', 'maximum', 'total', 'count')
+
+    def __init__(self, bucket: float):
+        self.bucket = bucket
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value: float):
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.total += value
+        self.count += 1
+
+    def row(self) -> tuple:
+        return self.bucket, self.total / self.count, self.minimum, self.maximum
+
+
+class SeriesHistory:
+    """
+    History of one entity: raw samples plus per minute and per hour
+    aggregates of (timestamp, mean, min, max).
+    """
+
+    def __init__(self, raw: int = 720, minute: int = 1440, hour: int = 2160):
+        self.buffers = {
+            'raw': RingBuffer(raw, 2),
+            'minute': RingBuffer(minute, 4),
+            'hour': RingBuffer(hour, 4),
+        }
+        self._aggregates: Dict[str, Optional[Aggregate]] = {'minute': None, 'hour': None}
+
+    def add(self, timestamp: float, value: float):
+        self.buffers['raw'].append(timestamp, value)
+        for tier, resolution in RESOLUTIONS.items():
+            bucket = timestamp - timestamp % resolution
+            aggregate = self._aggregates[tier]
+            if aggregate is not None and aggregate.bucket != bucket:
+                self.buffers[tier].append(*aggregate.row())
+                aggregate = None
+            if aggregate is None:
+                aggregate = self._aggregates[tier] = Aggregate(bucket)
+            aggregate.add(value)
+
+    def query(self, tier: str, since: float = 0) -> List[tuple]:
+        rows = self.buffers[tier].rows(since)
+        aggregate = self._aggregates.get(tier)
+        if aggregate is not None and aggregate.bucket >= since:
+            # the running bucket is not in the buffer yet
+            rows.append(aggregate.row())
+        return rows
+
+
+class HistoryStore:
+    """History of all numeric values of a device."""
+
+    def __init__(self, raw: int = 720, minute: int = 1440, hour: int = 2160):
+        """
+        Initialize history store.
+
+        Args:
+            raw: Number of raw samples kept per entity
+            minute: Number of per minute aggregates kept per entity
+            hour: Number of per hour aggregates kept per entity
+        """
+        self.sizes = {'raw': raw, 'minute': minute, 'hour': hour}
+        self.series: Dict[str, SeriesHistory] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: Any, timestamp: Optional[float] = None):
+        """Value listener: record numeric values, skip all others."""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            if name not in self.series:
+                self.series[name] = SeriesHistory(**self.sizes)
+            self.series[name].add(time.time() if timestamp is None else timestamp, value)
+
+    def query(self, name: str, tier: str = 'raw', since: float = 0) -> List[tuple]:
+        if tier not in TIERS:
+            raise ValueError(f"Unknown history tier {tier!r}")
+        with self._lock:
+            series = self.series.get(name)
+            return series.query(tier, since) if series else []
+
+    def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Answer a history request.
+
+        The request names the entity and optionally the tier (raw, minute,
+        hour) and the timestamp of the oldest row wanted, e.g.
+        {"entity": "TempA", "tier": "minute", "since": 1700000000}.
+        Raw rows are [timestamp, value], aggregate rows
+        [timestamp, mean, min, max].
+        """
+        name = request['entity']
+        tier = request.get('tier', 'raw')
+        return {
+            'entity': name,
+            'tier': tier,
+            'rows': [list(row) for row in self.query(name, tier, request.get('since', 0))],
+        }
@@ -0,0 +1,270 @@
+"""
+MQTT load generator driving a running pyvclient daemon through its broker.
+"""
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import click
+
+
+class Target:
+    """
+    Settable entity found by its discovery config.
+
+    Commands alternate between the last state and a neighbouring value. A
+    command only counts as acknowledged by a state publish that changes the
+    state, so polls publishing an unchanged state never acknowledge one.
+    """
+
+    def __init__(self, config: dict):
+        self.name = config.get('name') or config['command_topic']
+        self.command_topic = config['command_topic']
+        self.state_topic = config['state_topic']
+        self.options = config.get('options')
+        self.step = config.get('step', 1)
+        self.maximum = config.get('max')
+        self.original: Optional[str] = None
+        self.state: Optional[str] = None
+        self.pending: deque = deque()
+        self.sent = 0
+
+    def usable(self) -> bool:
+        """Whether neighbouring values of the state are known."""
+        if self.state is None:
+            return False
+        if self.options:
+            return self.state in self.options
+        try:
+            float(self.state)
+        except ValueError:
+            return False
+        return True
+
+    def _neighbour(self, value: str) -> str:
+        if self.options:
+            position = self.options.index(value) if value in self.options else -1
+            return self.options[(position + 1) % len(self.options)]
+        number = float(value)
+        other = number + self.step
+        if self.maximum is not None and other > self.maximum:
+            other = number - self.step
+        return str(round(other, 3))
+
+    def alternate(self) -> str:
+        """Value differing from the state expected once pending commands are set."""
+        expected = self.pending[-1][0] if self.pending else self.state
+        self.sent += 1
+        if _same(expected, self.state):
+            return self._neighbour(self.state)
+        return self.state
+
+    def acknowledged(self, payload: str) -> Optional[float]:
+        """Send time of the command acknowledged by a state publish, if any."""
+        previous, self.state = self.state, payload
+        if self.pending and not _same(previous, payload) and _same(self.pending[0][0], payload):
+            return self.pending.popleft()[1]
+        return None
+
+
+def _same(sent: str, state: str) -> bool:
+    try:
+        return abs(float(sent) - float(state)) < 1e-6
+    except ValueError:
+        return sent == state
+
+
+class LoadGenerator:
+    """Sends commands, matches the state publishes acknowledging them."""
+
+    def __init__(self, client, timeout: float):
+        self.client = client
+        self.timeout = timeout
+        self.targets: Dict[str, Target] = {}
+        self.latencies: List[float] = []
+        self.dropped = 0
+        self.backlog: List[int] = []
+        self.last_ack = 0.0
+        self._lock = threading.Lock()
+        client.on_message = self._on_message
+
+    def _on_message(self, client, userdata, msg):
+        payload = msg.payload.decode('utf-8', 'replace')
+        if msg.topic.startswith('homeassistant/') and msg.topic.endswith('/config'):
+            try:
+                config = json.loads(payload)
+            except ValueError:
+                return
+            if config.get('command_topic') and config.get('state_topic'):
+                with self._lock:
+                    if config['state_topic'] not in self.targets:
+                        self.targets[config['state_topic']] = Target(config)
+                        client.subscribe(config['state_topic'])
+            return
+        now = time.monotonic()
+        with self._lock:
+            target = self.targets.get(msg.topic)
+            if not target:
+                return
+            if target.original is None:
+                target.original = target.state = payload
+                return
+            sent = target.acknowledged(payload)
+            if sent is not None:
+                self.latencies.append(now - sent)
+                self.last_ack = now
+
+    def send(self, target: Target, value: Optional[str] = None):
+        with self._lock:
+            value = value if value is not None else target.alternate()
+            target.pending.append((value, time.monotonic()))
+        self.client.publish(target.command_topic, value, qos=1)
+
+    def expire(self):
+        """Count commands unacknowledged within the timeout as dropped."""
+        now = time.monotonic()
+        with self._lock:
+            waiting = 0
+            for target in self.targets.values():
+                while target.pending and now - target.pending[0][1] > self.timeout:
+                    target.pending.popleft()
+                    self.dropped += 1
+                waiting += len(target.pending)
+            self.backlog.append(waiting)
+
+
+def takeover(broker: str, port: int, client_id: str, username=None, password=None):
+    """
+    Disconnect the daemon by connecting with its client id, the broker then
+    drops the daemon's connection and paho reconnects it.
+    """
+    import paho.mqtt.client as mqtt
+
+    intruder = mqtt.Client(client_id=client_id)
+    if username:
+        intruder.username_pw_set(username, password)
+    intruder.connect(broker, port)
+    intruder.loop(1)
+    intruder.disconnect()
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+@click.command()
+@click.option('--config', '-c', 'config_file', type=click.Path(exists=True, dir_okay=False),
+              default=None, help=u'daemon config to take the MQTT settings from')
+@click.option('--broker', '-b', default=None, type=str, help=u'MQTT broker')
+@click.option('--port', '-p', default=None, type=int, help=u'MQTT port')
+@click.option('--rate', '-r', default=2.0, type=float, show_default=True,
+              help=u'commands per second')
+@click.option('--burst', default=1, type=int, show_default=True,
+              help=u'commands sent at once, each to another entity')
+@click.option('--duration', '-d', default=60.0, type=float, show_default=True,
+              help=u'seconds to send commands')
+@click.option('--timeout', default=30.0, type=float, show_default=True,
+              help=u'seconds after which an unacknowledged command counts as dropped')
+@click.option('--entity', '-e', multiple=True, help=u'command topic or entity name, may be repeated')
+@click.option('--discovery-time', default=5.0, type=float, show_default=True,
+              help=u'seconds to collect discovery configs and current states')
+@click.option('--takeover-interval', default=0.0, type=float, show_default=True,
+              help=u'seconds between forced reconnects of the daemon, 0 for none')
+@click.option('--daemon-client-id', default=None, type=str,
+              help=u'MQTT client id of the daemon, defaults to MQTT_CLIENT_ID of the config '
+                   u'or viessmann_vcontrold')
+@click.option('--yes', is_flag=True, help=u'do not ask before sending commands')
+def load(config_file, broker, port, rate, burst, duration, timeout, entity,
+         discovery_time, takeover_interval, daemon_client_id, yes):
+    """ send command storms to a running pyvclient and measure acknowledgements """
+    import paho.mqtt.client as mqtt
+    import yaml
+
+    settings = {}
+    if config_file:
+        with open(config_file) as f:
+            settings = yaml.safe_load(f).get('MQTT_SETTINGS', {})
+    broker = broker or settings.get('MQTT_BROKER', 'localhost')
+    port = port or settings.get('MQTT_PORT', 1883)
+    username, password = settings.get('MQTT_USERNAME'), settings.get('MQTT_PASSWORD')
+    # same default as the daemon's HAMqttClient
+    daemon_client_id = daemon_client_id or settings.get('MQTT_CLIENT_ID') or 'viessmann_vcontrold'
+
+    client = mqtt.Client(client_id=f"pyvclient-load-{os.getpid()}")
+    if username:
+        client.username_pw_set(username, password)
+    generator = LoadGenerator(client, timeout)
+    client.connect(broker, port)
+    client.loop_start()
+    client.subscribe('homeassistant/#')
+    time.sleep(discovery_time)
+
+    targets = [target for target in generator.targets.values()
+               if target.usable() and
+               (not entity or target.command_topic in entity or target.name in entity)]
+    unknown = [t.name for t in generator.targets.values() if not t.usable()]
+    if unknown:
+        click.echo(f"Skipping entities without a numeric or known state: {', '.join(unknown)}",
+                   err=True)
+    if not targets:
+        raise click.ClickException('No settable entity with a known state found')
+    click.echo(f"Sending {rate}/s in bursts of {burst} to: {', '.join(t.name for t in targets)}")
+    if not yes:
+        click.confirm('Values alternate by one step around their last state and are '
+                      'restored at the end. Continue?', abort=True)
+
+    recoveries = []
+    start = time.monotonic()
+    next_send = next_takeover = start
+    if takeover_interval:
+        next_takeover += takeover_interval
+    takeover_at = None
+    try:
+        while time.monotonic() - start < duration:
+            now = time.monotonic()
+            if takeover_at is not None and generator.last_ack > takeover_at:
+                recoveries.append(generator.last_ack - takeover_at)
+                takeover_at = None
+            if takeover_interval and now >= next_takeover:
+                takeover(broker, port, daemon_client_id, username, password)
+                takeover_at = time.monotonic()
+                next_takeover += takeover_interval
+            if now >= next_send:
+                for target in random.sample(targets, min(burst, len(targets))):
+                    generator.send(target)
+                next_send += burst / rate
+                generator.expire()
+            time.sleep(min(0.05, max(next_send - time.monotonic(), 0)))
+        generator.expire()
+        backlog_at_end = generator.backlog[-1]
+    finally:
+        restored = 0
+        for target in targets:
+            # a restore not changing the state could not be acknowledged
+            if target.pending or not _same(target.state, target.original):
+                generator.send(target, target.original)
+                restored += 1
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(t.pending for t in targets):
+            time.sleep(0.1)
+        generator.expire()
+        client.loop_stop()
+        client.disconnect()
+
+    latencies = generator.latencies
+    sent = sum(target.sent for target in targets) + restored
+    click.echo(f"sent {sent}, acknowledged {len(latencies)}, dropped {generator.dropped}, "
+               f"backlog max {max(generator.backlog, default=0)}, {backlog_at_end} when sending stopped")
+    if latencies:
+        click.echo(f"latency p50 {statistics.median(latencies):.3f}s, "
+                   f"p95 {percentile(latencies, 0.95):.3f}s, "
+                   f"p99 {percentile(latencies, 0.99):.3f}s, max {max(latencies):.3f}s")
+    if recoveries:
+        click.echo(f"{len(recoveries)} reconnects, recovered after "
+                   f"{statistics.median(recoveries):.1f}s median, {max(recoveries):.1f}s max")
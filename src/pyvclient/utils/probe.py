@@ -0,0 +1,99 @@
+"""
+Detect the commands a running vcontrold instance actually answers.
+"""
+import click
+
+from pyvclient.utils.utils import fit_intervals, suggest_interval
+from pyvclient.vcomm.vcomm import VComm
+
+
+def get_command_names(lines):
+    """ Names of the get commands in the output of vcontrold's commands """
+
+    names = []
+    for line in lines:
+        name = line.split(':', 1)[0].strip()
+        if name.startswith('get') and ' ' not in name:
+            names.append(name)
+    return names
+
+
+def is_answered(lines):
+    return bool(lines) and not any(line.startswith('ERR') for line in lines)
+
+
+def get_detail(lines):
+    # the daemon module pulls in the MQTT client, load it only when probing
+    from pyvclient.pyvclient import rx_dict
+
+    detail = {'type': None, 'entity': None}
+    for line in lines:
+        match = rx_dict['type'].search(line)
+        if match:
+            detail['type'] = match.group('type').strip()
+        match = rx_dict['unit'].search(line)
+        if match:
+            detail['entity'] = match.group('unit').strip()
+    return detail
+
+
+def probe_commands(vcomm, names, window=32):
+    """ Probes every command with detail and get in one pipelined session.
+        Returns {name: (answered, seconds, detail)} where seconds is the
+        measured latency of the get command
+    """
+
+    commands = []
+    for name in names:
+        commands.extend(('detail ' + name, name))
+    results = vcomm.process_pipelined(commands, window)
+
+    probed = {}
+    for name in names:
+        detail_lines, _ = results['detail ' + name]
+        lines, seconds = results[name]
+        probed[name] = (is_answered(detail_lines) and is_answered(lines),
+                        seconds, get_detail(detail_lines))
+    return probed
+
+
+@click.command()
+@click.option('--host', '-h', default='localhost', type=str, help=u'vcontrold host')
+@click.option('--port', '-p', default=3002, type=int, help=u'vcontrold port')
+@click.option('--budget', '-b', default=6.0, type=float, show_default=True,
+              help=u'bus time in seconds per minute all polls may use')
+@click.argument('pyconf_file_out', type=click.File(mode='w'))
+def probe(host, port, budget, pyconf_file_out):
+    """ probe a running vcontrold and write Properties of the working commands """
+    import yaml
+
+    vcomm = VComm(host=host, port=port)
+    commands = vcomm.get_commands()['commands']
+    names = get_command_names(commands)
+    settable = {line.split(':', 1)[0].strip()[3:]
+                for line in commands if line.startswith('set')}
+    click.echo(f'Probing {len(names)} commands on {host}:{port}')
+
+    probed = probe_commands(vcomm, names)
+
+    costs = {}
+    intervals = {}
+    for name, (answered, seconds, detail) in probed.items():
+        click.echo(f'{name:40} {"ok" if answered else "unsupported":12} '
+                   f'{seconds * 1000:8.1f} ms')
+        if answered:
+            costs[name[3:]] = seconds
+            intervals[name[3:]] = suggest_interval(name[3:], detail)
+    intervals, load = fit_intervals(costs, intervals, budget)
+
+    properties = {
+        name: {
+            'readonly': name not in settable,
+            'interval': intervals[name],
+        }
+        for name in costs
+    }
+    print(yaml.dump({'Properties': properties}, allow_unicode=True, sort_keys=False),
+          file=pyconf_file_out)
+    click.echo(f'{len(properties)} of {len(names)} commands answered, '
+               f'measured bus time {load:.1f}s per minute (budget {budget}s)')
@@ -0,0 +1,161 @@
+"""
+On-demand profiling of the running daemon: stack sampling of all threads,
+memory allocation diffs and thread stack dumps written to files.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = ('start', 'stop', 'toggle', 'memory', 'threads')
+
+
+def _thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _stack(frame):
+    """Collapsed stack of frame, outermost call first."""
+    calls = []
+    while frame is not None:
+        code = frame.f_code
+        calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(calls))
+
+
+class Profiler:
+    """
+    Profiles all threads of the process, including the timer threads, the
+    I/O workers and the paho loop.
+
+    Profiling samples the stacks of all threads every interval seconds, so
+    time spent waiting for the VComm lock or in slow callbacks shows up as
+    well. Samples are written as collapsed stacks, one line per stack with
+    its count, ready for flame graph tools. Memory snapshots are compared
+    with the previous one; the first snapshot starts tracemalloc.
+    """
+
+    def __init__(self, directory: str, interval: float = 0.01, memory_frames: int = 10):
+        """
+        Initialize profiler.
+
+        Args:
+            directory: Directory the result files are written to
+            interval: Seconds between two stack samples
+            memory_frames: Frames stored per memory allocation
+        """
+        self.directory = directory
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self._samples: Counter = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._started = None
+        self._memory_snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None
+
+    def _path(self, kind: str, extension: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory,
+                            f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+    def start(self):
+        """Start sampling the stacks of all threads."""
+        with self._lock:
+            if self._sampler:
+                return
+            self._samples.clear()
+            self._stop.clear()
+            self._started = time.monotonic()
+            self._sampler = threading.Thread(target=self._sample, name='profiler', daemon=True)
+            self._sampler.start()
+        logger.info("Profiling started")
+
+    def stop(self) -> Optional[str]:
+        """Stop sampling and write the collapsed stacks, returns the file."""
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+            if not sampler:
+                return None
+            self._stop.set()
+        sampler.join()
+        path = self._path('profile', 'folded')
+        with open(path, 'w') as f:
+            for stack, count in self._samples.most_common():
+                print(f"{stack} {count}", file=f)
+        logger.info("Profiled %.1fs, %d samples written to %s",
+                    time.monotonic() - self._started, sum(self._samples.values()), path)
+        return path
+
+    def toggle(self) -> Optional[str]:
+        """Start profiling, or stop it if running."""
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = _thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._samples[f"{names.get(ident, ident)};{_stack(frame)}"] += 1
+
+    def memory(self) -> Optional[str]:
+        """
+        Write the allocations grown since the previous snapshot, returns
+        the file. The first call starts tracing and only takes a baseline.
+        """
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.memory_frames)
+            self._memory_snapshot = tracemalloc.take_snapshot()
+            logger.info("Memory tracing started, request another snapshot for a diff")
+            return None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+        previous, self._memory_snapshot = self._memory_snapshot, snapshot
+        path = self._path('memory', 'txt')
+        with open(path, 'w') as f:
+            current, peak = tracemalloc.get_traced_memory()
+            print(f"traced: {current} bytes, peak: {peak} bytes", file=f)
+            for stat in snapshot.compare_to(previous, 'traceback')[:50]:
+                print(stat, file=f)
+                for line in stat.traceback.format():
+                    print(line, file=f)
+        logger.info("Memory diff written to %s", path)
+        return path
+
+    def threads(self) -> str:
+        """Write the stacks of all threads, returns the file."""
+        names = _thread_names()
+        path = self._path('threads', 'txt')
+        with open(path, 'w') as f:
+            for ident, frame in sys._current_frames().items():
+                print(f"Thread {names.get(ident, '?')} ({ident}):", file=f)
+                f.writelines(traceback.format_stack(frame))
+                print(file=f)
+        logger.info("Thread stacks written to %s", path)
+        return path
+
+    def handle_command(self, command: str) -> Optional[str]:
+        """Run one of COMMANDS, returns the file written if any."""
+        command = command.strip().lower()
+        if command not in COMMANDS:
+            logger.error("Unknown profiling command %r, expected one of %s", command, COMMANDS)
+            return None
+        return getattr(self, command)()
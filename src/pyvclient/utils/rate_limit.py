@@ -0,0 +1,129 @@
+"""
+Rate limits of set commands, keeping a share of the bus for polls.
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Tokens refilled at rate per second up to burst.
+
+    Tokens may be taken beyond zero, e.g. for a cost known only afterwards;
+    the debt is paid off by the refill before anything else is admitted.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait(self, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until cost tokens are available, 0 if they are."""
+        self._refill(now or time.monotonic())
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1.0, now: Optional[float] = None):
+        self._refill(now or time.monotonic())
+        self.tokens -= cost
+
+
+class CommandLimiter:
+    """
+    Per entity and global limits of set commands plus a minimum share of
+    bus time left to polls.
+
+    The bus time of set sessions is charged after the fact; once commands
+    used more than their share over the last window seconds, further
+    commands wait until polls had their share.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: float = 1,
+        global_rate: Optional[float] = None,
+        global_burst: Optional[float] = None,
+        poll_share: Optional[float] = None,
+        window: float = 60,
+        coalesce: bool = False
+    ):
+        """
+        Initialize command limiter.
+
+        Args:
+            rate: Commands per second per entity, None for no limit
+            burst: Commands an entity may send at once
+            global_rate: Commands per second of all entities, None for no limit
+            global_burst: Commands all entities may send at once, defaults to
+                global_rate
+            poll_share: Share of bus time kept for polls (0..1), None for none
+            window: Seconds over which the bus time of commands is balanced
+            coalesce: Apply the latest command over the limit once allowed
+                instead of rejecting it
+        """
+        self.rate = rate
+        self.burst = burst
+        self.coalesce = coalesce
+        self.global_bucket = None
+        if global_rate:
+            self.global_bucket = TokenBucket(global_rate, global_burst or global_rate)
+        self.bus_bucket = None
+        if poll_share is not None:
+            share = 1 - poll_share
+            self.bus_bucket = TokenBucket(share, share * window)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def admit(self, name: str) -> Tuple[float, Optional[str]]:
+        """
+        Take the tokens of a command of entity name if all limits allow it.
+
+        Returns:
+            (0, None) if admitted, otherwise the seconds until the command
+            would be admitted and the limit it exceeds: entity_rate,
+            global_rate or poll_share
+        """
+        with self._lock:
+            now = time.monotonic()
+            checks = []
+            if self.rate:
+                bucket = self._buckets.get(name)
+                if bucket is None:
+                    bucket = self._buckets[name] = TokenBucket(self.rate, self.burst)
+                checks.append((bucket, 1.0, 'entity_rate'))
+            if self.global_bucket:
+                checks.append((self.global_bucket, 1.0, 'global_rate'))
+            if self.bus_bucket:
+                # the cost of a session is only known afterwards
+                checks.append((self.bus_bucket, 0.0, 'poll_share'))
+
+            wait, reason = max(((bucket.wait(cost, now), reason)
+                                for bucket, cost, reason in checks), default=(0.0, None))
+            if wait > 0:
+                return wait, reason
+            for bucket, cost, _ in checks:
+                bucket.take(cost, now)
+            return 0.0, None
+
+    def charge(self, seconds: float):
+        """Charge the bus time of a set session."""
+        if self.bus_bucket:
+            with self._lock:
+                self.bus_bucket.take(seconds)
+
+    def forget(self, name: str):
+        """Drop the bucket of a removed entity."""
+        with self._lock:
+            self._buckets.pop(name, None)
@@ -3,6 +3,7 @@ Repeating timer utility for periodic updates.
 """
 import logging
 import threading
+import time
 from typing import List, Callable
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,8 @@ class RepeatingTimer:
         self.callbacks: List[Callable] = []
         self.timer: threading.Timer = None
         self.running = False
+        # monotonic time of the next execution while running
+        self.next_run: float = None
         
     def add_callback(self, callback: Callable):
         """Add callback function to be executed."""
@@ -29,6 +32,11 @@ class RepeatingTimer:
         if not self.running:
             self.start()
     
+    def remove_callback(self, callback: Callable):
+        """Remove callback function, the timer keeps running."""
+        # replace the list, _execute may be iterating the old one
+        self.callbacks = [c for c in self.callbacks if c is not callback]
+    
     def start(self):
         """Start the repeating timer."""
         if not self.running:
@@ -46,6 +54,7 @@ class RepeatingTimer:
     def _schedule(self):
         """Schedule next execution."""
         if self.running:
+            self.next_run = time.monotonic() + self.interval
             self.timer = threading.Timer(self.interval, self._execute)
             self.timer.daemon = True
             self.timer.start()
@@ -56,7 +65,7 @@ class RepeatingTimer:
             try:
                 callback()
             except Exception as e:
-                logger.error(f"Error executing timer callback: {e}", exc_info=True)
+                logger.error("Error executing timer callback: %s", e, exc_info=True)
         
         # Schedule next execution
         if self.running:
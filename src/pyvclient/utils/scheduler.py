@@ -0,0 +1,107 @@
+"""
+Shared poll scheduler and per-endpoint I/O workers.
+"""
+import logging
+import queue
+import threading
+from typing import Callable, Dict
+
+from pyvclient.utils.repeating_timer import RepeatingTimer
+
+logger = logging.getLogger(__name__)
+
+
+class IOWorker:
+    """Executes jobs for one vcontrold endpoint on a dedicated thread."""
+
+    def __init__(self, name: str):
+        """
+        Initialize I/O worker.
+
+        Args:
+            name: Name of the worker thread
+        """
+        self.name = name
+        self._queue: queue.Queue = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Callable):
+        """
+        Queue job for execution.
+
+        A job that is still queued is not queued a second time, so a slow
+        endpoint does not build up a backlog of identical polls.
+        """
+        with self._pending_lock:
+            if job in self._pending:
+                logger.debug("Job %s still pending on %s, skipping", job, self.name)
+                return
+            self._pending.add(job)
+        self._queue.put(job)
+
+    def stop(self):
+        """Stop the worker after the queued jobs are done."""
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            with self._pending_lock:
+                self._pending.discard(job)
+            try:
+                job()
+            except Exception as e:
+                logger.error("Error executing job on %s: %s", self.name, e, exc_info=True)
+
+
+class Scheduler:
+    """Shares one repeating timer per interval between all pollers."""
+
+    def __init__(self):
+        self.timers: Dict[int, RepeatingTimer] = {}
+
+    def add_job(self, interval: int, callback: Callable, worker: IOWorker = None):
+        """
+        Run callback every interval seconds.
+
+        Args:
+            interval: Interval in seconds
+            callback: Function to execute
+            worker: Optional worker the callback is handed over to
+
+        Returns:
+            Handle for remove_job
+        """
+        if worker:
+            job = callback
+            callback = lambda: worker.submit(job)  # noqa: E731
+        if interval not in self.timers:
+            self.timers[interval] = RepeatingTimer(interval)
+        self.timers[interval].add_callback(callback)
+        return interval, callback
+
+    def remove_job(self, handle):
+        """Stop running a job added with add_job, its timer stops once unused."""
+        interval, callback = handle
+        timer = self.timers.get(interval)
+        if not timer:
+            return
+        timer.remove_callback(callback)
+        if not timer.callbacks:
+            timer.stop()
+            del self.timers[interval]
+
+    def next_run(self, handle):
+        """Monotonic time a job added with add_job runs next, None if unknown."""
+        timer = self.timers.get(handle[0])
+        return timer.next_run if timer and timer.running else None
+
+    def stop(self):
+        """Stop all timers."""
+        for timer in self.timers.values():
+            timer.stop()
@@ -0,0 +1,57 @@
+"""
+Snapshot file of the last known items and values of a device.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """
+    JSON file holding item metadata and last values, written atomically
+    so a crash while saving never leaves a truncated snapshot behind.
+    """
+
+    def __init__(self, path: str, max_age: Optional[float] = None):
+        """
+        Args:
+            path: Snapshot file
+            max_age: Seconds after which a snapshot is too old to load,
+                None for no limit
+        """
+        self.path = path
+        self.max_age = max_age
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Load the snapshot, None if there is no readable or recent one."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return None
+        if not isinstance(snapshot.get('items'), dict) or 'timestamp' not in snapshot:
+            logger.warning(f"Ignoring invalid snapshot {self.path}")
+            return None
+        age = time.time() - snapshot['timestamp']
+        if self.max_age is not None and age > self.max_age:
+            logger.info(f"Ignoring snapshot {self.path} taken {age:.0f}s ago")
+            return None
+        return snapshot
+
+    def save(self, items: Dict[str, Dict[str, Any]], timestamp: Optional[float] = None):
+        """Save item metadata and values by item name."""
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'timestamp': timestamp or time.time(), 'items': items}, f)
+            os.replace(tmp_path, self.path)
+            logger.debug(f"Saved snapshot of {len(items)} items to {self.path}")
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Failed to save snapshot {self.path}: {e}")
@@ -0,0 +1,260 @@
+"""
+Soak test of the full daemon stack against in-process vcontrold and MQTT
+stand-ins at accelerated time, with injected faults, watching the process
+resources for unbounded growth.
+"""
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import socketserver
+import statistics
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import click
+
+from pyvclient.utils.scheduler import Scheduler
+from pyvclient.vcomm.recording import Replay
+from pyvclient.vcomm.transport import LoopbackTransport
+from pyvclient.vcomm.vcomm import VComm
+
+logger = logging.getLogger(__name__)
+
+# allowed growth between the second and the last quarter of the run
+TOLERANCES = {
+    'threads': lambda start: 2,
+    'fds': lambda start: 2,
+    'rss': lambda start: max(5 * 2 ** 20, 0.1 * start),
+    'traced': lambda start: max(2 ** 20, 0.1 * start),
+}
+
+
+class VcontroldStandIn:
+    """Answers vcontrold commands with changing values and injected errors."""
+
+    def __init__(self, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    def handle(self, line: str) -> str:
+        self.requests += 1
+        if line.startswith('detail get'):
+            return "Type: short\nEinheit: Grad Celsius\nGet-Calc: V/10"
+        if line.startswith('get'):
+            if self.random.random() < self.error_rate:
+                return 'ERR: <RECV: read error 11'
+            return f"{self.random.uniform(-10, 60):.1f} Grad Celsius"
+        if line.startswith('set'):
+            return 'OK'
+        if line == 'version':
+            return 'Version: soak'
+        return 'ERR: command unknown'
+
+
+class FaultyLoopbackTransport(LoopbackTransport):
+    """Loopback transport dropping the connection at drop_rate per write."""
+
+    def __init__(self, handler, drop_rate: float, rng: random.Random):
+        super().__init__(handler)
+        self.drop_rate = drop_rate
+        self.random = rng
+
+    def write(self, data):
+        if not self._closed and self.random.random() < self.drop_rate:
+            self.close()
+            raise OSError("connection dropped by soak test")
+        super().write(data)
+
+
+class VcontroldServer(socketserver.ThreadingTCPServer):
+    """vcontrold stand-in on a local TCP port, to soak the socket handling."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, stand_in: VcontroldStandIn, drop_rate: float):
+        self.stand_in = stand_in
+        self.drop_rate = drop_rate
+        super().__init__(('127.0.0.1', 0), _VcontroldHandler)
+
+
+class _VcontroldHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.wfile.write(b"vctrld>")
+        for line in self.rfile:
+            line = line.decode('utf-8').strip()
+            if line == 'quit' or server.stand_in.random.random() < server.drop_rate:
+                return
+            self.wfile.write(server.stand_in.handle(line).encode('utf-8') + b"\nvctrld>")
+
+
+def sample_resources(trace_memory: bool) -> Dict[str, Optional[float]]:
+    """Current RSS, thread, file descriptor and traced memory usage."""
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # peak instead of current RSS, still catches growth
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        fds = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        fds = None
+    return {
+        'time': time.monotonic(),
+        'rss': rss,
+        'threads': threading.active_count(),
+        'fds': fds,
+        'traced': tracemalloc.get_traced_memory()[0] if trace_memory else None,
+    }
+
+
+def find_growth(samples: List[Dict[str, Optional[float]]]) -> Dict[str, tuple]:
+    """
+    Compare the medians of the second and the last quarter of the samples,
+    the first quarter being warm-up. Returns {metric: (start, end)} of the
+    metrics grown beyond their tolerance.
+    """
+    quarter = len(samples) // 4
+    if quarter < 2:
+        raise ValueError("Too few samples to judge growth, run longer")
+    growth = {}
+    for metric, tolerance in TOLERANCES.items():
+        if samples[0][metric] is None:
+            continue
+        start = statistics.median(s[metric] for s in samples[quarter:2 * quarter])
+        end = statistics.median(s[metric] for s in samples[-quarter:])
+        if end - start > tolerance(start):
+            growth[metric] = (start, end)
+    return growth
+
+
+def create_soak_client(properties: int, interval: float, vcomm: VComm, mqtt_client):
+    # the daemon pulls in paho, load it only when soaking
+    from pyvclient.pyvclient import PyVClient
+
+    config = {
+        'Properties': {f"Temp{i}": {'readonly': i % 2 == 0, 'interval': interval}
+                       for i in range(properties)},
+        'Precision': {'V/10': 1},
+        'MQTT_SETTINGS': {},
+        'History': {'raw': 100, 'minute': 60, 'hour': 24},
+        'Derived': {'Temp0Mean': {'source': 'Temp0', 'function': 'mean', 'window': 60}},
+    }
+    return PyVClient(vcomm, config, mqtt_client=mqtt_client)
+
+
+@click.command()
+@click.option('--duration', '-d', default=600, type=float, show_default=True,
+              help=u'seconds to run')
+@click.option('--properties', default=8, type=int, show_default=True,
+              help=u'number of polled properties')
+@click.option('--interval', default=0.01, type=float, show_default=True,
+              help=u'poll interval in seconds')
+@click.option('--error-rate', default=0.01, type=float, show_default=True,
+              help=u'share of get commands answered with a read error')
+@click.option('--drop-rate', default=0.001, type=float, show_default=True,
+              help=u'share of requests dropping the vcontrold connection')
+@click.option('--command-rate', default=5.0, type=float, show_default=True,
+              help=u'set commands injected per second')
+@click.option('--flap-interval', default=10.0, type=float, show_default=True,
+              help=u'seconds between MQTT reconnects, 0 for none')
+@click.option('--sample-interval', default=5.0, type=float, show_default=True,
+              help=u'seconds between resource samples')
+@click.option('--tcp/--loopback', default=False,
+              help=u'talk to the vcontrold stand-in over a local TCP socket')
+@click.option('--replay', type=click.Path(exists=True, dir_okay=False), default=None,
+              help=u'answer from a vcontrold recording instead of the stand-in')
+@click.option('--replay-speed', default=0.0, type=float, show_default=True,
+              help=u'replay speed relative to the recording, 0 answers at once')
+@click.option('--trace-memory/--no-trace-memory', default=True, show_default=True,
+              help=u'track Python allocations with tracemalloc (slower)')
+@click.option('--samples', '-s', 'samples_file', type=click.File(mode='w'), default=None,
+              help=u'write the resource samples as JSON lines')
+@click.option('--seed', default=None, type=int, help=u'random seed of the injected faults')
+def soak(duration, properties, interval, error_rate, drop_rate, command_rate,
+         flap_interval, sample_interval, tcp, replay, replay_speed, trace_memory,
+         samples_file, seed):
+    """ soak the daemon against local stand-ins and fail on resource growth """
+    from pyvclient.ha.ha_loopback_mqtt import LoopbackMqttClient
+
+    logging.basicConfig(level=logging.CRITICAL)
+    if trace_memory:
+        tracemalloc.start()
+
+    rng = random.Random(seed)
+    stand_in = VcontroldStandIn(error_rate, seed)
+    server = None
+    if replay:
+        vcomm = VComm(close_delay=0, retry_delay=0,
+                      transport_factory=Replay(replay, replay_speed))
+    elif tcp:
+        server = VcontroldServer(stand_in, drop_rate)
+        threading.Thread(target=server.serve_forever, name='soak-vcontrold', daemon=True).start()
+        vcomm = VComm('127.0.0.1', server.server_address[1], close_delay=0, retry_delay=0)
+    else:
+        vcomm = VComm(close_delay=0, retry_delay=0, transport_factory=lambda host, port:
+                      FaultyLoopbackTransport(stand_in.handle, drop_rate, rng))
+
+    mqtt_client = LoopbackMqttClient()
+    polls = [0]
+
+    def count_poll(name, value):
+        if name in pyvclient.properties:
+            polls[0] += 1
+
+    pyvclient = create_soak_client(properties, interval, vcomm, mqtt_client)
+    pyvclient.device.add_value_listener(count_poll)
+    scheduler = Scheduler()
+    pyvclient.setup_timers(scheduler)
+
+    settable = [entity.command_topic for entity in pyvclient.device.entities.values()
+                if getattr(entity, 'command_topic', None)]
+    samples = []
+    start = time.monotonic()
+    next_sample = next_flap = start
+    try:
+        while time.monotonic() - start < duration:
+            now = time.monotonic()
+            if now >= next_sample:
+                sample = sample_resources(trace_memory)
+                sample['polls'] = polls[0]
+                samples.append(sample)
+                if samples_file:
+                    print(json.dumps(sample), file=samples_file, flush=True)
+                next_sample += sample_interval
+            if flap_interval and now >= next_flap:
+                mqtt_client.flap()
+                next_flap += flap_interval
+            if settable and command_rate:
+                mqtt_client.inject_command(rng.choice(settable), f"{rng.uniform(20, 60):.1f}")
+                time.sleep(1 / command_rate)
+            else:
+                time.sleep(min(sample_interval, 1))
+    finally:
+        scheduler.stop()
+        pyvclient.worker.stop()
+        if server:
+            server.shutdown()
+
+    elapsed = time.monotonic() - start
+    click.echo(f"{polls[0]} polls, {stand_in.requests} vcontrold requests, "
+               f"{mqtt_client.client.published} publishes in {elapsed:.0f}s")
+    try:
+        growth = find_growth(samples)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for metric, (first, last) in growth.items():
+        click.echo(f"{metric} grew from {first:.0f} to {last:.0f}", err=True)
+    if growth:
+        raise SystemExit(1)
+    click.echo("No unbounded resource growth detected")
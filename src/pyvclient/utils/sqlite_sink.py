@@ -0,0 +1,182 @@
+"""
+Persistence of polled values in a local SQLite database.
+"""
+import csv
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+import click
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS readings (
+    ts REAL NOT NULL,
+    device TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS readings_entity_ts ON readings (entity, ts);
+'''
+
+
+class SqliteSink:
+    """
+    Writes readings to SQLite from a background thread.
+
+    Readings are queued without blocking and inserted in batches, one
+    transaction per batch. The database runs in WAL mode so exports can
+    read while the writer is active. Rows older than the retention are
+    deleted once an hour.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 100,
+        flush_interval: float = 5,
+        retention_days: float = 30,
+        queue_size: int = 10000
+    ):
+        """
+        Initialize SQLite sink and start its writer thread.
+
+        The database is opened here, so a bad path fails at startup instead
+        of stopping the writer thread.
+
+        Args:
+            path: Database file
+            batch_size: Maximum number of readings per transaction
+            flush_interval: Maximum seconds a reading waits for its batch
+            retention_days: Days readings are kept, 0 keeps them forever
+            queue_size: Readings queued at most, further readings are dropped
+        """
+        import sqlite3
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        # used by the writer thread only, once it is started
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._run, name='sqlite-sink', daemon=True)
+        self._thread.start()
+
+    def add(self, device: str, entity: str, value: Any, timestamp: float = None):
+        """Queue a reading, never blocks."""
+        try:
+            self._queue.put_nowait((timestamp or time.time(), device, entity, _to_column(value)))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"SQLite sink queue full, {self.dropped} readings dropped")
+
+    def listener(self, device: str) -> Callable[[str, Any], None]:
+        """Value listener for a ViessmannDevice named device."""
+        return lambda entity, value: self.add(device, entity, value)
+
+    def stop(self, timeout: float = 10):
+        """Write the queued readings and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        import sqlite3
+
+        connection = self._connection
+        # clean up after the first batch, monotonic time may start near 0
+        last_cleanup = float('-inf')
+        running = True
+        while running:
+            batch, running = self._next_batch()
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany(
+                            'INSERT INTO readings (ts, device, entity, value) VALUES (?, ?, ?, ?)',
+                            batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to write {len(batch)} readings: {e}")
+            if self.retention_days and time.monotonic() - last_cleanup > 3600:
+                last_cleanup = time.monotonic()
+                self._cleanup(connection)
+        connection.close()
+
+    def _next_batch(self):
+        """Collect readings until the batch is full or the flush interval passed."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                reading = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if reading is None:
+                return batch, False
+            batch.append(reading)
+        return batch, True
+
+    def _cleanup(self, connection):
+        import sqlite3
+
+        try:
+            with connection:
+                deleted = connection.execute(
+                    'DELETE FROM readings WHERE ts < ?',
+                    (time.time() - self.retention_days * 86400,)).rowcount
+            if deleted:
+                logger.info(f"Deleted {deleted} readings older than {self.retention_days} days")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to delete old readings: {e}")
+
+
+def _to_column(value: Any):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+@click.command()
+@click.argument('database', type=click.Path(exists=True, dir_okay=False))
+@click.argument('file_out', type=click.File(mode='w'), default='-')
+@click.option('--entity', '-e', multiple=True, help=u'entity to export, may be repeated')
+@click.option('--device', '-d', default=None, type=str, help=u'device to export')
+@click.option('--since', '-s', default=0, type=float, help=u'oldest timestamp to export')
+@click.option('--format', '-f', 'fmt', default='csv', type=click.Choice(['csv', 'json']))
+def export(database, file_out, entity, device, since, fmt):
+    """ export readings stored by the SQLite sink """
+    import sqlite3
+
+    query = 'SELECT ts, device, entity, value FROM readings WHERE ts >= ?'
+    params = [since]
+    if device:
+        query += ' AND device = ?'
+        params.append(device)
+    if entity:
+        query += ' AND entity IN (%s)' % ', '.join('?' * len(entity))
+        params.extend(entity)
+    query += ' ORDER BY ts'
+
+    connection = sqlite3.connect(database)
+    try:
+        rows = connection.execute(query, params)
+        if fmt == 'json':
+            for row in rows:
+                print(json.dumps(dict(zip(('ts', 'device', 'entity', 'value'), row))),
+                      file=file_out)
+        else:
+            writer = csv.writer(file_out)
+            writer.writerow(('ts', 'device', 'entity', 'value'))
+            writer.writerows(rows)
+    finally:
+        connection.close()
@@ -0,0 +1,176 @@
+"""
+Span tracing of requests through the daemon, e.g. from an MQTT command to
+the acknowledgement of vcontrold.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_tracer = None
+
+
+class Trace:
+    """Spans of one request, in monotonic seconds since the request arrived."""
+
+    __slots__ = ('trace_id', 'name', 'attributes', 'start', 'wall_start', 'spans')
+
+    def __init__(self, name: str, start: Optional[float] = None, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        now = time.monotonic()
+        self.start = start if start is not None else now
+        self.wall_start = time.time() - (now - self.start)
+        self.spans: List[tuple] = []
+
+    def add_span(self, name: str, start: float, end: float):
+        self.spans.append((name, start - self.start, end - start))
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'timestamp': self.wall_start,
+            'duration': round(duration, 6),
+            'attributes': self.attributes,
+            'spans': [{'name': name, 'start': round(start, 6), 'duration': round(duration, 6)}
+                      for name, start, duration in self.spans],
+        }
+
+
+class JsonlExporter:
+    """Appends traces to a file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, trace: Dict[str, Any]):
+        line = json.dumps(trace) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class MqttExporter:
+    """Publishes traces as JSON to an MQTT topic."""
+
+    def __init__(self, mqtt_client, topic: str):
+        self.mqtt = mqtt_client
+        self.topic = topic
+
+    def __call__(self, trace: Dict[str, Any]):
+        self.mqtt.publish_state(self.topic, json.dumps(trace))
+
+
+class Tracer:
+    """
+    Exports traces taking at least slow_threshold seconds and a random
+    sample_rate share of all others.
+    """
+
+    def __init__(
+        self,
+        exporters: List[Callable[[Dict[str, Any]], None]],
+        slow_threshold: float = 1.0,
+        sample_rate: float = 0.0
+    ):
+        """
+        Initialize tracer.
+
+        Args:
+            exporters: Called with every exported trace
+            slow_threshold: Seconds from which a trace is always exported
+            sample_rate: Share of faster traces exported (0..1)
+        """
+        self.exporters = exporters
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+
+    @contextmanager
+    def trace(self, name: str, start: Optional[float] = None, **attributes):
+        """
+        Trace the requests handled within the block on this thread.
+
+        Args:
+            name: Name of the request
+            start: Monotonic time the request arrived, defaults to now
+            attributes: Exported with the trace, e.g. the MQTT topic
+        """
+        current = Trace(name, start, **attributes)
+        outer = getattr(_local, 'trace', None)
+        _local.trace = current
+        try:
+            yield current
+        finally:
+            _local.trace = outer
+            self._finish(current)
+
+    def _finish(self, trace: Trace):
+        duration = time.monotonic() - trace.start
+        if duration < self.slow_threshold and random.random() >= self.sample_rate:
+            return
+        exported = trace.to_dict(duration)
+        for exporter in self.exporters:
+            try:
+                exporter(exported)
+            except Exception as e:
+                logger.error("Failed to export trace %s: %s", trace.trace_id, e)
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    """Install the tracer used by trace(), None disables tracing."""
+    global _tracer
+    _tracer = tracer
+
+
+def trace(name: str, start: Optional[float] = None, **attributes):
+    """Trace a request with the installed tracer, does nothing without one."""
+    if _tracer is None:
+        return _nothing()
+    return _tracer.trace(name, start, **attributes)
+
+
+def current_trace_id() -> Optional[str]:
+    """Correlation ID of the request traced on this thread, if any."""
+    current = getattr(_local, 'trace', None)
+    return current.trace_id if current else None
+
+
+@contextmanager
+def span(name: str):
+    """Record the block as a span of the request traced on this thread."""
+    current = getattr(_local, 'trace', None)
+    if current is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        current.add_span(name, start, time.monotonic())
+
+
+@contextmanager
+def _nothing():
+    yield None
+
+
+def create_tracer(settings: Dict[str, Any], mqtt_client=None) -> Tracer:
+    """Create a tracer from the Tracing section of the configuration."""
+    exporters = []
+    if settings.get('path'):
+        exporters.append(JsonlExporter(settings['path']))
+    if settings.get('topic') and mqtt_client:
+        exporters.append(MqttExporter(mqtt_client, settings['topic']))
+    return Tracer(exporters,
+                  slow_threshold=settings.get('slow_threshold', 1.0),
+                  sample_rate=settings.get('sample_rate', 0.0))
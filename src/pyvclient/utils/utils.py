@@ -1,28 +1,37 @@
+import math
 import os
+import re
 from collections import defaultdict
-from xml.etree import ElementInclude
-from xml.etree import ElementTree as ET
 
 import click
-import yaml
 
+XINCLUDE_NAMESPACES = ('{http://www.w3.org/2001/XInclude}',
+                       '{http://www.w3.org/2003/XInclude}')
 
-class ResourceLoader:
+# elements whose children are kept until the element itself is processed
+RECORD_TAGS = ('unit', 'command', 'protocol')
 
-    def __init__(self, path):
-        self.path = path
+# poll intervals a property may be given, small intervals share poll groups
+POLL_INTERVALS = (60, 120, 300, 600, 900, 1800, 3600, 7200, 21600, 43200, 86400)
 
-    def __call__(self, href, parse, encoding=None):
 
-        if parse == "xml":
-            with open(os.path.join(self.path, href), 'rb') as file:
-                data = ET.parse(file).getroot()
-        else:
-            if not encoding:
-                encoding = 'UTF-8'
-            with open(href, 'r', encoding=encoding) as file:
-                data = file.read()
-        return data
+def is_xinclude(element):
+    return element.tag.startswith(XINCLUDE_NAMESPACES) and element.tag.endswith('}include')
+
+
+def iterparse_included(source, path):
+    """ Yields start and end events of source and, in place of each
+        XInclude element, the events of the included xml file
+    """
+    from xml.etree import ElementTree as ET
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if not is_xinclude(elem):
+            yield event, elem
+        elif event == 'end' and elem.get('parse', 'xml') == 'xml':
+            href = os.path.join(path, elem.get('href'))
+            with open(href, 'rb') as file:
+                yield from iterparse_included(file, os.path.dirname(href))
 
 
 def insert(target, key, *values):
@@ -77,6 +86,9 @@ def get_unit(unit):
     entity = get_value(unit.find('entity'))
     # print(entity)
     unitdict['entity'] = entity or None
+    calc = unit.find('calc')
+    if calc is not None and calc.get('get'):
+        unitdict['calc'] = calc.get('get')
     if unitdict['type'] == 'enum':
         children = list(map(get_enum, unit.findall('./enum')))
         unitdict['enum'] = children
@@ -94,17 +106,79 @@ def get_unit(unit):
     return unitdict
 
 
-def get_units(vconfigd):
-    units = vconfigd.findall('.//unit')
+def get_command(command):
+    commanddict = {k: v for k, v in command.attrib.items() if k != 'name'}
+    for child in command:
+        if len(child) or child.attrib:
+            insert(commanddict, child.tag, etree_to_dict(child)[child.tag])
+        else:
+            commanddict[child.tag] = get_value(child)
+    return commanddict
 
+
+def get_protocol(protocol):
     return {
-        'units': {
-            unit.find('abbrev').text: get_unit(unit)
-            for unit in units
+        'macros': {
+            macro.attrib.get('name'): get_value(macro.find('command'))
+            for macro in protocol.iterfind('./macros/macro')
+        },
+        'commands': {
+            command.attrib.get('name'): get_command(command)
+            for command in protocol.iterfind('./commands/command')
         }
     }
 
 
+def iter_definitions(source, path):
+    """ Streams a vcontrold.xml and its includes and yields
+        (section, name, definition) for every unit, device, command and
+        protocol. Processed elements are dropped from the tree, so memory
+        is bounded by the largest single definition.
+    """
+
+    stack = []
+    record_depth = 0
+    for event, elem in iterparse_included(source, path):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag in RECORD_TAGS:
+                record_depth += 1
+            continue
+
+        stack.pop()
+        if elem.tag in RECORD_TAGS:
+            record_depth -= 1
+        parent = stack[-1] if stack else None
+        parent_tag = parent.tag if parent is not None else None
+        in_record = record_depth > 0
+
+        if elem.tag == 'unit' and parent_tag == 'units':
+            yield 'units', get_value(elem.find('abbrev')), get_unit(elem)
+        elif elem.tag == 'protocol':
+            yield 'protocols', elem.attrib.get('name'), get_protocol(elem)
+        elif elem.tag == 'command' and parent_tag == 'commands' and not in_record:
+            yield 'commands', elem.attrib.get('name'), get_command(elem)
+        elif elem.tag == 'device' and parent_tag == 'devices':
+            yield 'devices', elem.attrib.get('ID'), {
+                k: v for k, v in elem.attrib.items() if k != 'ID'
+            }
+        elif in_record:
+            continue
+
+        elem.clear()
+        # the element just closed is the last child parsed so far; roots of
+        # included files are not attached to the including tree
+        if parent is not None and len(parent) and parent[-1] is elem:
+            del parent[-1]
+
+
+def get_definitions(source, path):
+    definitions = {'devices': {}, 'units': {}, 'commands': {}, 'protocols': {}}
+    for section, name, definition in iter_definitions(source, path):
+        definitions[section][name] = definition
+    return definitions
+
+
 def etree_to_dict(t):
     d = {t.tag: {} if t.attrib else None}
     children = list(t)
@@ -128,52 +202,150 @@ def etree_to_dict(t):
     return d
 
 
-def merge_dicts(*dict_args):
-    """
-    Given any number of dicts, shallow copy and merge into a new dict,
-    precedence goes to key value pairs in latter dicts.
+def get_precision(calc):
+    """ Decimal places of values computed by a unit's get calculation,
+        e.g. 1 for V/10 and 2 for V/3600
     """
-    result = {}
-    for dictionary in dict_args:
-        result.update(dictionary)
-    return result
+
+    match = re.fullmatch(r'\s*V\s*/\s*(\d+)\s*', calc or '')
+    if not match:
+        return 0
+    divisor = int(match.group(1))
+    if divisor <= 1:
+        return 0
+    return min(math.ceil(math.log10(divisor)), 2)
 
 
-def get_device():
+def get_precisions(units):
     return {
-        'device': 'test1'
+        unit['calc']: get_precision(unit['calc'])
+        for unit in units.values() if unit.get('calc')
     }
 
 
-def get_commands():
-    return {'commands':
-                'test'
-            }
+def suggest_interval(name, unit):
+    """ Poll interval by what a command reads: temperatures change within
+        minutes, modes rarely, counters and hours slowly
+    """
+
+    name = name.lower()
+    if any(x in name for x in ('stunden', 'hours', 'starts', 'count', 'time')):
+        return 3600
+    if unit is None:
+        return 3600
+    if unit['type'] == 'enum':
+        return 600
+    if 'grad' in (unit.get('entity') or '').lower() or 'temp' in name:
+        return 60
+    return 300
+
+
+def get_bus_cost(command, request_cost, byte_cost):
+    """ Estimated Optolink bus time in seconds of one read of command """
+
+    try:
+        length = int(command.get('len') or 0)
+    except ValueError:
+        length = 0
+    return request_cost + length * byte_cost
+
+
+def fit_intervals(costs, intervals, budget):
+    """ Stretches intervals until the bus time per minute of all polls is
+        within budget, rounding up to the next POLL_INTERVALS entry
+    """
+
+    def load(intervals):
+        return sum(costs[name] * 60 / intervals[name] for name in intervals)
+
+    factor = 1.0
+    fitted = dict(intervals)
+    while load(fitted) > budget and factor < POLL_INTERVALS[-1]:
+        factor *= 1.25
+        fitted = {
+            name: next((i for i in POLL_INTERVALS if i >= interval * factor),
+                       POLL_INTERVALS[-1])
+            for name, interval in intervals.items()
+        }
+    return fitted, load(fitted)
+
+
+def is_for_device(command, device_id):
+    devices = command.get('device') or []
+    return not device_id or not devices or any(
+        device.get('@ID') == device_id for device in devices
+    )
+
+
+def get_properties(definitions, budget, request_cost, byte_cost, device_id=None):
+    """ Properties for all get commands of the definitions with suggested
+        poll intervals that keep the bus time per minute within budget
+    """
+
+    commands = definitions['commands']
+    units = definitions['units']
+
+    names = {
+        name[3:]: command for name, command in commands.items()
+        if name.startswith('get') and is_for_device(command, device_id)
+    }
+    costs = {
+        name: get_bus_cost(command, request_cost, byte_cost)
+        for name, command in names.items()
+    }
+    intervals = {
+        name: suggest_interval(name, units.get(command.get('unit')))
+        for name, command in names.items()
+    }
+    intervals, load = fit_intervals(costs, intervals, budget)
+
+    properties = {}
+    for name, command in names.items():
+        prop = {
+            'readonly': 'set' + name not in commands,
+            'interval': intervals[name],
+        }
+        if command.get('unit'):
+            prop['unit'] = command['unit']
+        if command.get('description'):
+            prop['description'] = command['description']
+        properties[name] = prop
+    return properties, load
 
 
 @click.command()
-@click.argument('vcontrold_file_in', type=click.File(mode='r'))
+@click.argument('vcontrold_file_in', type=click.File(mode='rb'))
 @click.argument('pyconf_file_out', type=click.File(mode='w'))
-# @click.argument('output_directory', type=click.Path(exists=True, writable=True, file_okay=False), default='.')
-# @click.option('--host', '-h', default='localhost', type=str, help=u'vcontrold host')
-# @click.option('--port', '-p', default=3002, type=int, help=u'vcontrold port')
-# @click.option('--generate_config', '-g', default=False, is_flag=True, help=u'generates config file')
-def generate_config(vcontrold_file_in, pyconf_file_out):
+@click.option('--budget', '-b', default=6.0, type=float, show_default=True,
+              help=u'bus time in seconds per minute all polls may use')
+@click.option('--request-cost', default=0.05, type=float, show_default=True,
+              help=u'bus time in seconds per request')
+@click.option('--byte-cost', default=0.0025, type=float, show_default=True,
+              help=u'bus time in seconds per byte read')
+@click.option('--device', '-d', default=None, type=str,
+              help=u'device ID to generate properties for')
+def generate_config(vcontrold_file_in, pyconf_file_out, budget, request_cost,
+                    byte_cost, device):
     """ generate configuration from vcontrold.xml file """
+    import yaml
 
     xmlpath = os.path.dirname(vcontrold_file_in.name)
 
-    vconf = ET.parse(vcontrold_file_in).getroot()
-
-    ElementInclude.include(vconf, ResourceLoader(xmlpath))
+    definitions = get_definitions(vcontrold_file_in, xmlpath)
 
-    # print(vconf1)
-
-    # print(ET.tostring(vconf, encoding="utf-8", method="xml").decode())
+    properties, load = get_properties(definitions, budget, request_cost,
+                                      byte_cost, device)
+    config = {
+        'Properties': properties,
+        'Precision': get_precisions(definitions['units']),
+    }
+    config.update(definitions)
 
-    print(yaml.dump(merge_dicts(get_device(), get_units(vconf), get_commands()), allow_unicode=True),
+    print(yaml.dump(config, allow_unicode=True, sort_keys=False),
           file=pyconf_file_out)
-    # d = etree_to_dict(vconf.find('.//units'))
-    # print(yaml.dump(d))
-    # print(yaml.dump(etree_to_dict(vconf.findall('.//unit'))))
+    click.echo(f'{len(properties)} properties, '
+               f'estimated bus time {load:.1f}s per minute (budget {budget}s)')
+    if load > budget:
+        click.echo('Warning: budget exceeded even at the longest poll interval, '
+                   'remove properties from the generated config', err=True)
     click.echo('Done!')
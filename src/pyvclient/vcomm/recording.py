@@ -0,0 +1,213 @@
+"""
+Recording of vcontrold sessions and their replay as a transport.
+
+A recording holds one JSON object per line, gzip compressed if the file
+name ends with .gz:
+
+    {"c": "getTempA", "r": "12.3 Grad Celsius", "d": 0.081}
+
+c is the command, r the response without prompt and d the seconds
+vcontrold took. Connects are recorded with c null, failed connects with
+the error in e instead of a response.
+"""
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from pyvclient.vcomm.transport import PROMPT, Transport
+
+logger = logging.getLogger(__name__)
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class SessionRecorder:
+    """Appends commands, responses and timings of vcontrold sessions to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open(path, 'a')
+        self._lock = threading.Lock()
+
+    def record(self, command: Optional[str], seconds: float,
+               response: Optional[str] = None, error: Optional[str] = None):
+        event = {'c': command, 'd': round(seconds, 4)}
+        if error is not None:
+            event['e'] = error
+        else:
+            event['r'] = response
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file:
+                self._file.write(line)
+
+    def transport_factory(self, factory):
+        """Wrap a transport factory so that its sessions are recorded."""
+        def create(host, port):
+            start = time.monotonic()
+            try:
+                transport = factory(host, port)
+            except Exception as e:
+                self.record(None, time.monotonic() - start, error=str(e))
+                raise
+            return RecordingTransport(transport, self, start)
+        return create
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class RecordingTransport(Transport):
+    """
+    Passes everything through to a transport and records each response
+    with the command it answers. Commands written in one batch are answered
+    in order; each response is timed from the later of its write and the
+    previous response.
+    """
+
+    def __init__(self, transport: Transport, recorder: SessionRecorder, connected: float):
+        self.transport = transport
+        self.recorder = recorder
+        # the prompt vcontrold greets with belongs to the connect
+        self._pending = deque([(None, connected)])
+        self._last = connected
+
+    def read_until(self, expected, timeout=None):
+        data = self.transport.read_until(expected, timeout)
+        now = time.monotonic()
+        if self._pending:
+            command, written = self._pending.popleft()
+            response = data[:-len(PROMPT)] if data.endswith(PROMPT) else data
+            self.recorder.record(command, now - max(written, self._last),
+                                 response.decode('utf-8', 'replace').rstrip('\n'))
+        self._last = now
+        return data
+
+    def write(self, data):
+        now = time.monotonic()
+        for line in data.decode('utf-8').splitlines():
+            if line.strip() and line.strip() != 'quit':
+                self._pending.append((line.strip(), now))
+        self.transport.write(data)
+
+    def is_closed(self):
+        return self.transport.is_closed()
+
+    def close(self):
+        self.transport.close()
+
+
+def load_recording(path: str) -> Dict[Optional[str], List[dict]]:
+    """Recorded events by command, in recorded order."""
+    recording: Dict[Optional[str], List[dict]] = {}
+    count = 0
+    with _open(path, 'r') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    event = json.loads(line)
+                    recording.setdefault(event['c'], []).append(event)
+                    count += 1
+        except (EOFError, ValueError) as e:
+            # a recording cut short by a crash is still usable
+            logger.warning(f"Recording {path} is truncated after {count} events: {e}")
+    logger.info(f"Loaded {count} events of {len(recording)} commands from {path}")
+    return recording
+
+
+class Replay:
+    """
+    Transport factory answering from a recording.
+
+    Each command gets its recorded responses in order, starting over once
+    they are used up, so error bursts and latency patterns repeat. Delays
+    are divided by speed; speed 0 answers at once. Recorded connect
+    failures are raised again.
+    """
+
+    def __init__(self, recording, speed: float = 1.0):
+        """
+        Args:
+            recording: Path of a recording or the result of load_recording
+            speed: Replay speed, 2 answers twice as fast as recorded
+        """
+        if isinstance(recording, str):
+            recording = load_recording(recording)
+        self.speed = speed
+        self._events = {command: events for command, events in recording.items()}
+        self._positions = dict.fromkeys(recording, 0)
+        self._lock = threading.Lock()
+
+    def next_event(self, command: Optional[str]) -> Optional[dict]:
+        with self._lock:
+            events = self._events.get(command)
+            if not events:
+                return None
+            position = self._positions[command]
+            self._positions[command] = (position + 1) % len(events)
+            return events[position]
+
+    def delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed else 0.0
+
+    def __call__(self, host, port):
+        event = self.next_event(None)
+        if event and 'e' in event:
+            time.sleep(self.delay(event['d']))
+            raise OSError(event['e'])
+        return ReplayTransport(self, self.delay(event['d']) if event else 0.0)
+
+
+class ReplayTransport(Transport):
+    """Session answering from a Replay, like vcontrold one command after another."""
+
+    def __init__(self, replay: Replay, connect_delay: float = 0.0):
+        self.replay = replay
+        self._closed = False
+        self._ready = time.monotonic() + connect_delay
+        self._responses = deque([(self._ready, PROMPT)])
+
+    def read_until(self, expected, timeout=None):
+        if not self._responses:
+            return b''
+        ready, data = self._responses.popleft()
+        wait = ready - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        return data
+
+    def write(self, data):
+        if self._closed:
+            raise OSError("replay transport is closed")
+        for line in data.decode('utf-8').splitlines():
+            command = line.strip()
+            if command == 'quit':
+                self.close()
+                return
+            event = self.replay.next_event(command)
+            if event is None:
+                logger.debug("No recorded response for %s", command)
+                response, seconds = 'ERR: command unknown', 0.0
+            else:
+                response, seconds = event.get('r', ''), event['d']
+            self._ready = max(self._ready, time.monotonic()) + self.replay.delay(seconds)
+            if response:
+                response += '\n'
+            self._responses.append((self._ready, response.encode('utf-8') + PROMPT))
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
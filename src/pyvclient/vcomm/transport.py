@@ -0,0 +1,176 @@
+"""
+Transports carrying the vcontrold telnet protocol.
+"""
+import logging
+import socket
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+PROMPT = b"vctrld>"
+UNIX_PREFIX = "unix:"
+
+
+class Transport(ABC):
+    """Byte stream to a vcontrold instance."""
+
+    timeout = 10
+
+    @abstractmethod
+    def read_until(self, expected, timeout=None):
+        """Read until expected bytes are found or the timeout expires."""
+
+    @abstractmethod
+    def write(self, data):
+        """Write data."""
+
+    @abstractmethod
+    def is_closed(self):
+        """Whether the transport has been closed."""
+
+    @abstractmethod
+    def close(self):
+        """Close transport."""
+
+
+class SocketTransport(Transport):
+    """Transport over a connected stream socket."""
+
+    def __init__(self, sock, timeout=10):
+        self.sock = sock
+        self.timeout = timeout
+        self.sock.settimeout(timeout)
+        # bytes received after the last expected marker, e.g. the
+        # responses following the first one of a pipelined batch
+        self._buffer = bytearray()
+
+    def read_until(self, expected, timeout=None):
+        self.sock.settimeout(timeout or self.timeout)
+        buf = self._buffer
+        while expected not in buf:
+            try:
+                data = self.sock.recv(4096)
+                if not data:
+                    # closed by vcontrold, let the caller reconnect
+                    self.close()
+                    break
+                buf += data
+            except socket.timeout:
+                break
+        index = buf.find(expected)
+        end = index + len(expected) if index >= 0 else len(buf)
+        data = bytes(buf[:end])
+        del buf[:end]
+        return data
+
+    def write(self, data):
+        self.sock.sendall(data)
+
+    def get_socket(self):
+        """Get underlying socket."""
+        return self.sock
+
+    def is_closed(self):
+        return self.sock.fileno() == -1
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class TcpTransport(SocketTransport):
+    """
+    TCP transport tuned for small request/response exchanges.
+
+    Nagle's algorithm is disabled so a command is sent at once instead of
+    waiting for the previous response to be acknowledged, and keepalive
+    detects a vcontrold host that went away between polls.
+    """
+
+    def __init__(self, host, port, timeout=10, connect_timeout=None,
+                 nodelay=True, keepalive=True, keepalive_idle=60):
+        sock = socket.create_connection((host, port), connect_timeout or timeout)
+        if nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # Platform specific, e.g. missing on Windows and older macOS
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepalive_idle)
+            if hasattr(socket, 'TCP_KEEPINTVL'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(keepalive_idle // 4, 1))
+            if hasattr(socket, 'TCP_KEEPCNT'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 4)
+        super().__init__(sock, timeout)
+
+
+class UnixTransport(SocketTransport):
+    """Unix domain socket transport for a co-located vcontrold."""
+
+    def __init__(self, path, timeout=10):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            raise
+        super().__init__(sock, timeout)
+
+
+class LoopbackTransport(Transport):
+    """
+    In-memory vcontrold stand-in for unit tests and benchmarks.
+
+    The handler is called with every command line written and returns the
+    response text; the prompt is appended like vcontrold does.
+    """
+
+    def __init__(self, handler, timeout=10):
+        self.handler = handler
+        self.timeout = timeout
+        self._buffer = bytearray(PROMPT)
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def read_until(self, expected, timeout=None):
+        with self._lock:
+            index = self._buffer.find(expected)
+            end = index + len(expected) if index >= 0 else len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return data
+
+    def write(self, data):
+        if self._closed:
+            raise OSError("loopback transport is closed")
+        for line in data.decode('utf-8').splitlines():
+            if line.strip() == 'quit':
+                self.close()
+                return
+            response = self.handler(line.strip())
+            if response and not response.endswith('\n'):
+                response += '\n'
+            with self._lock:
+                self._buffer += (response or '').encode('utf-8') + PROMPT
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+
+
+def create_transport(host, port, timeout=10, **options):
+    """
+    Create the transport for a vcontrold endpoint.
+
+    Hosts of the form ``unix:/path/to/socket`` select a Unix domain socket,
+    all other hosts TCP. Remaining options are passed to TcpTransport.
+    """
+    if host.startswith(UNIX_PREFIX):
+        return UnixTransport(host[len(UNIX_PREFIX):], timeout=timeout)
+    return TcpTransport(host, port, timeout=timeout, **options)
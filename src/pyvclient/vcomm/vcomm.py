@@ -1,59 +1,99 @@
 import logging
-import socket
 import threading
 import time
+from collections import deque
+
+from pyvclient.utils.repeating_timer import RepeatingTimer
+from pyvclient.utils.tracing import span
+from pyvclient.vcomm.transport import TcpTransport, create_transport
 
 logger = logging.getLogger(__name__)
 
 
-class SimpleTelnet:
-    """Simple telnet replacement for basic operations."""
-    
-    def __init__(self, host, port, timeout=10):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.settimeout(timeout)
-        self.sock.connect((host, port))
-        
-    def read_until(self, expected, timeout=10):
-        """Read until expected bytes are found."""
-        self.sock.settimeout(timeout)
-        buf = b''
-        while expected not in buf:
-            try:
-                data = self.sock.recv(1024)
-                if not data:
-                    break
-                buf += data
-            except socket.timeout:
-                break
-        return buf
-    
-    def write(self, data):
-        """Write data to socket."""
-        self.sock.sendall(data)
-    
-    def get_socket(self):
-        """Get underlying socket."""
-        return self.sock
-    
-    def close(self):
-        """Close connection."""
-        try:
-            self.sock.close()
-        except:
-            pass
+# Kept for code importing the former socket wrapper
+SimpleTelnet = TcpTransport
 
 
 class VCommError(Exception):
     pass
 
 
-class VComm():
-    _has_lock = False
+class EndpointHealth:
+    """Recent error rate and latency of one vcontrold endpoint."""
 
-    def __init__(self, host='127.0.0.1', port=3002):
+    def __init__(self, host, port, window=10):
         self.host = host
         self.port = port
+        self.latency = None
+        self._results = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+    def record(self, success, latency=None):
+        with self._lock:
+            self._results.append(success)
+            if success and latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency = 0.7 * self.latency + 0.3 * latency
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            if not self._results:
+                return 0.0
+            return self._results.count(False) / len(self._results)
+
+    def healthy(self, max_error_rate, max_latency):
+        if self.error_rate > max_error_rate:
+            return False
+        return self.latency is None or self.latency <= max_latency
+
+
+class VComm():
+    _has_lock = False
+
+    def __init__(self, host='127.0.0.1', port=3002, endpoints=None,
+                 probe_interval=30, probe_command='version',
+                 max_error_rate=0.3, max_latency=5.0, transport_factory=None,
+                 close_delay=1, retry_delay=1, recorder=None):
+        """
+        Args:
+            host: vcontrold host
+            port: vcontrold port
+            endpoints: Optional ordered list of (host, port) tuples, the first
+                one being the primary; overrides host and port
+            probe_interval: Seconds between health probes of standby endpoints
+            probe_command: Command sent by the health probe
+            max_error_rate: Error rate above which an endpoint is unhealthy
+            max_latency: Latency in seconds above which an endpoint is unhealthy
+            transport_factory: Callable creating a connected Transport from
+                host and port, defaults to create_transport
+            close_delay: Seconds between closing a session and opening the next
+            retry_delay: Seconds waited before retrying a failed request
+            recorder: Optional SessionRecorder recording all sessions
+        """
+        self.endpoints = [EndpointHealth(h, p)
+                          for h, p in (endpoints or [(host, port)])]
+        self.active = self.endpoints[0]
+        self.host = self.active.host
+        self.port = self.active.port
+        self.probe_command = probe_command
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.on_endpoint_change = None
+        # called with the seconds a set session held the bus
+        self.on_set_session = None
+        self.command_costs = {}
+        self.transport_factory = transport_factory or create_transport
+        if recorder:
+            self.transport_factory = recorder.transport_factory(self.transport_factory)
+        self.close_delay = close_delay
+        self._closed_at = None
+        self.retry_delay = retry_delay
         self._lock = threading.Lock()
         self._connection_errorlog = 5
         self._connection_attempts = 0
@@ -61,18 +101,89 @@ class VComm():
         self.connected = False
         self.tn = None  # Initialize to None
 
+        if len(self.endpoints) > 1:
+            self._probe_timer = RepeatingTimer(probe_interval)
+            self._probe_timer.add_callback(self._probe_endpoints)
+
+    @property
+    def active_endpoint(self):
+        """host:port of the endpoint currently in use."""
+        return str(self.active)
+
+    def _record_cost(self, cmd, seconds):
+        cost = self.command_costs.get(cmd)
+        self.command_costs[cmd] = seconds if cost is None else 0.8 * cost + 0.2 * seconds
+
+    def command_cost(self, cmd, default=None):
+        """Measured round trip time of cmd in seconds, smoothed over recent requests."""
+        return self.command_costs.get(cmd, default)
+
+    def _select_endpoint(self):
+        """
+        Switch to the first healthy endpoint in order of preference.
+        Must be called while holding the lock.
+        """
+        if len(self.endpoints) == 1:
+            return
+        selected = next((endpoint for endpoint in self.endpoints
+                         if endpoint.healthy(self.max_error_rate, self.max_latency)),
+                        None)
+        if selected is None:
+            selected = min(self.endpoints, key=lambda endpoint: endpoint.error_rate)
+        if selected is self.active:
+            return
+        logger.warning("switch vcontrold from %s to %s", self.active, selected)
+        if self.connected:
+            self.__close()
+        self.active = selected
+        self.host = selected.host
+        self.port = selected.port
+        if self.on_endpoint_change:
+            self.on_endpoint_change(str(selected))
+
+    def _probe_endpoints(self):
+        """Health probe all standby endpoints."""
+        for endpoint in self.endpoints:
+            if endpoint is not self.active:
+                endpoint.record(*self._probe(endpoint))
+
+    def _probe(self, endpoint):
+        start = time.monotonic()
+        tn = None
+        try:
+            tn = self.transport_factory(endpoint.host, endpoint.port)
+            if b"vctrld>" not in tn.read_until(b"vctrld>", timeout=self.max_latency):
+                return False, None
+            if self.probe_command:
+                tn.write(self.probe_command.encode('utf-8') + b"\n")
+                response = tn.read_until(b"vctrld>", timeout=self.max_latency)
+                if b"vctrld>" not in response or response.startswith(b"ERR"):
+                    return False, None
+            tn.write(b"quit\n")
+        except Exception as e:
+            logger.debug("health probe of %s failed: %s", endpoint, e)
+            return False, None
+        finally:
+            if tn:
+                tn.close()
+        return True, time.monotonic() - start
+
     def __connect(self):
         logger.info("connect to vcontrold")
         if self.__connected():
             return
+        if self._closed_at is not None:
+            # TODO fix hack due to reconnection errors
+            time.sleep(max(self._closed_at + self.close_delay - time.monotonic(), 0))
         try:
             logger.debug('create new connection to %s',
                               self.host)
-            self.tn = SimpleTelnet(self.host, self.port)
+            self.tn = self.transport_factory(self.host, self.port)
             self.tn.read_until(b"vctrld>")
             logger.debug("Connected successfully to %s", self.host)
         except Exception as e:
             logger.error(e)
+            self.active.record(False)
             self.connected = False
         else:
             self.connected = True
@@ -83,7 +194,7 @@ class VComm():
         try:
             if self.tn is None:
                 return False
-            if self.tn.get_socket().fileno() == -1:
+            if self.tn.is_closed():
                 return False
             else:
                 return True
@@ -94,14 +205,15 @@ class VComm():
     def __close(self):
         logger.info("disconnect from vcontrold")
         try:
-            self.tn.write(b"quit\n")
-            self.tn.close()
+            with span('close'):
+                self.tn.write(b"quit\n")
+                self.tn.close()
         except Exception as e:
             logger.error(e)
         finally:
             self.connected = False
-            # TODO fix hack due to reconnection errors
-            time.sleep(1)
+            # the next session waits out close_delay, not the caller of this one
+            self._closed_at = time.monotonic()
     
     def __cleanup(self):
         if self._has_lock:
@@ -128,67 +240,136 @@ class VComm():
                 if attempts < 0:
                     self.__cleanup()
                     raise VCommError(f"No connection to vcontrold at {self.host}:{self.port}")
-                time.sleep(1)
+                self._select_endpoint()
+                time.sleep(self.retry_delay)
                 continue
 
             try:
+                start = time.monotonic()
                 self.tn.write(cmd.encode('utf-8') + b"\n")
-                value = self.tn.read_until(
-                    b'vctrld>'
-                ).decode('utf-8').splitlines()[:-1]
-                logger.debug("received value: " + str(value))
-                if value and value[0] == 'ERR: <RECV: read error 11':
-                    logger.error('viessmann: received error for %s', cmd)
-                    value = None
+                response = self.tn.read_until(b'vctrld>')
+                if not response.endswith(b'vctrld>'):
+                    # hung or closed, the session is out of step
+                    self.__close()
+                    raise VCommError(f"No response from vcontrold for {cmd}")
+                value = response.decode('utf-8').splitlines()[:-1]
+                logger.debug("received value: %s", value)
+                if not value:
+                    raise VCommError(f"Empty response from vcontrold for {cmd}")
+                if value[0] == 'ERR: <RECV: read error 11':
+                    raise VCommError(f"viessmann: received error for {cmd}")
+                elapsed = time.monotonic() - start
+                self.active.record(True, elapsed)
+                self._record_cost(cmd, elapsed)
             except Exception as e:
                 logger.error(e)
+                value = None
+                self.active.record(False)
                 attempts -= 1
                 if attempts < 0:
                     self.__cleanup()
                     raise VCommError(f"No connection to vcontrold at {self.host}:{self.port}")
-                time.sleep(1)
+                self._select_endpoint()
+                time.sleep(self.retry_delay)
 
         return value
 
     def set_command(self, reg, value):
         logger.debug("set  %s to %s", reg, value)
-        self._lock.acquire()
+        with span('lock_wait'):
+            self._lock.acquire()
         self._has_lock = True
+        start = time.monotonic()
+        self._select_endpoint()
 
+        if not self.__connected():
+            with span('connect'):
+                self.__connect()
+
+        try:
+            success = self.__set(reg, value)
+        finally:
+            self.__cleanup()
+            self.__set_session_done(start)
+        return success
+
+    def set_commands(self, values, stop_on_failure=False):
+        """
+        Set several registers in one session under one lock acquisition.
+
+        Args:
+            values: {reg: value} set in order
+            stop_on_failure: Skip the remaining registers after a failed set
+
+        Returns:
+            {reg: success} of the registers set; registers skipped after a
+            failure or a lost connection are missing
+        """
+        logger.debug("set %s", values)
+        with span('lock_wait'):
+            self._lock.acquire()
+        self._has_lock = True
+        start = time.monotonic()
+        self._select_endpoint()
+
+        if not self.__connected():
+            with span('connect'):
+                self.__connect()
+
+        results = {}
+        try:
+            for reg, value in values.items():
+                results[reg] = self.__set(reg, value)
+                if not results[reg] and stop_on_failure:
+                    break
+        except VCommError as e:
+            # the session is closed and the lock released
+            logger.error(e)
+            results[reg] = False
+
+        self.__cleanup()
+        self.__set_session_done(start)
+        return results
+
+    def __set_session_done(self, start):
+        if self.on_set_session:
+            self.on_set_session(time.monotonic() - start)
+
+    def __set(self, reg, value):
         attempt = 5
         success = False
 
         cmd = 'set' + reg + " " + value + "\n"
 
-        if not self.__connected():
-            self.__connect()
-
         while ((not success) & (attempt > 0)):
             try:
-                logger.debug("set: [" + cmd + "]")
-                self.tn.write(cmd.encode('utf-8'))
-                value = self.tn.read_until(b'vctrld>').decode('utf-8').splitlines()[:-1]
-                logger.debug("received feedback: " + str(value))
+                logger.debug("set: [%s]", cmd)
+                with span('write'):
+                    self.tn.write(cmd.encode('utf-8'))
+                with span('read'):
+                    value = self.tn.read_until(b'vctrld>').decode('utf-8').splitlines()[:-1]
+                logger.debug("received feedback: %s", value)
                 if str(value) == "['OK']":
                     success = True
                 attempt -= 1
             except Exception as e:
                 logger.error(e)
+                self.active.record(False)
                 attempt -= 1
                 if attempt < 0:
                     self.__cleanup()
                     raise VCommError("No connection to vcontrold possible")
-                        
-        self.__cleanup()
+
         return success
 
     def process_commands(self, commands):
         logger.info("process commands")
-        logger.debug(commands)
+        logger.debug("commands: %s", commands)
         self._lock.acquire()
         self._has_lock = True
         ret = {}
         try:
+            self._select_endpoint()
             for cmd in commands:
                 ret.update({cmd: self.__request(cmd)})
         finally:
@@ -196,6 +377,45 @@ class VComm():
 
         return ret
 
+    def process_pipelined(self, commands, window=32):
+        """
+        Process commands in one session without waiting for each response
+        before sending the next command.
+
+        Commands are written in batches of window commands, responses are
+        read in order. Returns {cmd: (lines, seconds)} where seconds is the
+        time the response took after the previous one, i.e. the time
+        vcontrold spent on the command.
+        """
+        logger.info("process pipelined commands")
+        commands = list(commands)
+        self._lock.acquire()
+        self._has_lock = True
+        ret = {}
+        try:
+            self._select_endpoint()
+            if not self.__connected():
+                self.__connect()
+            if not self.connected:
+                raise VCommError(f"No connection to vcontrold at {self.host}:{self.port}")
+            for start in range(0, len(commands), window):
+                batch = commands[start:start + window]
+                self.tn.write(b"".join(cmd.encode('utf-8') + b"\n" for cmd in batch))
+                last = time.monotonic()
+                for cmd in batch:
+                    response = self.tn.read_until(b'vctrld>')
+                    now = time.monotonic()
+                    if not response.endswith(b'vctrld>'):
+                        self.active.record(False)
+                        raise VCommError(f"No response from vcontrold for {cmd}")
+                    ret[cmd] = (response.decode('utf-8').splitlines()[:-1], now - last)
+                    self._record_cost(cmd, now - last)
+                    last = now
+        finally:
+            self.__cleanup()
+
+        return ret
+
     def process_command(self, cmd):
         return self.process_commands([cmd])
 
@@ -1,10 +1,122 @@
 # -*- coding: utf-8 -*-
 """
-    Dummy conftest.py for pyvclient.
-
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    https://pytest.org/latest/plugins.html
+Stand-ins of vcontrold and the MQTT client shared by the tests.
 """
+import threading
+
+import pytest
+
+from pyvclient.pyvclient import PyVClient
+from pyvclient.vcomm.transport import LoopbackTransport
+from pyvclient.vcomm.vcomm import VComm
+
+
+class Heater:
+    """vcontrold stand-in keeping the values set, up to a maximum."""
+
+    def __init__(self, maximum=60.0):
+        self.values = {'TempA': 12.3, 'TempKol': 20.0, 'TempWW': 50.0}
+        self.maximum = maximum
+        self.failing = set()
+        self.unknown = set()
+        self.down = False
+        self.sets = []
+
+    def connect(self, host, port):
+        """Transport factory of a VComm talking to the heater."""
+        if self.down:
+            raise ConnectionRefusedError('vcontrold is down')
+        return LoopbackTransport(self.handle)
+
+    def handle(self, line):
+        if line.split()[-1][3:] in self.unknown:
+            return 'ERR: command unknown'
+        if line.startswith('detail get'):
+            return "Type: short\nEinheit: Grad Celsius\nGet-Calc: V/10"
+        if line.startswith('get'):
+            return f"{self.values[line[3:]]} Grad Celsius"
+        if line.startswith('set'):
+            name, value = line[3:].split()
+            self.sets.append((name, value))
+            if name in self.failing:
+                return 'ERR: set failed'
+            self.values[name] = min(float(value), self.maximum)
+            return 'OK'
+        return 'ERR: command unknown'
+
+
+class Mqtt:
+    """HAMqttClient stand-in recording publishes by topic."""
+
+    connected = True
+    mqtt_v5 = False
+
+    def __init__(self):
+        self.published = []
+        self.callbacks = {}
+        self.discovered = []
+        self.cleared = []
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload, retain=False, qos=1, **kwargs):
+        self.published.append((topic, payload))
+
+    def publish_state(self, topic, state, retain=False, expiry=None):
+        self.publish(topic, str(state), retain)
+
+    def publish_discovery(self, domain, object_id, config, node_id=None):
+        self.discovered.append(object_id)
+
+    def clear_discovery(self, domain, object_id, node_id=None):
+        self.cleared.append(object_id)
+
+    def subscribe_command(self, topic, callback):
+        self.callbacks[topic] = callback
+
+    def unsubscribe_command(self, topic):
+        self.callbacks.pop(topic, None)
+
+    def states(self, topic):
+        return [payload for published, payload in self.published if published == topic]
+
+
+@pytest.fixture
+def heater():
+    return Heater()
+
+
+@pytest.fixture
+def client(heater, request):
+    config = {
+        'Properties': {'TempA': {'readonly': True, 'interval': 60},
+                       'TempKol': {'readonly': False, 'interval': 60},
+                       'TempWW': {'readonly': False, 'interval': 60}},
+        'Precision': {'V/10': 1},
+        'MQTT_SETTINGS': {},
+    }
+    config.update(getattr(request, 'param', {}))
+    vcomm = VComm(transport_factory=heater.connect, close_delay=0, retry_delay=0)
+    client = PyVClient(vcomm, config, mqtt_client=Mqtt())
+    client.device.mqtt.published.clear()
+    client.device.mqtt.discovered.clear()
+    yield client
+    if client._recovery_timer:
+        client._recovery_timer.cancel()
+    client.worker.stop()
+
+
+def _drain(worker):
+    """Wait until the jobs queued on the worker are done."""
+    done = threading.Event()
+    worker.submit(done.set)
+    assert done.wait(5)
+
 
-# import pytest
+@pytest.fixture
+def drain():
+    return _drain
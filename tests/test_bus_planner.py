@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Earliest deadline first polling within the bus time budget.
+"""
+import pytest
+
+from pyvclient.utils import bus_planner
+from pyvclient.utils.bus_planner import AdaptiveInterval, BusPlanner
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Device:
+    def __init__(self):
+        self.batches = []
+
+    def update_properties(self, names):
+        self.batches.append(names)
+
+
+class VComm:
+    def __init__(self, costs):
+        self.costs = costs
+
+    def command_cost(self, command, default):
+        return self.costs.get(command, default)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bus_planner.time, 'monotonic', clock)
+    return clock
+
+
+def test_polls_due_properties_by_deadline(clock):
+    device = Device()
+    planner = BusPlanner(device, VComm({}), {'Slow': 60, 'Fast': 10}, budget=1, slot=5)
+    planner()
+    assert device.batches == []
+    clock.now += 60
+    planner()
+    assert device.batches == [['Fast', 'Slow']]
+
+
+def test_budget_limits_batch(clock):
+    device = Device()
+    costs = {'getA': 1.0, 'getB': 1.0, 'getC': 1.0}
+    planner = BusPlanner(device, VComm(costs), {'A': 10, 'B': 20, 'C': 30},
+                         budget=0.5, slot=4)
+    clock.now += 30
+    planner()
+    # a slot of 4s at half the bus time leaves room for two commands
+    assert device.batches == [['A', 'B']]
+    clock.now += 4
+    planner()
+    # A is due again with an earlier deadline than C
+    assert device.batches[-1] == ['A', 'C']
+
+
+def test_missed_deadline_is_counted(clock):
+    device = Device()
+    planner = BusPlanner(device, VComm({}), {'A': 10}, slot=5)
+    clock.now += 35
+    planner()
+    assert planner.missed == 1
+    # more than one interval behind, the period restarts now
+    assert planner.tasks['A'].release == clock.now
+
+
+def test_next_batch(clock):
+    planner = BusPlanner(Device(), VComm({}), {'A': 12}, slot=5)
+    assert planner.next_batch(clock.now + 5) == clock.now + 15
+    assert planner.next_batch(clock.now + 15) == clock.now + 15
+    assert BusPlanner(Device(), VComm({}), {}, slot=5).next_batch(clock.now) is None
+
+
+def test_overload_warning(clock, caplog):
+    costs = {'getA': 3.0}
+    planner = BusPlanner(Device(), VComm(costs), {'A': 10}, budget=0.2)
+    assert planner.utilization == pytest.approx(0.3)
+    planner()
+    assert 'polls will miss their intervals' in caplog.text
+
+
+def test_adaptive_interval(clock):
+    adaptive = AdaptiveInterval(10, 80, threshold=0.5)
+    planner = BusPlanner(Device(), VComm({}), {'A': 40}, adaptive={'A': adaptive})
+    clock.now += 40
+    planner()
+    planner.on_value('A', 20.0)
+    assert planner.tasks['A'].interval == 60
+    planner.on_value('A', 25.0)
+    assert planner.tasks['A'].interval == 30
+    assert planner.tasks['A'].release == clock.now + 30
+    for _ in range(3):
+        planner.on_value('A', 25.0)
+    assert planner.tasks['A'].interval == 80
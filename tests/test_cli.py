@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Endpoints, reloads and profiling set up by the command line entry point.
+"""
+import logging
+import os
+import signal
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from pyvclient import cli
+from pyvclient.vcomm.recording import Replay
+
+from conftest import Mqtt
+
+PROPERTIES = {'TempA': {'readonly': True, 'interval': 60}}
+
+
+def test_single_endpoint():
+    config = {'VControld': {'host': 'heater', 'port': 3002}}
+    assert cli.get_endpoints(config) == [{'host': 'heater', 'port': 3002}]
+    assert cli.get_endpoints(config, 'other', 3003) == [{'host': 'other', 'port': 3003}]
+    # the config itself is left alone
+    assert config['VControld'] == {'host': 'heater', 'port': 3002}
+
+
+def test_endpoint_list():
+    config = {'VControld': [{'name': 'house', 'host': 'heater', 'port': 3002},
+                            {'name': 'barn', 'host': 'barn', 'port': 3002}]}
+    endpoints = cli.get_endpoints(config, port=3003)
+    assert [(e['name'], e['host'], e['port']) for e in endpoints] == \
+        [('house', 'heater', 3003), ('barn', 'barn', 3002)]
+    # a single endpoint needs no name
+    assert cli.get_endpoints({'VControld': [{'host': 'heater', 'port': 3002}]}) == \
+        [{'host': 'heater', 'port': 3002}]
+
+
+@pytest.mark.parametrize('names', [(None, None), ('house', None), ('house', '')])
+def test_unnamed_endpoints_are_rejected(names):
+    config = {'VControld': [{'name': name, 'host': 'heater', 'port': 3002} for name in names]}
+    with pytest.raises(ValueError, match='name'):
+        cli.get_endpoints(config)
+
+
+def test_create_vcomm_with_failover():
+    vcomm = cli.create_vcomm({'host': 'heater', 'port': 3002, 'max_latency': 2.0,
+                              'failover': [{'host': 'spare'}, {'host': 'other', 'port': 3003}]})
+    assert [(e.host, e.port) for e in vcomm.endpoints] == \
+        [('heater', 3002), ('spare', 3002), ('other', 3003)]
+    assert (vcomm.host, vcomm.port) == ('heater', 3002)
+    assert vcomm.max_latency == 2.0
+
+
+def test_create_vcomm_replaying_and_recording(tmp_path, monkeypatch):
+    closers = []
+    monkeypatch.setattr(cli.atexit, 'register', closers.append)
+    vcomm = cli.create_vcomm({'host': 'heater', 'port': 3002,
+                              'replay': {None: []}, 'replay_speed': 0})
+    assert isinstance(vcomm.transport_factory, Replay)
+    assert closers == []
+
+    cli.create_vcomm({'host': 'heater', 'port': 3002, 'record': str(tmp_path / 'rec.jsonl')})
+    assert len(closers) == 1
+    closers[0]()
+
+
+class Client:
+    """PyVClient stand-in running its jobs right away."""
+
+    def __init__(self):
+        self.reloaded = []
+        self.worker = SimpleNamespace(submit=lambda job: job())
+
+    def reload(self, properties):
+        self.reloaded.append(properties)
+
+
+def write_config(path, config):
+    path.write_text(yaml.safe_dump(config))
+    return str(path)
+
+
+def test_reload_named_endpoints(tmp_path, caplog):
+    house = dict(PROPERTIES, TempKol={'readonly': False, 'interval': 60})
+    filename = write_config(tmp_path / 'config.yaml', {
+        'Properties': PROPERTIES,
+        'VControld': [{'name': 'house', 'host': 'heater', 'port': 3002, 'Properties': house},
+                      {'name': 'garage', 'host': 'garage', 'port': 3002}],
+    })
+    clients = {'house': Client(), 'barn': Client()}
+    cli.reload_config(filename, clients)
+    assert clients['house'].reloaded == [house]
+    assert clients['barn'].reloaded == []
+    assert 'take effect after a restart' in caplog.text
+
+
+def test_reload_single_endpoint(tmp_path):
+    filename = write_config(tmp_path / 'config.yaml', {
+        'Properties': PROPERTIES, 'VControld': {'host': 'heater', 'port': 3002}})
+    clients = {None: Client()}
+    cli.reload_config(filename, clients)
+    assert clients[None].reloaded == [PROPERTIES]
+
+
+@pytest.mark.parametrize('content', ['VControld: [unclosed', 'Properties: {}'])
+def test_invalid_config_is_not_reloaded(tmp_path, caplog, content):
+    (tmp_path / 'config.yaml').write_text(content)
+    clients = {None: Client()}
+    with caplog.at_level(logging.ERROR):
+        cli.reload_config(str(tmp_path / 'config.yaml'), clients)
+    assert clients[None].reloaded == []
+    assert 'Not reloading invalid config' in caplog.text
+
+
+def test_config_watcher(tmp_path):
+    path = tmp_path / 'config.yaml'
+    path.write_text('a: 1')
+    changes = []
+    watcher = cli.ConfigWatcher(str(path), lambda: changes.append(True))
+    watcher()
+    assert changes == []
+    os.utime(path, (0, 1000))
+    watcher()
+    watcher()
+    assert changes == [True]
+    path.unlink()
+    watcher()
+    assert changes == [True]
+
+
+def test_profiling_over_mqtt(tmp_path):
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGUSR1, signal.SIGUSR2)}
+    mqtt = Mqtt()
+    try:
+        cli.setup_profiling({'directory': str(tmp_path), 'topic': 'viessmann/profiling'}, mqtt)
+        mqtt.callbacks['viessmann/profiling']('threads')
+        mqtt.callbacks['viessmann/profiling']('unknown')
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    result = mqtt.states('viessmann/profiling/result')
+    assert os.path.dirname(result[0]) == str(tmp_path)
+    assert result[1] == ''
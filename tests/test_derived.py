@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Derived sensors computed incrementally from polled values.
+"""
+import datetime
+
+import pytest
+
+from pyvclient.utils.derived import DerivedSensor, create_statistic
+
+
+def sensor(function, **config):
+    return DerivedSensor('Derived', dict(config, source='Source', function=function))
+
+
+def test_mean_over_window():
+    mean = sensor('mean', window=10)
+    assert mean.add(10, timestamp=100) == 10
+    assert mean.add(20, timestamp=105) == 15
+    # the first sample left the window
+    assert mean.add(30, timestamp=110) == 25
+
+
+@pytest.mark.parametrize('function, expected', [('min', [5, 3, 3, 4]), ('max', [5, 5, 7, 7])])
+def test_extreme_over_window(function, expected):
+    extreme = sensor(function, window=10)
+    samples = [(0, 5), (4, 3), (8, 7), (15, 4)]
+    assert [extreme.add(value, timestamp=ts) for ts, value in samples] == expected
+
+
+def test_daily_delta_restarts_at_midnight():
+    delta = sensor('daily_delta')
+    midnight = datetime.datetime(2024, 1, 2).timestamp()
+    assert delta.add(100, timestamp=midnight - 60) == 0
+    assert delta.add(104, timestamp=midnight - 30) == 4
+    assert delta.add(105, timestamp=midnight + 30) == 0
+    assert delta.add(108, timestamp=midnight + 60) == 3
+
+
+def test_daily_delta_restarts_after_counter_reset():
+    delta = sensor('daily_delta')
+    assert delta.add(100, timestamp=1000) == 0
+    assert delta.add(2, timestamp=1010) == 0
+
+
+def test_rate_per_period():
+    rate = sensor('rate', period=60)
+    assert rate.add(10, timestamp=0) is None
+    assert rate.add(12, timestamp=30) == 4
+    assert rate.add(12, timestamp=30) is None
+
+
+def test_precision_and_invalid_values():
+    mean = sensor('mean', precision=1)
+    assert mean.add('1.26', timestamp=0) == 1.3
+    assert mean.add('ERR', timestamp=1) is None
+    assert sensor('daily_delta').precision == 0
+
+
+def test_unknown_function():
+    with pytest.raises(ValueError):
+        create_statistic('median')
+
+
+@pytest.mark.parametrize('function', ['mean', 'min', 'max'])
+@pytest.mark.parametrize('window', [0, -60])
+def test_window_must_be_positive(function, window):
+    with pytest.raises(ValueError, match='positive'):
+        create_statistic(function, window)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+MQTT v5 topic aliases and message expiry of state publishes.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from pyvclient.ha.ha_mqtt_discovery import HAMqttClient
+
+
+class Paho:
+    """Records what HAMqttClient hands to paho."""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        self.published.append((topic, qos, getattr(properties, 'TopicAlias', None),
+                               getattr(properties, 'MessageExpiryInterval', None)))
+        return SimpleNamespace(rc=0, mid=0)
+
+    def subscribe(self, topic):
+        return 0, 0
+
+
+@pytest.fixture
+def client():
+    client = HAMqttClient(protocol_version=5)
+    client.client = Paho()
+    client._on_connect(client.client, None, {}, 0, SimpleNamespace(TopicAliasMaximum=10))
+    client.client.published.clear()
+    return client
+
+
+def test_state_topics_are_aliased(client):
+    client.publish_state('viessmann/tempa', 12.3, expiry=120)
+    client.publish_state('viessmann/tempa', 12.4)
+    assert client.client.published == [('viessmann/tempa', 0, 1, 120),
+                                       ('', 0, 1, None)]
+
+
+def test_qos_1_publishes_carry_their_topic(client):
+    client.publish('viessmann/tempa', '12.3', qos=1, alias=True)
+    client.publish('viessmann/tempa', '12.4', qos=1, alias=True)
+    assert client.client.published == [('viessmann/tempa', 1, None, None)] * 2
+
+
+def test_aliases_are_announced_again_after_reconnect(client):
+    client.publish_state('viessmann/tempa', 12.3)
+    client._on_disconnect(client.client, None, 1)
+    client._on_connect(client.client, None, {}, 0, SimpleNamespace(TopicAliasMaximum=1))
+    client.publish_state('viessmann/tempa', 12.4)
+    client.publish_state('viessmann/tempb', 1.0)
+    assert client.client.published[-2:] == [('viessmann/tempa', 0, 1, None),
+                                            ('viessmann/tempb', 0, None, None)]
+
+
+def test_without_aliases_states_use_qos_1():
+    client = HAMqttClient(protocol_version=5, topic_aliases=False)
+    client.client = Paho()
+    client._on_connect(client.client, None, {}, 0, SimpleNamespace(TopicAliasMaximum=10))
+    client.publish_state('viessmann/tempa', 12.3)
+    assert client.client.published[-1] == ('viessmann/tempa', 1, None, None)
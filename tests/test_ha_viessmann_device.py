@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Set commands and entities of the Home Assistant device against a loopback
+vcontrold.
+"""
+import json
+import time
+
+import pytest
+
+
+VERIFY = {'SetVerification': {'max_delay': 5}}
+
+
+@pytest.mark.parametrize('client', [VERIFY], indirect=True)
+def test_read_back_publishes_heater_value(client, heater, drain):
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/tempkol/set']('75')
+    # nothing is published before the value is read back
+    assert mqtt.states('viessmann/tempkol') == []
+    drain(client.worker)
+    assert heater.sets == [('TempKol', '75')]
+    assert mqtt.states('viessmann/tempkol') == ['60.0']
+
+
+@pytest.mark.parametrize('client', [VERIFY], indirect=True)
+def test_read_back_joins_due_poll(client, heater, drain):
+    # a poll batch is due within max_delay
+    client.device.enable_verification(client.worker.submit, 5, lambda: time.monotonic() + 1)
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/tempkol/set']('30')
+    drain(client.worker)
+    assert mqtt.states('viessmann/tempkol') == []
+    client.worker.submit(lambda: client.device.update_properties(['TempA']))
+    drain(client.worker)
+    assert mqtt.states('viessmann/tempkol') == ['30.0']
+    assert mqtt.states('viessmann/tempa') == ['12.3']
+
+
+def test_without_verification_payload_is_published(client, heater):
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/tempkol/set']('75')
+    assert mqtt.states('viessmann/tempkol') == ['75']
+
+
+def test_batch_set_results(client, heater):
+    results = client.device.set_values({'TempKol': '25', 'TempWW': '45', 'TempA': '1',
+                                        'Missing': '1'})
+    assert results == {'TempKol': 'ok', 'TempWW': 'ok', 'TempA': 'readonly',
+                       'Missing': 'unknown'}
+    assert heater.sets == [('TempKol', '25'), ('TempWW', '45')]
+    assert client.device.mqtt.states('viessmann/tempww') == ['45']
+
+
+def test_batch_stops_on_failure(client, heater):
+    heater.failing.add('TempKol')
+    results = client.device.set_values({'TempKol': '25', 'TempWW': '45'}, stop_on_failure=True)
+    assert results == {'TempKol': 'failed', 'TempWW': 'skipped'}
+    # a failed set is retried within the session
+    assert set(heater.sets) == {('TempKol', '25')}
+    assert client.device.mqtt.states('viessmann/tempkol') == []
+
+
+def test_batch_with_invalid_entity_is_not_set(client, heater):
+    results = client.device.set_values({'TempKol': '25', 'TempA': '1'}, stop_on_failure=True)
+    assert results == {'TempKol': 'skipped', 'TempA': 'readonly'}
+    assert heater.sets == []
+
+
+def test_batch_request_via_mqtt(client, heater):
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/batch/set'](
+        json.dumps({'values': {'TempKol': 25}, 'response_topic': 'reply'}))
+    assert json.loads(mqtt.states('reply')[0]) == {'results': {'TempKol': 'ok'}}
+    mqtt.callbacks['viessmann/batch/set']('{"values": []}')
+    assert 'error' in json.loads(mqtt.states('viessmann/batch/result')[0])
+
+
+def rejected(mqtt):
+    return [(event['payload'], event['reason'])
+            for event in map(json.loads, mqtt.states('viessmann/commands/rejected'))]
+
+
+@pytest.mark.parametrize('client', [{'CommandLimits': {'rate': 0.01, 'burst': 1}}],
+                         indirect=True)
+def test_command_over_limit_is_rejected(client, heater):
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/tempkol/set']('21')
+    mqtt.callbacks['viessmann/tempkol/set']('22')
+    mqtt.callbacks['viessmann/tempww/set']('45')
+    assert heater.sets == [('TempKol', '21'), ('TempWW', '45')]
+    assert rejected(mqtt) == [('22', 'entity_rate')]
+
+
+@pytest.mark.parametrize('client', [{'CommandLimits': {'rate': 10, 'burst': 1,
+                                                        'coalesce': True}}], indirect=True)
+def test_latest_coalesced_command_is_set(client, heater):
+    mqtt = client.device.mqtt
+    for payload in ('21', '22', '23'):
+        mqtt.callbacks['viessmann/tempkol/set'](payload)
+    time.sleep(0.5)
+    assert heater.sets == [('TempKol', '21'), ('TempKol', '23')]
+    assert rejected(mqtt) == [('22', 'superseded')]
+
+
+@pytest.mark.parametrize('client', [{'CommandLimits': {'rate': 1, 'burst': 1,
+                                                        'coalesce': True}}], indirect=True)
+def test_admitted_command_supersedes_coalesced_one(client, heater, monkeypatch):
+    from pyvclient.utils import rate_limit
+
+    now = [time.monotonic()]
+    monkeypatch.setattr(rate_limit.time, 'monotonic', lambda: now[0])
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/tempkol/set']('21')
+    mqtt.callbacks['viessmann/tempkol/set']('22')
+    # the bucket refills before the coalesced command is applied
+    now[0] += 1
+    mqtt.callbacks['viessmann/tempkol/set']('23')
+    time.sleep(1.2)
+    assert heater.sets == [('TempKol', '21'), ('TempKol', '23')]
+    assert rejected(mqtt) == [('22', 'superseded')]
+    assert mqtt.states('viessmann/tempkol')[-1] == '23'
+
+
+@pytest.mark.parametrize('client', [{'Derived': {
+    'TempAMean': {'source': 'TempA', 'function': 'mean'},
+    'TempKolMax': {'source': 'TempKol', 'function': 'max'}}}], indirect=True)
+def test_derived_sensors_are_removed_with_source(client):
+    device = client.device
+    properties = dict(client.properties)
+    del properties['TempA']
+    client.reload(properties)
+    assert device.mqtt.cleared == ['tempa', 'tempamean']
+    assert 'TempAMean' not in device.entities
+    assert list(device.derived) == ['TempKol']
+    device.update_value('TempKol', 21.0)
+    assert device.mqtt.states('viessmann/tempkolmax') == ['21.0']
+
+
+def test_entity_made_readonly_takes_no_commands(client, heater):
+    device = client.device
+    set_command = device.mqtt.callbacks['viessmann/tempkol/set']
+    properties = dict(client.properties, TempKol={'readonly': True, 'interval': 60})
+    client.reload(properties)
+    assert 'viessmann/tempkol/set' not in device.mqtt.callbacks
+    # a command delivered before paho processed the unsubscribe
+    set_command('33')
+    assert device.set_values({'TempKol': '33'}) == {'TempKol': 'readonly'}
+    assert heater.sets == []
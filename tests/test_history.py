@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+History of polled values in ring buffers and its MQTT query.
+"""
+import json
+
+import pytest
+
+from pyvclient.utils.history import HistoryStore, RingBuffer, SeriesHistory
+
+HOUR = 1700000000 - 1700000000 % 3600
+
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(3, 2)
+    for i in range(5):
+        buffer.append(i, i * 10)
+    assert buffer.rows() == [(2, 20), (3, 30), (4, 40)]
+    assert buffer.rows(since=3) == [(3, 30), (4, 40)]
+    assert all(len(column) == 3 for column in buffer.columns)
+
+
+def test_memory_is_bounded():
+    store = HistoryStore(raw=10, minute=5, hour=2)
+    for i in range(10000):
+        store.add('TempA', i % 50, timestamp=HOUR + i * 10)
+    series = store.series['TempA']
+    assert [buffer.count for buffer in series.buffers.values()] == [10, 5, 2]
+    assert len(series.buffers['raw'].columns[0]) == 10
+
+
+def test_minute_rollover():
+    series = SeriesHistory()
+    for offset, value in ((0, 10), (20, 20), (59, 30), (60, 5)):
+        series.add(HOUR + offset, value)
+    assert series.buffers['minute'].rows() == [(HOUR, 20, 10, 30)]
+    # the running minute is answered too
+    assert series.query('minute') == [(HOUR, 20, 10, 30), (HOUR + 60, 5, 5, 5)]
+    assert series.query('minute', since=HOUR + 1) == [(HOUR + 60, 5, 5, 5)]
+
+
+def test_hour_rollover():
+    series = SeriesHistory()
+    series.add(HOUR + 30, 1)
+    series.add(HOUR + 3599, 3)
+    assert series.buffers['hour'].count == 0
+    series.add(HOUR + 3600, 7)
+    assert series.buffers['hour'].rows() == [(HOUR, 2, 1, 3)]
+    assert series.buffers['minute'].rows() == [(HOUR, 1, 1, 1), (HOUR + 3540, 3, 3, 3)]
+    assert series.query('hour')[-1] == (HOUR + 3600, 7, 7, 7)
+
+
+def test_non_numeric_values_are_skipped():
+    store = HistoryStore()
+    store.add('BetriebArt', 'H+WW', timestamp=HOUR)
+    assert store.query('BetriebArt') == []
+
+
+def test_handle_request():
+    store = HistoryStore()
+    store.add('TempA', '12.5', timestamp=HOUR)
+    store.add('TempA', 13.5, timestamp=HOUR + 30)
+    assert store.handle_request({'entity': 'TempA', 'tier': 'minute'}) == {
+        'entity': 'TempA', 'tier': 'minute', 'rows': [[HOUR, 13.0, 12.5, 13.5]]}
+    assert store.handle_request({'entity': 'TempA', 'since': HOUR + 1})['rows'] == [
+        [HOUR + 30, 13.5]]
+    assert store.handle_request({'entity': 'Missing'})['rows'] == []
+    with pytest.raises(ValueError):
+        store.handle_request({'entity': 'TempA', 'tier': 'day'})
+
+
+@pytest.mark.parametrize('client', [{'History': {'raw': 10}}], indirect=True)
+def test_history_request_via_mqtt(client):
+    mqtt = client.device.mqtt
+    client.device.update_value('TempA', 12.3)
+    mqtt.callbacks['viessmann/history/get'](
+        json.dumps({'entity': 'TempA', 'response_topic': 'reply'}))
+    response = json.loads(mqtt.states('reply')[0])
+    assert response['entity'] == 'TempA'
+    assert [row[1] for row in response['rows']] == [12.3]
+
+
+@pytest.mark.parametrize('client', [{'History': {}}], indirect=True)
+@pytest.mark.parametrize('payload', ['not json', '[]', '{}', '{"entity": "TempA", "tier": "day"}'])
+def test_malformed_history_requests(client, payload):
+    mqtt = client.device.mqtt
+    mqtt.callbacks['viessmann/history/get'](payload)
+    assert 'error' in json.loads(mqtt.states('viessmann/history/response')[0])
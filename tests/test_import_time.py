@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Startup of the command line tools must not import modules only some
+commands need, checked with python -X importtime.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+DEFERRED = ('yaml', 'paho', 'xml', 'sqlite3', 'coloredlogs', 'importlib.metadata')
+
+
+def imported_modules(module):
+    """Modules imported by a fresh interpreter importing module."""
+    env = dict(os.environ, PYTHONPATH=SRC)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            capture_output=True, text=True, env=env, check=True)
+    return {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines()
+            if line.startswith('import time:')}
+
+
+@pytest.mark.parametrize('module', ['pyvclient', 'pyvclient.cli', 'pyvclient.utils.utils',
+                                    'pyvclient.utils.probe', 'pyvclient.utils.sqlite_sink',
+                                    'pyvclient.utils.soak', 'pyvclient.utils.loadgen'])
+def test_heavy_imports_are_deferred(module):
+    imported = imported_modules(module)
+    assert module in imported
+    eager = sorted(name for name in imported
+                   if any(name == deferred or name.startswith(deferred + '.')
+                          for deferred in DEFERRED))
+    assert eager == []
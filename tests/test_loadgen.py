@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Commands of the load generator and their acknowledgement.
+"""
+from pyvclient.utils.loadgen import Target, percentile
+
+
+def target(state, **config):
+    target = Target(dict(config, command_topic='viessmann/tempkol/set',
+                         state_topic='viessmann/tempkol'))
+    target.original = target.state = state
+    return target
+
+
+def send(target):
+    value = target.alternate()
+    target.pending.append((value, target.sent))
+    return value
+
+
+def test_values_alternate_around_state():
+    number = target('20', max=22)
+    assert [send(number), send(number), send(number)] == ['21.0', '20', '21.0']
+
+
+def test_value_stays_below_maximum():
+    assert send(target('22', max=22)) == '21.0'
+
+
+def test_options():
+    select = target('WW', options=['WW', 'H+WW', 'ABSCHALT'])
+    assert send(select) == 'H+WW'
+
+
+def test_unchanged_state_does_not_acknowledge():
+    number = target('20')
+    send(number)
+    send(number)
+    # the first command was dropped, polls keep publishing the old state
+    number.pending.popleft()
+    assert number.acknowledged('20') is None
+    assert len(number.pending) == 1
+    # the next command after a drop differs from the state
+    number.pending.clear()
+    assert send(number) == '21.0'
+
+
+def test_state_change_acknowledges():
+    number = target('20')
+    send(number)
+    send(number)
+    assert number.acknowledged('21.0') == 1
+    assert number.acknowledged('20') == 2
+    assert not number.pending
+
+
+def test_usable():
+    assert target('20').usable()
+    assert not target('20 Grad Celsius').usable()
+    assert not target(None).usable()
+    assert not target('AUS', options=['WW']).usable()
+
+
+def test_percentile():
+    assert percentile([3, 1, 2, 4], 0.5) == 3
+    assert percentile([1, 2], 0.99) == 2
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Suppression of repeated log records and logging through queues.
+"""
+import atexit
+import logging
+import logging.handlers
+import sys
+
+import pytest
+
+from pyvclient import logging as pyvlogging
+from pyvclient.logging import RepeatFilter, setup_logging
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pyvlogging.time, 'monotonic', clock)
+    return clock
+
+
+def record(msg, *args, level=logging.ERROR, name='pyvclient.vcomm'):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_repeats_are_suppressed_within_interval(clock):
+    repeat = RepeatFilter(interval=60)
+    assert repeat.filter(record("No connection to %s", 'a'))
+    assert not repeat.filter(record("No connection to %s", 'b'))
+    assert not repeat.filter(record("No connection to %s", 'c'))
+    # other messages and loggers are not repeats
+    assert repeat.filter(record("Other error"))
+    assert repeat.filter(record("No connection to %s", 'a', name='pyvclient.ha'))
+    clock.now += 60
+    summary = record("No connection to %s", 'd')
+    assert repeat.filter(summary)
+    assert summary.getMessage() == "No connection to d (2 repeats suppressed)"
+    clock.now += 60
+    plain = record("No connection to %s", 'e')
+    assert repeat.filter(plain)
+    assert plain.getMessage() == "No connection to e"
+
+
+def test_records_below_level_pass(clock):
+    repeat = RepeatFilter(interval=60)
+    for _ in range(3):
+        assert repeat.filter(record("polled", level=logging.INFO))
+
+
+def test_propagated_record_gets_same_result(clock):
+    repeat = RepeatFilter(interval=60)
+    first = record("No connection")
+    assert repeat.filter(first)
+    assert repeat.filter(first)
+    second = record("No connection")
+    assert not repeat.filter(second)
+    assert not repeat.filter(second)
+
+
+@pytest.fixture
+def log_config(tmp_path):
+    log_file = tmp_path / 'pyvclient.log'
+    config = tmp_path / 'logging.yaml'
+    config.write_text(f"""
+version: 1
+disable_existing_loggers: false
+formatters:
+  plain:
+    format: '%(message)s'
+handlers:
+  file:
+    class: logging.FileHandler
+    formatter: plain
+    filename: {log_file}
+loggers:
+  pyvclient.queued:
+    level: INFO
+    handlers: [file]
+    propagate: false
+""")
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    yield str(config), log_file
+    root.handlers = handlers
+    logger = logging.getLogger('pyvclient.queued')
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers = []
+
+
+def test_queue_handlers_keep_order(log_config):
+    path, log_file = log_config
+    listeners = setup_logging(path, use_queue=True, repeat_interval=60)
+    logger = logging.getLogger('pyvclient.queued')
+    assert [type(handler) for handler in logger.handlers] == [logging.handlers.QueueHandler]
+    assert all(isinstance(handler, logging.handlers.QueueHandler)
+               for handler in logging.getLogger().handlers)
+    for i in range(100):
+        logger.info("message %d", i)
+    for _ in range(3):
+        logger.error("vcontrold unreachable")
+    for listener in listeners:
+        atexit.unregister(listener.stop)
+        listener.stop()
+    lines = log_file.read_text().splitlines()
+    assert lines == [f"message {i}" for i in range(100)] + ["vcontrold unreachable"]
+
+
+def test_repeat_filters_without_queue(log_config):
+    path, log_file = log_config
+    assert setup_logging(path, repeat_interval=60) == []
+    logger = logging.getLogger('pyvclient.queued')
+    assert isinstance(logger.handlers[0], logging.FileHandler)
+    for _ in range(3):
+        logger.error("vcontrold unreachable")
+    logger.handlers[0].flush()
+    assert log_file.read_text().splitlines() == ["vcontrold unreachable"]
+
+
+def test_coloredlogs_only_on_terminal(monkeypatch):
+    # importing coloredlogs fails, so only a terminal may try it
+    monkeypatch.setitem(sys.modules, 'coloredlogs', None)
+    monkeypatch.setattr(sys.stderr, 'isatty', lambda: False)
+    pyvlogging.install_coloredlogs()
+    monkeypatch.setattr(sys.stderr, 'isatty', lambda: True)
+    with pytest.raises(ImportError):
+        pyvlogging.install_coloredlogs()
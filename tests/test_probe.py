@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Probing the commands a vcontrold answers.
+"""
+import functools
+
+import yaml
+from click.testing import CliRunner
+
+from pyvclient.utils import probe as probe_module
+from pyvclient.utils.probe import get_command_names, probe, probe_commands
+from pyvclient.vcomm.transport import LoopbackTransport
+from pyvclient.vcomm.vcomm import VComm
+
+COMMANDS = [
+    'getTempA: Aussentemperatur',
+    'getTempKol: Kollektortemperatur',
+    'setTempKol: Kollektortemperatur setzen',
+    'getFoo: Nicht vorhanden',
+    'get Temp mit Leerzeichen',
+]
+
+
+def handler(heater):
+    """Heater answering the commands command of vcontrold."""
+    def handle(line):
+        if line == 'commands':
+            return '\n'.join(COMMANDS)
+        return heater.handle(line)
+    return handle
+
+
+def test_get_command_names():
+    assert get_command_names(COMMANDS) == ['getTempA', 'getTempKol', 'getFoo']
+
+
+def test_probe_commands(heater):
+    heater.unknown = {'Foo'}
+    vcomm = VComm(transport_factory=heater.connect, close_delay=0, retry_delay=0)
+    probed = probe_commands(vcomm, ['getTempA', 'getTempKol', 'getFoo'], window=2)
+    assert {name: answered for name, (answered, _, _) in probed.items()} == \
+        {'getTempA': True, 'getTempKol': True, 'getFoo': False}
+    answered, seconds, detail = probed['getTempA']
+    assert seconds >= 0
+    assert detail == {'type': 'short', 'entity': 'Grad Celsius'}
+
+
+def test_probe_writes_properties(heater, monkeypatch, tmp_path):
+    heater.unknown = {'Foo'}
+    monkeypatch.setattr(probe_module, 'VComm', functools.partial(
+        VComm, transport_factory=lambda host, port: LoopbackTransport(handler(heater)),
+        close_delay=0, retry_delay=0))
+    out = tmp_path / 'properties.yaml'
+    result = CliRunner().invoke(probe, [str(out)])
+    assert result.exit_code == 0, result.output
+    assert '2 of 3 commands answered' in result.output
+    properties = yaml.safe_load(out.read_text())['Properties']
+    assert list(properties) == ['TempA', 'TempKol']
+    assert properties['TempA']['readonly'] is True
+    assert properties['TempKol']['readonly'] is False
+    assert properties['TempKol']['interval'] > 0
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand profiling of the daemon's threads and memory.
+"""
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from pyvclient.utils.profiling import Profiler
+
+
+def busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler(str(tmp_path / 'profiles'), interval=0.001)
+    yield profiler
+    profiler.stop()
+    tracemalloc.stop()
+
+
+def test_profile_cycle(profiler):
+    stop = threading.Event()
+    worker = threading.Thread(target=busy, args=(stop,), name='busy-worker')
+    worker.start()
+    try:
+        assert profiler.handle_command('start') is None
+        assert profiler.running
+        time.sleep(0.1)
+        path = profiler.handle_command(' STOP ')
+    finally:
+        stop.set()
+        worker.join()
+    assert not profiler.running
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert any(line.startswith('busy-worker;') and 'busy (test_profiling.py:' in line
+               for line in lines)
+    # collapsed stacks with their counts, most frequent first
+    counts = [int(line.rsplit(' ', 1)[1]) for line in lines]
+    assert counts == sorted(counts, reverse=True)
+    assert profiler.stop() is None
+
+
+def test_toggle(profiler):
+    assert profiler.toggle() is None
+    assert profiler.running
+    assert profiler.toggle().endswith('.folded')
+    assert not profiler.running
+
+
+def test_memory_diff(profiler):
+    assert profiler.handle_command('memory') is None
+    assert tracemalloc.is_tracing()
+    grown = [bytearray(1000) for _ in range(100)]
+    with open(profiler.handle_command('memory')) as f:
+        report = f.read()
+    assert report.startswith('traced: ')
+    assert 'test_profiling.py' in report
+    del grown
+
+
+def test_thread_stacks(profiler):
+    with open(profiler.handle_command('threads')) as f:
+        assert f"Thread {threading.current_thread().name}" in f.read()
+
+
+def test_unknown_command(profiler, caplog):
+    assert profiler.handle_command('flamegraph') is None
+    assert 'Unknown profiling command' in caplog.text
+    assert not profiler.running
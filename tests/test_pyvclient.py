@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Poll intervals, the snapshot time and the recovery of stub items created
+while vcontrold was unreachable.
+"""
+import time
+
+import pytest
+
+from pyvclient.pyvclient import PyVClient, longest_interval, poll_interval
+from pyvclient.utils.snapshot import Snapshot
+from pyvclient.vcomm.vcomm import VComm
+
+from conftest import Mqtt
+
+CONFIG = {
+    'Properties': {'TempA': {'readonly': True, 'interval': 60},
+                   'TempKol': {'readonly': False, 'interval': 60},
+                   'TempWW': {'readonly': False, 'interval': 60}},
+    'Precision': {'V/10': 1},
+    'MQTT_SETTINGS': {},
+    'StubRecovery': {'initial_delay': 1000, 'max_delay': 4000},
+}
+
+
+@pytest.fixture
+def stub_client(heater):
+    heater.down = True
+    vcomm = VComm(transport_factory=heater.connect, close_delay=0, retry_delay=0)
+    client = PyVClient(vcomm, CONFIG, mqtt_client=Mqtt())
+    client.device.mqtt.discovered.clear()
+    yield client
+    client._recovery_timer.cancel()
+    client.worker.stop()
+
+
+def recover(client):
+    """Run the pending recovery now instead of after its delay."""
+    client._recovery_timer.cancel()
+    client._recover_stub_items()
+
+
+def test_stubs_are_created(stub_client):
+    assert stub_client._stub_names() == ['TempA', 'TempKol', 'TempWW']
+    assert stub_client._recovery_timer.interval == 1000
+
+
+def test_retry_delay_doubles_up_to_max_delay(stub_client):
+    delays = []
+    for _ in range(3):
+        recover(stub_client)
+        delays.append(stub_client._recovery_timer.interval)
+        assert stub_client._recovery_timer.is_alive()
+    assert delays == [2000, 4000, 4000]
+    assert stub_client.device.mqtt.discovered == []
+
+
+def test_retry_delay_resets_after_recovery(stub_client, heater):
+    recover(stub_client)
+    heater.down = False
+    heater.unknown = {'TempWW'}
+    recover(stub_client)
+    assert stub_client._recovery_delay == 1000
+    assert stub_client._recovery_timer.interval == 1000
+    assert stub_client._recovery_timer.is_alive()
+
+
+def test_partial_recovery(stub_client, heater):
+    heater.down = False
+    heater.unknown = {'TempWW'}
+    recover(stub_client)
+    assert stub_client._stub_names() == ['TempWW']
+    assert stub_client.items['TempKol'].unit == 'Grad Celsius'
+    # only the discovery of the recovered entities is republished
+    assert stub_client.device.mqtt.discovered == ['tempa', 'tempkol']
+    assert stub_client.device.mqtt.states('viessmann/tempa') == ['12.3']
+
+
+def test_full_recovery_stops_retrying(stub_client, heater):
+    heater.down = False
+    recover(stub_client)
+    assert stub_client._stub_names() == []
+    # the cancelled timer is not replaced by another retry
+    assert stub_client._recovery_timer.finished.is_set()
+
+
+def test_poll_intervals():
+    assert poll_interval('TempA', {'interval': 60}) == 60
+    adaptive = {'min_interval': 60, 'max_interval': 900}
+    assert poll_interval('TempA', adaptive) == 900
+    assert longest_interval('TempA', dict(adaptive, interval=120)) == 900
+    assert longest_interval('TempA', {'interval': 60, 'max_interval': 900}) == 60
+    with pytest.raises(ValueError, match='TempA'):
+        poll_interval('TempA', {'readonly': True})
+
+
+@pytest.mark.parametrize('client', [{'Properties': {
+    'TempA': {'readonly': True, 'min_interval': 60, 'max_interval': 900},
+    'TempKol': {'readonly': False, 'interval': 60}}}], indirect=True)
+def test_adaptive_property_without_interval(client):
+    client.device.mqtt.mqtt_v5 = True
+    client.setup_timers()
+    try:
+        assert client.planner.tasks['TempA'].interval == 900
+        assert client.items['TempA'].interval == 900
+        assert client.device._get_message_expiry(client.items['TempA']) == 1800
+        assert client.device._get_message_expiry(client.items['TempKol']) == 120
+    finally:
+        client.scheduler.stop()
+
+
+@pytest.mark.parametrize('saved, down, published', [
+    (['TempA', 'TempKol', 'TempWW'], False, True),
+    (['TempA'], False, False),
+    (['TempA'], True, True),
+    ([], True, False),
+])
+def test_snapshot_time_only_for_snapshot_values(tmp_path, heater, saved, down, published):
+    path = str(tmp_path / 'snapshot.json')
+    Snapshot(path).save({name: {'name': name, 'get_command': 'get' + name, 'settable': False,
+                                'interval': 60, 'type': 'short', 'unit': 'Grad Celsius',
+                                'value': 1.0, 'raw_value': '1.0'}
+                         for name in saved}, timestamp=time.time() - 60)
+    heater.down = down
+    vcomm = VComm(transport_factory=heater.connect, close_delay=0, retry_delay=0)
+    client = PyVClient(vcomm, dict(CONFIG, Snapshot={'path': path}), mqtt_client=Mqtt())
+    try:
+        assert bool(client.device.mqtt.states('viessmann/snapshot_time')) == published
+    finally:
+        if client._recovery_timer:
+            client._recovery_timer.cancel()
+        client.worker.stop()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Rate limits of set commands.
+"""
+import pytest
+
+from pyvclient.utils import rate_limit
+from pyvclient.utils.rate_limit import CommandLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        assert bucket.wait() == 0
+        bucket.take()
+    assert bucket.wait() == 0.5
+    clock.now += 10
+    # refilled up to burst only
+    assert bucket.wait(3) == 0
+    assert bucket.wait(4) == 0.5
+    bucket.take(3)
+    assert bucket.wait(2) == 1.0
+
+
+def test_token_bucket_debt(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.take(3)
+    assert bucket.wait() == 3
+    clock.now += 3
+    assert bucket.wait() == 0
+
+
+def test_entity_rate(clock):
+    limiter = CommandLimiter(rate=0.5, burst=2)
+    assert limiter.admit('A') == (0, None)
+    assert limiter.admit('A') == (0, None)
+    assert limiter.admit('A') == (2.0, 'entity_rate')
+    # other entities have their own bucket
+    assert limiter.admit('B') == (0, None)
+    clock.now += 2
+    assert limiter.admit('A') == (0, None)
+
+
+def test_global_rate(clock):
+    limiter = CommandLimiter(rate=10, global_rate=1, global_burst=2)
+    assert limiter.admit('A') == (0, None)
+    assert limiter.admit('B') == (0, None)
+    assert limiter.admit('C') == (1.0, 'global_rate')
+    # a rejected command takes no tokens
+    assert limiter.admit('C') == (1.0, 'global_rate')
+
+
+def test_poll_share(clock):
+    limiter = CommandLimiter(poll_share=0.75, window=60)
+    assert limiter.admit('A') == (0, None)
+    # a quarter of 60s may be used by set sessions
+    limiter.charge(16)
+    wait, reason = limiter.admit('A')
+    assert reason == 'poll_share'
+    assert wait == pytest.approx(4)
+    clock.now += 4
+    assert limiter.admit('A') == (0, None)
+
+
+def test_forget(clock):
+    limiter = CommandLimiter(rate=1, burst=1)
+    limiter.admit('A')
+    limiter.forget('A')
+    assert limiter.admit('A') == (0, None)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Recording of vcontrold sessions and their replay.
+"""
+import gzip
+import json
+
+import pytest
+
+from pyvclient.vcomm.recording import Replay, SessionRecorder, load_recording
+from pyvclient.vcomm.transport import LoopbackTransport
+from pyvclient.vcomm.vcomm import VComm
+
+
+def heater(command):
+    return 'OK' if command.startswith('set') else '12.3 Grad Celsius'
+
+
+def record(path, commands):
+    recorder = SessionRecorder(path)
+    vcomm = VComm(transport_factory=lambda host, port: LoopbackTransport(heater),
+                  close_delay=0, retry_delay=0, recorder=recorder)
+    vcomm.process_commands(commands)
+    assert vcomm.set_command('TempKol', '20')
+    recorder.close()
+
+
+@pytest.mark.parametrize('name', ['vcontrold.jsonl', 'vcontrold.jsonl.gz'])
+def test_record(tmp_path, name):
+    path = str(tmp_path / name)
+    record(path, ['getTempA'])
+    recording = load_recording(path)
+    assert [event['r'] for event in recording[None]] == ['', '']
+    assert recording['getTempA'][0]['r'] == '12.3 Grad Celsius'
+    assert recording['setTempKol 20'][0]['r'] == 'OK'
+
+
+def test_truncated_recording(tmp_path):
+    path = tmp_path / 'vcontrold.jsonl.gz'
+    with gzip.open(path, 'wt') as f:
+        f.write(json.dumps({'c': 'getTempA', 'r': '1', 'd': 0.1}) + '\n')
+    data = path.read_bytes()
+    path.write_bytes(data[:-4])
+    recording = load_recording(str(path))
+    assert recording['getTempA'][0]['r'] == '1'
+
+
+def replay_vcomm(events):
+    recording = {}
+    for event in events:
+        recording.setdefault(event['c'], []).append(event)
+    return VComm(transport_factory=Replay(recording, speed=0), close_delay=0, retry_delay=0)
+
+
+def test_replay_repeats_responses_in_order():
+    vcomm = replay_vcomm([
+        {'c': None, 'r': '', 'd': 0.1},
+        {'c': 'getTempA', 'r': '12.3 Grad Celsius', 'd': 0.1},
+        {'c': 'getTempA', 'r': '12.5 Grad Celsius', 'd': 0.1},
+    ])
+    values = [vcomm.process_command('getTempA')['getTempA'] for _ in range(3)]
+    assert values == [['12.3 Grad Celsius'], ['12.5 Grad Celsius'], ['12.3 Grad Celsius']]
+    assert vcomm.process_command('getTempB') == {'getTempB': ['ERR: command unknown']}
+
+
+def test_replay_connect_failure():
+    replay = Replay({None: [{'c': None, 'e': 'refused', 'd': 0.1}]}, speed=0)
+    with pytest.raises(OSError):
+        replay('localhost', 3002)
+
+
+def test_replay_from_recording(tmp_path):
+    path = str(tmp_path / 'vcontrold.jsonl')
+    record(path, ['getTempA'])
+    vcomm = VComm(transport_factory=Replay(path, speed=0), close_delay=0, retry_delay=0)
+    assert vcomm.process_command('getTempA') == {'getTempA': ['12.3 Grad Celsius']}
+    assert vcomm.set_command('TempKol', '20')
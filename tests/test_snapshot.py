@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot file of the last known items and values.
+"""
+import json
+import time
+
+from pyvclient.utils.snapshot import Snapshot
+
+ITEMS = {'TempA': {'value': '12.3', 'unit': 'Grad Celsius'}}
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    Snapshot(path).save(ITEMS)
+    snapshot = Snapshot(path).load()
+    assert snapshot['items'] == ITEMS
+    assert not (tmp_path / 'snapshot.json.tmp').exists()
+
+
+def test_missing_snapshot(tmp_path):
+    assert Snapshot(str(tmp_path / 'missing.json')).load() is None
+
+
+def test_invalid_snapshots(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    path.write_text('{"items": ')
+    assert Snapshot(str(path)).load() is None
+    path.write_text(json.dumps({'items': ITEMS}))
+    assert Snapshot(str(path)).load() is None
+
+
+def test_old_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    Snapshot(path).save(ITEMS, timestamp=time.time() - 7200)
+    assert Snapshot(path, max_age=3600).load() is None
+    assert Snapshot(path, max_age=86400).load()['items'] == ITEMS
+    assert Snapshot(path).load()['items'] == ITEMS
+
+
+def test_failed_save_keeps_previous_snapshot(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    Snapshot(path).save(ITEMS)
+    Snapshot(path).save({'TempA': {'value': object()}})
+    assert Snapshot(path).load()['items'] == ITEMS
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Soak run of the daemon stack against the in-process stand-ins.
+"""
+import pytest
+from click.testing import CliRunner
+
+from pyvclient.utils.soak import find_growth, soak
+
+
+def samples(**growth):
+    """Twelve samples, the metrics in growth rising by that much per sample."""
+    return [{'time': i, 'rss': 50e6 + i * growth.get('rss', 0),
+             'threads': 5 + i * growth.get('threads', 0), 'fds': 10, 'traced': None}
+            for i in range(12)]
+
+
+def test_flat_resources():
+    assert find_growth(samples()) == {}
+
+
+def test_growth_beyond_tolerance():
+    growth = find_growth(samples(rss=2e6, threads=1))
+    assert sorted(growth) == ['rss', 'threads']
+    assert growth['threads'] == (9, 15)
+
+
+def test_growth_during_warm_up_is_ignored():
+    flat = samples()
+    for sample in flat[:3]:
+        sample['threads'] = 1
+    assert find_growth(flat) == {}
+
+
+def test_too_few_samples():
+    with pytest.raises(ValueError):
+        find_growth(samples()[:7])
+
+
+def test_short_soak():
+    result = CliRunner().invoke(soak, [
+        '--duration', '4', '--sample-interval', '0.25', '--properties', '4',
+        '--interval', '0.05', '--command-rate', '20', '--flap-interval', '1',
+        '--no-trace-memory', '--seed', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'No unbounded resource growth detected' in result.output
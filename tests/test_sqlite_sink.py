@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite persistence of readings and their export.
+"""
+import json
+import sqlite3
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from pyvclient.utils.sqlite_sink import SqliteSink, export
+
+
+def test_bad_path_fails_at_startup(tmp_path):
+    with pytest.raises(sqlite3.Error):
+        SqliteSink(str(tmp_path / 'missing' / 'readings.db'))
+
+
+def test_readings_are_written_in_batches(tmp_path):
+    path = str(tmp_path / 'readings.db')
+    sink = SqliteSink(path, batch_size=2, flush_interval=0.1)
+    listener = sink.listener('heater')
+    listener('TempA', 12.3)
+    listener('BetriebArt', 'H+WW')
+    sink.add('heater', 'TempA', '12.5', timestamp=1000.0)
+    sink.stop()
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute('SELECT device, entity, value FROM readings ORDER BY rowid')
+        assert list(rows) == [('heater', 'TempA', 12.3), ('heater', 'BetriebArt', 'H+WW'),
+                              ('heater', 'TempA', 12.5)]
+
+
+def test_old_readings_are_deleted(tmp_path):
+    path = str(tmp_path / 'readings.db')
+    sink = SqliteSink(path, flush_interval=0.1, retention_days=1)
+    sink.add('heater', 'TempA', 1, timestamp=time.time() - 2 * 86400)
+    sink.add('heater', 'TempA', 2)
+    sink.stop()
+    with sqlite3.connect(path) as connection:
+        assert list(connection.execute('SELECT value FROM readings')) == [(2,)]
+
+
+def test_export(tmp_path):
+    path = str(tmp_path / 'readings.db')
+    sink = SqliteSink(path, flush_interval=0.1, retention_days=0)
+    sink.add('heater', 'TempA', 12.3, timestamp=1000.0)
+    sink.add('heater', 'TempB', 1.0, timestamp=1001.0)
+    sink.stop()
+    result = CliRunner().invoke(export, [path, '--entity', 'TempA', '--format', 'json'])
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line) for line in result.output.splitlines()] == [
+        {'ts': 1000.0, 'device': 'heater', 'entity': 'TempA', 'value': 12.3}]
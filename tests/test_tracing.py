@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Traces of set commands through VComm.
+"""
+import pytest
+
+from pyvclient.utils.tracing import Tracer, set_tracer, trace
+from pyvclient.vcomm.transport import LoopbackTransport
+from pyvclient.vcomm.vcomm import VComm
+
+
+@pytest.fixture
+def traces():
+    traces = []
+    set_tracer(Tracer([traces.append], slow_threshold=0.5, sample_rate=1.0))
+    yield traces
+    set_tracer(None)
+
+
+def test_set_command_spans(traces):
+    vcomm = VComm(transport_factory=lambda host, port: LoopbackTransport(lambda line: 'OK'),
+                  close_delay=0.3, retry_delay=0)
+    with trace('mqtt_command', topic='viessmann/tempkol/set'):
+        assert vcomm.set_command('TempKol', '20')
+    assert [span['name'] for span in traces[0]['spans']] == [
+        'lock_wait', 'connect', 'write', 'read', 'close']
+    assert traces[0]['attributes'] == {'topic': 'viessmann/tempkol/set'}
+
+
+def test_close_delay_is_not_traced(traces):
+    vcomm = VComm(transport_factory=lambda host, port: LoopbackTransport(lambda line: 'OK'),
+                  close_delay=0.6, retry_delay=0)
+    with trace('mqtt_command'):
+        vcomm.set_command('TempKol', '20')
+    # the delay is waited by the next session, not after closing this one
+    assert traces[0]['duration'] < 0.5
+    with trace('mqtt_command'):
+        vcomm.set_command('TempKol', '21')
+    connect = next(span for span in traces[1]['spans'] if span['name'] == 'connect')
+    assert connect['duration'] > 0.5
+
+
+def test_fast_traces_are_sampled():
+    traces = []
+    tracer = Tracer([traces.append], slow_threshold=1.0, sample_rate=0.0)
+    with tracer.trace('mqtt_command'):
+        pass
+    assert traces == []
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Definitions streamed from vcontrold.xml and its includes, and the
+configuration generated from them.
+"""
+import io
+
+import pytest
+
+from pyvclient.utils.utils import fit_intervals, get_definitions, get_precision, get_properties
+
+VCONTROLD_XML = b"""<?xml version="1.0"?>
+<V-control xmlns:xi="http://www.w3.org/2003/XInclude">
+  <unix><config><serial><tty>/dev/ttyUSB0</tty></serial></config></unix>
+  <units>
+    <unit name="Temperatur">
+      <abbrev>UT</abbrev>
+      <calc get="V/10" set="V*10"/>
+      <type>short</type>
+      <entity>Grad Celsius</entity>
+    </unit>
+    <unit name="BetriebsArt">
+      <abbrev>BA</abbrev>
+      <type>enum</type>
+      <enum bytes="00" text="WW"/>
+      <enum bytes="02" text="H+WW"/>
+    </unit>
+  </units>
+  <protocols>
+    <protocol name="KW2">
+      <macros><macro name="GETADDR"><command>SEND 01 F7</command></macro></macros>
+      <commands><command name="getaddr"><send>GETADDR $addr $hexlen;RECV $len $unit</send></command></commands>
+    </protocol>
+  </protocols>
+  <extern xmlns:xi="http://www.w3.org/2003/XInclude">
+    <xi:include href="vito.xml" parse="xml"/>
+  </extern>
+</V-control>
+"""
+
+VITO_XML = b"""<?xml version="1.0"?>
+<vito>
+  <devices>
+    <device ID="2098" name="V200KW2" protocol="KW2"/>
+  </devices>
+  <commands>
+    <command name="getTempA" protocmd="getaddr">
+      <addr>5525</addr>
+      <len>2</len>
+      <unit>UT</unit>
+      <description>Aussentemperatur</description>
+      <device ID="2098"/>
+    </command>
+    <command name="getBetriebArt" protocmd="getaddr">
+      <addr>2323</addr>
+      <len>1</len>
+      <unit>BA</unit>
+    </command>
+    <command name="setBetriebArt" protocmd="setaddr">
+      <addr>2323</addr>
+      <len>1</len>
+      <unit>BA</unit>
+    </command>
+  </commands>
+</vito>
+"""
+
+
+@pytest.fixture
+def definitions(tmp_path):
+    (tmp_path / 'vito.xml').write_bytes(VITO_XML)
+    return get_definitions(io.BytesIO(VCONTROLD_XML), str(tmp_path))
+
+
+def test_units(definitions):
+    units = definitions['units']
+    assert units['UT'] == {'description': 'Temperatur', 'type': 'short',
+                           'entity': 'Grad Celsius', 'calc': 'V/10'}
+    assert units['BA']['enum'] == [{'bytes': '00', 'text': 'WW'},
+                                   {'bytes': '02', 'text': 'H+WW'}]
+
+
+def test_protocols(definitions):
+    protocol = definitions['protocols']['KW2']
+    assert protocol['macros'] == {'GETADDR': 'SEND 01 F7'}
+    assert protocol['commands']['getaddr'] == {'send': 'GETADDR $addr $hexlen;RECV $len $unit'}
+
+
+def test_included_devices_and_commands(definitions):
+    assert definitions['devices'] == {'2098': {'name': 'V200KW2', 'protocol': 'KW2'}}
+    commands = definitions['commands']
+    assert sorted(commands) == ['getBetriebArt', 'getTempA', 'setBetriebArt']
+    assert commands['getTempA']['unit'] == 'UT'
+    assert commands['getTempA']['description'] == 'Aussentemperatur'
+    assert commands['getTempA']['device'] == [{'@ID': '2098'}]
+    # the protocol's own commands are not commands of the heater
+    assert 'getaddr' not in commands
+
+
+def test_properties_within_budget(definitions):
+    properties, load = get_properties(definitions, budget=6, request_cost=0.05,
+                                      byte_cost=0.0025)
+    assert properties == {
+        'TempA': {'readonly': True, 'interval': 60, 'unit': 'UT',
+                  'description': 'Aussentemperatur'},
+        'BetriebArt': {'readonly': False, 'interval': 600, 'unit': 'BA'},
+    }
+    assert load <= 6
+
+
+def test_properties_of_other_device(definitions):
+    properties, _ = get_properties(definitions, 6, 0.05, 0.0025, device_id='20CB')
+    assert list(properties) == ['BetriebArt']
+
+
+def test_intervals_are_stretched_to_fit_budget():
+    intervals, load = fit_intervals({'A': 1.0}, {'A': 60}, budget=0.5)
+    assert intervals == {'A': 120}
+    assert load == 0.5
+
+
+@pytest.mark.parametrize('calc, precision', [('V/10', 1), ('V / 3600', 2), ('V*10', 0), (None, 0)])
+def test_precision(calc, precision):
+    assert get_precision(calc) == precision
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+VComm sessions over in-memory transports.
+"""
+import pytest
+
+from pyvclient.vcomm.transport import LoopbackTransport, Transport
+from pyvclient.vcomm.vcomm import VComm, VCommError
+
+
+def heater(command):
+    """Answers like vcontrold connected to a heater."""
+    if command.startswith('set'):
+        return 'OK'
+    if command == 'getFoo':
+        return 'ERR: command unknown'
+    return '12.3 Grad Celsius'
+
+
+def loopback(handler=heater):
+    return lambda host, port: LoopbackTransport(handler)
+
+
+def test_incomplete_transport_cannot_be_created():
+    class ReadOnly(Transport):
+        def read_until(self, expected, timeout=None):
+            return b''
+
+    with pytest.raises(TypeError):
+        ReadOnly()
+
+
+def test_loopback_session():
+    transport = LoopbackTransport(heater)
+    assert transport.read_until(b'vctrld>') == b'vctrld>'
+    transport.write(b'getTempA\nsetTempKol 20\n')
+    assert transport.read_until(b'vctrld>') == b'12.3 Grad Celsius\nvctrld>'
+    assert transport.read_until(b'vctrld>') == b'OK\nvctrld>'
+    transport.write(b'quit\n')
+    assert transport.is_closed()
+    with pytest.raises(OSError):
+        transport.write(b'getTempA\n')
+
+
+def test_process_commands():
+    vcomm = VComm(transport_factory=loopback(), close_delay=0, retry_delay=0)
+    assert vcomm.process_commands(['getTempA', 'getFoo']) == {
+        'getTempA': ['12.3 Grad Celsius'],
+        'getFoo': ['ERR: command unknown'],
+    }
+    assert vcomm.command_cost('getTempA') is not None
+
+
+def test_process_pipelined():
+    vcomm = VComm(transport_factory=loopback(), close_delay=0, retry_delay=0)
+    result = vcomm.process_pipelined(['getTempA', 'getTempB', 'getFoo'], window=2)
+    assert {cmd: lines for cmd, (lines, seconds) in result.items()} == {
+        'getTempA': ['12.3 Grad Celsius'],
+        'getTempB': ['12.3 Grad Celsius'],
+        'getFoo': ['ERR: command unknown'],
+    }
+
+
+class HungTransport(LoopbackTransport):
+    """vcontrold greeting with its prompt, then never answering."""
+
+    def write(self, data):
+        if self._closed:
+            raise OSError("loopback transport is closed")
+        if data.strip() == b'quit':
+            self.close()
+
+
+def failover_vcomm(primary_factory):
+    def factory(host, port):
+        if host == 'primary':
+            return primary_factory(host, port)
+        return LoopbackTransport(heater)
+
+    vcomm = VComm(endpoints=[('primary', 3002), ('standby', 3002)],
+                  transport_factory=factory, close_delay=0, retry_delay=0)
+    switches = []
+    vcomm.on_endpoint_change = switches.append
+    return vcomm, switches
+
+
+def test_failover_when_primary_refuses():
+    def refuse(host, port):
+        raise ConnectionRefusedError('refused')
+
+    vcomm, switches = failover_vcomm(refuse)
+    assert vcomm.process_commands(['getTempA']) == {'getTempA': ['12.3 Grad Celsius']}
+    assert switches == ['standby:3002']
+    assert vcomm.active_endpoint == 'standby:3002'
+
+
+def test_failover_when_primary_hangs():
+    vcomm, switches = failover_vcomm(lambda host, port: HungTransport(heater))
+    assert vcomm.process_commands(['getTempA']) == {'getTempA': ['12.3 Grad Celsius']}
+    assert switches == ['standby:3002']
+    assert vcomm.endpoints[0].error_rate == 1.0
+
+
+def test_failback_to_recovered_primary():
+    vcomm, switches = failover_vcomm(loopback())
+    vcomm.endpoints[0].record(False)
+    vcomm.process_commands(['getTempA'])
+    assert vcomm.active_endpoint == 'standby:3002'
+    # healthy probes push the error rate of the primary below the limit
+    for _ in range(3):
+        vcomm._probe_endpoints()
+    vcomm.process_commands(['getTempA'])
+    assert switches == ['standby:3002', 'primary:3002']
+
+
+def test_no_endpoint_answers():
+    vcomm = VComm(transport_factory=lambda host, port: HungTransport(heater),
+                  close_delay=0, retry_delay=0)
+    with pytest.raises(VCommError):
+        vcomm.process_commands(['getTempA'])
+    # the lock is released for the next session
+    assert vcomm._lock.acquire(blocking=False)